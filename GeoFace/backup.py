@@ -0,0 +1,66 @@
+import argparse
+import sys
+from modules.backup import (BACKUP_DIR, FULL_EVERY_S, apply_retention, full_backup, incremental_backup,
+                            load_manifest, prune_changelog, restore, run_backup)
+from modules.database import DB_PATH
+
+def print_entry(entry):
+    if entry is None:
+        print("No changes since the last backup")
+        return
+    detail = f", {entry['rows']} rows" if entry["kind"] == "incremental" else ""
+    print(f"Wrote {entry['kind']} backup {entry['name']} ({entry['size'] / 1024:.1f} KiB{detail})")
+
+def main():
+    parser = argparse.ArgumentParser(description="Online backups of the attendance database")
+    parser.add_argument("--db", default=DB_PATH)
+    parser.add_argument("--dir", default=BACKUP_DIR, help="backup directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    run = sub.add_parser("run", help="full or incremental backup as due, then apply retention (for cron)")
+    run.add_argument("--full-every", type=float, default=FULL_EVERY_S / 3600, help="hours between full backups")
+    sub.add_parser("full", help="take a full backup now")
+    sub.add_parser("incremental", help="back up the rows changed since the last backup")
+    sub.add_parser("prune", help="apply the hourly/daily/weekly retention policy")
+    sub.add_parser("list", help="list backups in the manifest")
+    rest = sub.add_parser("restore", help="rebuild and verify a database from the backups")
+    rest.add_argument("dest", help="where to write the restored database")
+    rest.add_argument("--at", help="backup name to restore to (default: the newest)")
+    rest.add_argument("--force", action="store_true", help="overwrite dest if it exists")
+    args = parser.parse_args()
+
+    def progress(done, total):
+        sys.stdout.write(f"\rCopied {done}/{total} pages")
+        sys.stdout.flush()
+
+    try:
+        if args.command == "run":
+            entry = run_backup(args.db, args.dir, args.full_every * 3600, progress=progress)
+            if entry is not None and entry["kind"] == "full":
+                print()
+            print_entry(entry)
+            deleted = apply_retention(args.dir)
+            prune_changelog(args.db, args.dir)
+            if deleted:
+                print(f"Retention removed {len(deleted)} old backups")
+        elif args.command == "full":
+            entry = full_backup(args.db, args.dir, progress=progress)
+            print()
+            print_entry(entry)
+        elif args.command == "incremental":
+            print_entry(incremental_backup(args.db, args.dir))
+        elif args.command == "prune":
+            deleted = apply_retention(args.dir)
+            prune_changelog(args.db, args.dir)
+            print(f"Removed {len(deleted)} old backups")
+        elif args.command == "list":
+            for entry in load_manifest(args.dir):
+                print(f"{entry['name']:<45} {entry['kind']:<12} {entry['size'] / 1024:>9.1f} KiB  seq {entry['seq']}")
+        elif args.command == "restore":
+            message = restore(args.dest, args.dir, args.at, overwrite=args.force)
+            print(f"Restored and verified {args.dest}: {message}")
+    except (ValueError, OSError) as e:
+        print(f"Backup error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
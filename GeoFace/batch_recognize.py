@@ -0,0 +1,46 @@
+import argparse
+from face_utils import load_employee_encodings
+from modules.batch import collect_sources, open_writer, plan_work, run_batch
+from modules.detection import DETECTION_SCALE, MIN_FACE_SIZE, UPSAMPLE
+from modules.face_recognition import recognize_face
+
+def load_gallery(gallery):
+    """Return (encodings, labels) for the registered faces/ or the data/ gallery"""
+    if gallery == "data":
+        labels, encodings = load_employee_encodings()
+        return encodings, labels
+    return recognize_face()
+
+def main():
+    parser = argparse.ArgumentParser(description="Recognize faces in recorded video and image folders")
+    parser.add_argument("sources", nargs="+", help="video files and/or image directories")
+    parser.add_argument("--output", default="events.jsonl",
+                        help="events.jsonl, events.csv, or 'db' for the attendance table")
+    parser.add_argument("--gallery", choices=["faces", "data"], default="faces")
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--chunk-frames", type=int, default=500, help="frames per work unit")
+    parser.add_argument("--every", type=int, default=1, help="process every Nth frame")
+    parser.add_argument("--detection-scale", type=float, default=DETECTION_SCALE)
+    parser.add_argument("--upsample", type=int, default=UPSAMPLE)
+    parser.add_argument("--min-face-size", type=int, default=MIN_FACE_SIZE)
+    args = parser.parse_args()
+
+    encodings, labels = load_gallery(args.gallery)
+    units = plan_work(collect_sources(args.sources), args.chunk_frames, args.every)
+    detection = {
+        "scale": args.detection_scale,
+        "upsample": args.upsample,
+        "min_face_size": args.min_face_size,
+    }
+    
+    writer = open_writer(args.output)
+    try:
+        stats = run_batch(units, encodings, labels, writer, args.tolerance, detection, args.workers)
+    finally:
+        writer.close()
+    print(f"{stats['frames']} frames, {stats['faces']} faces in {stats['seconds']}s: "
+          f"{stats['frames_per_sec']} frames/sec, {stats['faces_per_sec']} faces/sec")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
@@ -0,0 +1,66 @@
+"""
+Recall@1 and latency of the approximate gallery indexes against exact search
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_ann --size 200000 --queries 200
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+
+from modules.ann_index import FlatIndex, load_index, make_index, recall_report
+from benchmarks.bench_matcher import synthetic_gallery
+
+
+def probe_queries(gallery, n_queries, noise=0.02, seed=1):
+    """Noisy re-captures of enrolled faces, as seen at the kiosk"""
+    rng = np.random.default_rng(seed)
+    rows = gallery[rng.integers(0, len(gallery), size=n_queries)]
+    return rows + rng.normal(0.0, noise, size=rows.shape)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--size", type=int, default=200000)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--search-k", type=int, nargs="+", default=[256, 512, 1024, 4096])
+    parser.add_argument("--n-trees", type=int, default=8)
+    args = parser.parse_args()
+
+    gallery = synthetic_gallery(args.size)
+    queries = probe_queries(gallery, args.queries)
+
+    start = time.perf_counter()
+    exact = FlatIndex().build(gallery)
+    print(f"flat    build {time.perf_counter() - start:7.2f}s")
+
+    reports = []
+    for kind, params, sweep_name, sweep in (
+            ("ivf", {}, "nprobe", args.nprobe),
+            ("rptree", {"n_trees": args.n_trees}, "search_k", args.search_k)):
+        start = time.perf_counter()
+        index = make_index(kind, **params).build(gallery)
+        print(f"{kind:<7} build {time.perf_counter() - start:7.2f}s")
+
+        # Round-trip through save/load so the report covers the persisted form
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, f"{kind}.npz")
+            index.save(path)
+            index, _ = load_index(path)
+
+        for value in sweep:
+            reports.append(recall_report(index, queries, exact, **{sweep_name: value}))
+
+    print(f"\n{'index':<7} {'params':<40} {'recall@1':>8} {'ms/query':>9} {'exact ms':>9}")
+    for r in reports:
+        params = ", ".join(f"{k}={v}" for k, v in r["params"].items() if v is not None)
+        print(f"{r['kind']:<7} {params:<40} {r['recall@1']:>8.3f} "
+              f"{r['index_ms_per_query']:>9.3f} {r['exact_ms_per_query']:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""
+Per-frame allocations of the frame conversions, with and without the buffer pool
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_buffers --frames 300 --size 1280x720
+"""
+import argparse
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from modules.buffers import BufferPool, copy_into, resize_into, scale_into, to_gray, to_rgb
+from modules.detection import DETECTION_SCALE
+from modules.motion import GATE_WIDTH
+
+
+def legacy_frame(frame):
+    """The conversions each frame went through before the pool"""
+    rgb = np.ascontiguousarray(frame[:, :, ::-1])  # the copy dlib made of the reversed view
+    small = cv2.resize(rgb, (0, 0), fx=DETECTION_SCALE, fy=DETECTION_SCALE, interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    height, width = gray.shape
+    thumb = cv2.resize(gray, (GATE_WIDTH, int(height * GATE_WIDTH / width)), interpolation=cv2.INTER_AREA)
+    thumb = cv2.GaussianBlur(thumb, (5, 5), 0)
+    display = frame.copy()
+    shown = cv2.resize(cv2.cvtColor(display, cv2.COLOR_BGR2RGB), (640, 480))
+    return small, thumb, shown
+
+
+def pooled_frame(frame, pool):
+    """The same conversions writing into pooled buffers"""
+    rgb = to_rgb(frame, pool)
+    small = scale_into(rgb, DETECTION_SCALE, pool, "detect_small")
+    gray = to_gray(frame, pool, "gate_gray")
+    height, width = gray.shape
+    thumb = resize_into(gray, (GATE_WIDTH, int(height * GATE_WIDTH / width)), pool, "gate_small")
+    thumb = cv2.GaussianBlur(thumb, (5, 5), 0, dst=pool.get("gate_thumb", thumb.shape))
+    display = copy_into(frame, pool, "display")
+    shown = resize_into(display, (640, 480), pool, "shown", cv2.INTER_LINEAR)
+    cv2.cvtColor(shown, cv2.COLOR_BGR2RGB, dst=shown)
+    return small, thumb, shown
+
+
+def run_mode(process, frames):
+    """(peak bytes allocated per frame, ms per frame) with tracemalloc running"""
+    process(frames[0])  # first call sizes the pooled buffers
+    tracemalloc.start()
+    peaks = []
+    start = time.perf_counter()
+    for frame in frames:
+        base = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        process(frame)
+        peaks.append(tracemalloc.get_traced_memory()[1] - base)
+    elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+    return float(np.mean(peaks)), elapsed / len(frames) * 1000
+
+
+def run(frames=200, size=(1280, 720)):
+    """Metrics for benchmarks.run: per-frame allocation and time, legacy vs pooled"""
+    width, height = size
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 255, (height, width, 3), dtype=np.uint8) for _ in range(4)]
+    batch = [images[i % len(images)] for i in range(frames)]
+    pool = BufferPool()
+    legacy_bytes, legacy_ms = run_mode(legacy_frame, batch)
+    pooled_bytes, pooled_ms = run_mode(lambda frame: pooled_frame(frame, pool), batch)
+    return {
+        "legacy_alloc_kb_per_frame": legacy_bytes / 1024,
+        "pooled_alloc_kb_per_frame": pooled_bytes / 1024,
+        "legacy_frame_ms": legacy_ms,
+        "pooled_frame_ms": pooled_ms,
+        "pool_allocations": pool.allocations,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--size", default="1280x720", help="frame size as WIDTHxHEIGHT")
+    parser.add_argument("--fps", type=float, default=30.0, help="frame rate for the MB/s estimate")
+    args = parser.parse_args()
+    size = tuple(int(v) for v in args.size.lower().split("x"))
+
+    results = run(args.frames, size)
+    for mode in ("legacy", "pooled"):
+        kb = results[f"{mode}_alloc_kb_per_frame"]
+        print(f"{mode:<7} {kb:10.1f} KB allocated per frame ({kb * args.fps / 1024:7.1f} MB/s at {args.fps:g} fps), "
+              f"{results[f'{mode}_frame_ms']:.2f} ms per frame")
+    print(f"pool: {results['pool_allocations']} buffers allocated over {args.frames} frames")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""
+Concurrent readers and writers against the attendance database
+
+Compares the original connect-per-call / rollback-journal access pattern
+with the persistent WAL connections in modules.database.
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_db_concurrency --writers 2 --readers 2 --seconds 5
+"""
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+from benchmarks.run import scratch_dir
+from modules import database
+
+RECORD = ("E0001", 22.42, 87.32, "Bench site", "faces/bench.jpg")
+LEGACY_INSERT_SQL = ("INSERT INTO attendance (employee_name, latitude, longitude, location_name, image_path) "
+                     "VALUES (?, ?, ?, ?, ?)")
+READ_SQL = "SELECT * FROM attendance ORDER BY id DESC LIMIT 100"
+
+
+def legacy_insert(record):
+    """The original add_attendance_record: new connection, one commit per row"""
+    conn = sqlite3.connect(database.DB_PATH)
+    conn.execute(LEGACY_INSERT_SQL, record)
+    conn.commit()
+    conn.close()
+
+
+def legacy_read():
+    conn = sqlite3.connect(database.DB_PATH)
+    rows = conn.execute(READ_SQL).fetchall()
+    conn.close()
+    return rows
+
+
+def pooled_insert(record):
+    database.add_attendance_record(*record)
+
+
+def pooled_read():
+    return database.get_connection().execute(READ_SQL).fetchall()
+
+
+def bulk_insert(record, batch=50):
+    database.add_attendance_records_bulk([record] * batch)
+    return batch
+
+
+def run_mix(insert, read, writers, readers, seconds):
+    """Run writer and reader threads for `seconds`; return per-role op rates and errors"""
+    stop = threading.Event()
+    counts = {"writes": 0, "reads": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def worker(role):
+        done = errors = 0
+        try:
+            while not stop.is_set():
+                try:
+                    if role == "writes":
+                        done += insert(RECORD) or 1
+                    else:
+                        read()
+                        done += 1
+                except sqlite3.OperationalError:
+                    # "database is locked" under the rollback journal
+                    errors += 1
+        finally:
+            database.close_connections()
+            with lock:
+                counts[role] += done
+                counts["errors"] += errors
+
+    threads = [threading.Thread(target=worker, args=("writes",)) for _ in range(writers)]
+    threads += [threading.Thread(target=worker, args=("reads",)) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    return {
+        "writes_per_sec": counts["writes"] / seconds,
+        "reads_per_sec": counts["reads"] / seconds,
+        "errors": counts["errors"],
+    }
+
+
+def run_mode(mode, writers, readers, seconds):
+    """Run one access pattern in a fresh scratch database"""
+    with scratch_dir():
+        if mode == "legacy":
+            # The original schema setup, without WAL
+            os.makedirs("database", exist_ok=True)
+            conn = sqlite3.connect(database.DB_PATH)
+            conn.execute("CREATE TABLE attendance (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                         "employee_name TEXT NOT NULL, latitude REAL, longitude REAL, "
+                         "location_name TEXT, timestamp DATETIME DEFAULT CURRENT_TIMESTAMP, "
+                         "image_path TEXT)")
+            conn.commit()
+            conn.close()
+            return run_mix(legacy_insert, legacy_read, writers, readers, seconds)
+        database.init_db()
+        try:
+            if mode == "bulk":
+                return run_mix(bulk_insert, pooled_read, writers, readers, seconds)
+            return run_mix(pooled_insert, pooled_read, writers, readers, seconds)
+        finally:
+            database.close_connections()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--readers", type=int, default=2)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--modes", nargs="+", default=["legacy", "pooled", "bulk"],
+                        help="legacy, pooled and/or bulk")
+    args = parser.parse_args()
+
+    print(f"{args.writers} writer(s), {args.readers} reader(s), {args.seconds:.0f}s per mode")
+    print(f"{'mode':>8} {'writes/s':>10} {'reads/s':>10} {'errors':>7}")
+    for mode in args.modes:
+        result = run_mode(mode, args.writers, args.readers, args.seconds)
+        print(f"{mode:>8} {result['writes_per_sec']:>10.0f} {result['reads_per_sec']:>10.0f} "
+              f"{result['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+"""
+Compare the legacy two-detection enrollment path with the single-pass one
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_enrollment --data-dir data
+"""
+import argparse
+import time
+
+import numpy as np
+import face_recognition
+
+from face_utils import align_face, encode_face_single_pass, list_employee_images, read_image
+
+
+def legacy_encode(image):
+    """The original path: landmarks on the full image, full warp, re-detect"""
+    face_encs = face_recognition.face_encodings(align_face(image))
+    return face_encs[0] if face_encs else None
+
+
+def single_pass_encode(image):
+    return encode_face_single_pass(image)[0]
+
+
+def leave_one_out_accuracy(labels, encodings):
+    """Rank-1 accuracy of each image against all other enrolled images"""
+    encodings = np.asarray(encodings)
+    correct = 0
+    for i in range(len(encodings)):
+        dist = np.linalg.norm(encodings - encodings[i], axis=1)
+        dist[i] = np.inf
+        correct += labels[int(np.argmin(dist))] == labels[i]
+    return correct / len(encodings) if len(encodings) else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--data-dir", default="data")
+    args = parser.parse_args()
+
+    images = [(emp_id, read_image(path))
+              for emp_id, paths in list_employee_images(args.data_dir).items() for path in paths]
+
+    per_image = {}
+    for name, encode in (("legacy", legacy_encode), ("single-pass", single_pass_encode)):
+        start = time.perf_counter()
+        encoded = [encode(image) for _, image in images]
+        elapsed = time.perf_counter() - start
+        per_image[name] = encoded
+        labels = [emp_id for (emp_id, _), enc in zip(images, encoded) if enc is not None]
+        encodings = [enc for enc in encoded if enc is not None]
+        print(f"{name:<12} {elapsed * 1000 / max(len(images), 1):8.1f} ms/image  "
+              f"{len(encodings)}/{len(images)} encoded  "
+              f"leave-one-out rank-1 {leave_one_out_accuracy(labels, encodings):.3f}")
+
+    diffs = [np.linalg.norm(a - b) for a, b in zip(per_image["legacy"], per_image["single-pass"])
+             if a is not None and b is not None]
+    if diffs:
+        print(f"encoding drift between paths: mean {np.mean(diffs):.4f}, max {np.max(diffs):.4f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Memory and per-frame latency of mean vs multi-template galleries
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_gallery_modes --identities 10000 --images 5
+"""
+import argparse
+
+import numpy as np
+
+from face_utils import select_templates
+from modules.ann_index import ENCODING_SIZE
+from modules.matcher import GalleryMatcher
+from benchmarks.bench_matcher import time_call
+
+
+def synthetic_enrollment(n_identities, n_images, seed=0):
+    """Per-identity image encodings spread over two pose/lighting modes"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(0.0, 0.09, size=(n_identities, 1, ENCODING_SIZE))
+    modes = centers + rng.normal(0.0, 0.03, size=(n_identities, 2, ENCODING_SIZE))
+    pick = rng.integers(0, 2, size=(n_identities, n_images))
+    images = np.take_along_axis(modes, pick[:, :, None], axis=1)
+    images = images + rng.normal(0.0, 0.015, size=images.shape)
+    return modes, images
+
+
+def build_gallery(images, mode, max_templates):
+    """Mirror face_utils.load_employee_encodings for in-memory encodings"""
+    encodings, labels = [], []
+    for emp_id, emp_encodings in enumerate(images):
+        if mode == "mean":
+            templates = [emp_encodings.mean(axis=0)]
+        else:
+            templates = select_templates(emp_encodings, max_templates)
+        encodings.extend(templates)
+        labels.extend([emp_id] * len(templates))
+    return encodings, labels
+
+
+def matcher_bytes(matcher):
+    """Approximate resident size of the gallery structures"""
+    size = matcher.encodings.nbytes + matcher.index.norms.nbytes + matcher.codes.nbytes
+    if matcher.multi_template:
+        size += matcher.templates.nbytes + matcher.template_mask.nbytes
+    return size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--identities", type=int, default=10000)
+    parser.add_argument("--images", type=int, default=5)
+    parser.add_argument("--max-templates", type=int, default=3)
+    parser.add_argument("--faces", type=int, default=4, help="faces per frame")
+    parser.add_argument("--probes", type=int, default=400)
+    parser.add_argument("--tolerance", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    modes, images = synthetic_enrollment(args.identities, args.images)
+    rng = np.random.default_rng(1)
+    truth = rng.integers(0, args.identities, size=args.probes)
+    # Probes come from either mode, as a person would look on a given day
+    probes = modes[truth, rng.integers(0, 2, size=args.probes)]
+    probes = probes + rng.normal(0.0, 0.015, size=probes.shape)
+
+    configs = [("mean", "min"), ("multi", "min"), ("multi", "topk")]
+    print(f"{'mode':<6} {'aggregate':<9} {'templates':>9} {'MB':>7} {'frame ms':>9} "
+          f"{'rank-1':>7} {'accepted':>8}")
+    for mode, aggregate in configs:
+        encodings, labels = build_gallery(images, mode, args.max_templates)
+        matcher = GalleryMatcher(encodings, labels, args.tolerance, aggregate=aggregate)
+        frame = list(probes[:args.faces])
+        frame_ms = time_call(lambda: matcher.match(frame), args.repeat)
+
+        matches = matcher.match(list(probes))
+        nearest = np.array([matcher.labels[m.index] for m in matches])
+        accepted = np.array([m.label is not None for m in matches])
+        print(f"{mode:<6} {aggregate:<9} {len(labels):>9} {matcher_bytes(matcher) / 1e6:>7.2f} "
+              f"{frame_ms:>9.2f} {np.mean(nearest == truth):>7.3f} {accepted.mean():>8.3f}")
+
+
+if __name__ == "__main__":
+    main()
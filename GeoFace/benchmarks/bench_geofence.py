@@ -0,0 +1,83 @@
+"""
+Geofence lookup latency for many sites, checked against a brute-force scan
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_geofence --sites 100 1000 10000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.geofence import GridIndex, Site, haversine_m, point_in_polygon
+
+
+def synthetic_sites(n, seed=0):
+    """Circles of 30-300 m plus a few square polygons scattered over India"""
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(8.0, 30.0, n)
+    lons = rng.uniform(70.0, 90.0, n)
+    sites = []
+    for i, (lat, lon) in enumerate(zip(lats, lons)):
+        if i % 10 == 0:
+            d = 0.002
+            polygon = np.array([[lat - d, lon - d], [lat - d, lon + d], [lat + d, lon + d], [lat + d, lon - d]])
+            sites.append(Site(f"S{i:05d}", "", lat, lon, None, polygon))
+        else:
+            sites.append(Site(f"S{i:05d}", "", lat, lon, float(rng.uniform(30, 300)), None))
+    return sites
+
+
+def synthetic_points(sites, n, seed=1):
+    """Half the points near a site (mostly inside), half anywhere"""
+    rng = np.random.default_rng(seed)
+    near = [sites[i] for i in rng.integers(0, len(sites), n // 2)]
+    points = [(s.lat + rng.normal(0, 0.001), s.lon + rng.normal(0, 0.001)) for s in near]
+    points += list(zip(rng.uniform(8.0, 30.0, n - len(points)), rng.uniform(70.0, 90.0, n - len(points))))
+    return points
+
+
+def brute_force(sites, lat, lon):
+    lats = np.array([s.lat for s in sites])
+    lons = np.array([s.lon for s in sites])
+    distances = haversine_m(lat, lon, lats, lons)
+    hits = set()
+    for site, distance in zip(sites, distances):
+        if site.polygon is None:
+            if distance <= site.radius_m:
+                hits.add(site.id)
+        elif point_in_polygon(lat, lon, site.polygon):
+            hits.add(site.id)
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sites", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--points", type=int, default=2000)
+    parser.add_argument("--check", type=int, default=200, help="points verified against brute force")
+    args = parser.parse_args()
+
+    print(f"{'sites':>7} {'build ms':>9} {'us/lookup':>10} {'brute us':>9} {'hits':>6} {'same':>5}")
+    for n in args.sites:
+        sites = synthetic_sites(n)
+        points = synthetic_points(sites, args.points)
+        start = time.perf_counter()
+        index = GridIndex(sites)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        hits = sum(1 for lat, lon in points if index.query(lat, lon))
+        lookup_us = (time.perf_counter() - start) / len(points) * 1e6
+
+        checked = points[:args.check]
+        start = time.perf_counter()
+        expected = [brute_force(sites, lat, lon) for lat, lon in checked]
+        brute_us = (time.perf_counter() - start) / len(checked) * 1e6
+        same = all({s.id for s, _ in index.query(lat, lon)} == want
+                   for (lat, lon), want in zip(checked, expected))
+        print(f"{n:>7} {build_ms:>9.1f} {lookup_us:>10.1f} {brute_us:>9.0f} {hits:>6} {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare GalleryMatcher against the per-face compare_faces loop
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_matcher --sizes 1000 10000 100000
+"""
+import argparse
+import time
+
+import numpy as np
+
+from modules.matcher import ENCODING_SIZE, GalleryMatcher
+
+
+def synthetic_gallery(size, seed=0):
+    """Random encodings with roughly the scale of dlib face encodings"""
+    rng = np.random.default_rng(seed)
+    return rng.normal(0.0, 0.09, size=(size, ENCODING_SIZE))
+
+
+def synthetic_queries(gallery, n_faces, seed=1):
+    """Half noisy copies of gallery rows, half unknown faces"""
+    rng = np.random.default_rng(seed)
+    known = gallery[rng.integers(0, len(gallery), size=(n_faces + 1) // 2)]
+    known = known + rng.normal(0.0, 0.02, size=known.shape)
+    unknown = rng.normal(0.0, 0.09, size=(n_faces // 2, ENCODING_SIZE))
+    return list(np.vstack([known, unknown]))
+
+
+def compare_faces_loop(known_faces, known_names, face_encodings, tolerance):
+    """The original main.py matching loop"""
+    import face_recognition
+
+    names = []
+    for face_encoding in face_encodings:
+        matches = face_recognition.compare_faces(known_faces, face_encoding, tolerance=tolerance)
+        names.append(known_names[matches.index(True)] if True in matches else None)
+    return names
+
+
+def time_call(fn, repeat):
+    """Return the best wall time of fn over repeat runs, in milliseconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def check_semantics(known_faces, known_names, face_encodings, matcher, tolerance):
+    """Matcher must accept exactly the faces compare_faces accepts"""
+    import face_recognition
+
+    for face_encoding, match in zip(face_encodings, matcher.match(face_encodings, tolerance)):
+        matches = face_recognition.compare_faces(known_faces, face_encoding, tolerance=tolerance)
+        if (True in matches) != (match.label is not None):
+            return False
+        if match.label is not None and not matches[match.index]:
+            return False
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--faces", type=int, default=4, help="faces per frame")
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--tolerance", type=float, default=0.6)
+    args = parser.parse_args()
+
+    print(f"{'gallery':>8} {'loop ms':>10} {'matcher ms':>11} {'speedup':>8} {'same':>5}")
+    for size in args.sizes:
+        gallery = synthetic_gallery(size)
+        known_faces = list(gallery)
+        known_names = [f"E{i:06d}" for i in range(size)]
+        face_encodings = synthetic_queries(gallery, args.faces)
+        matcher = GalleryMatcher(known_faces, known_names, tolerance=args.tolerance)
+
+        loop_ms = time_call(
+            lambda: compare_faces_loop(known_faces, known_names, face_encodings, args.tolerance),
+            args.repeat)
+        matcher_ms = time_call(lambda: matcher.match(face_encodings), args.repeat)
+        same = check_semantics(known_faces, known_names, face_encodings, matcher, args.tolerance)
+        print(f"{size:>8} {loop_ms:>10.2f} {matcher_ms:>11.2f} {loop_ms / matcher_ms:>7.1f}x {str(same):>5}")
+
+
+if __name__ == "__main__":
+    main()
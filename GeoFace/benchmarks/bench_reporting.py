@@ -0,0 +1,79 @@
+"""
+Year-long hours reports over live and archived attendance
+
+Fills a scratch database with a year of check-ins and check-outs, archives
+the closed months and times the report queries.
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_reporting --employees 2000
+"""
+import argparse
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+from benchmarks.run import scratch_dir
+from modules import database
+from modules.reporting import archive_closed_months, daily_report, monthly_report
+
+YEAR = 2025
+
+
+def fill_year(employees, seed=0):
+    """Insert a check-in and a check-out per employee per working day"""
+    rng = np.random.default_rng(seed)
+    conn = database.get_connection()
+    day = date(YEAR, 1, 1)
+    rows = 0
+    while day.year == YEAR:
+        if day.weekday() < 5:
+            arrive = rng.integers(8 * 60, 10 * 60, employees)
+            stay = rng.integers(7 * 60, 10 * 60, employees)
+            batch = []
+            for emp in range(employees):
+                start = datetime.combine(day, datetime.min.time()) + timedelta(minutes=int(arrive[emp]))
+                end = start + timedelta(minutes=int(stay[emp]))
+                for event, when in (("check_in", start), ("check_out", end)):
+                    batch.append((f"E{emp:05d}", when.strftime("%Y-%m-%d %H:%M:%S"), event, day.isoformat(), "S1"))
+            with conn:
+                conn.executemany(
+                    "INSERT INTO attendance (employee_name, timestamp, event_type, day, site_id) "
+                    "VALUES (?, ?, ?, ?, ?)", batch)
+            rows += len(batch)
+        day += timedelta(days=1)
+    return rows
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--employees", type=int, default=500)
+    args = parser.parse_args()
+
+    with scratch_dir():
+        database.init_db()
+        fill_ms, rows = timed(lambda: fill_year(args.employees))
+        print(f"inserted {rows} rows with summary triggers in {fill_ms / 1000:.1f}s "
+              f"({rows / fill_ms * 1000:.0f} rows/s)")
+        archive_ms, archived = timed(lambda: archive_closed_months(now=datetime(YEAR + 1, 1, 15)))
+        print(f"archived {len(archived)} months ({sum(archived.values())} rows) in {archive_ms / 1000:.1f}s")
+
+        employee = "E00042"
+        for label, fn in [
+            ("monthly, all employees", lambda: monthly_report(f"{YEAR}-01", f"{YEAR}-12")),
+            ("monthly, one employee", lambda: monthly_report(f"{YEAR}-01", f"{YEAR}-12", employee)),
+            ("daily, one employee", lambda: daily_report(f"{YEAR}-01-01", f"{YEAR}-12-31", employee)),
+            ("daily, all employees", lambda: daily_report(f"{YEAR}-01-01", f"{YEAR}-12-31")),
+        ]:
+            ms, result = timed(fn)
+            print(f"{label:<24} {ms:>9.1f} ms  {len(result):>8} rows")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Import-time profile and model warmup cost for kiosk startup
+
+Run from the GeoFace directory:
+    python -m benchmarks.bench_startup                 # profile the default modules
+    python -m benchmarks.bench_startup cv2 ui.gui --top 20
+"""
+import argparse
+import os
+import time
+
+from modules.startup import PROFILE_MODULES, profile_imports
+
+
+def time_warmup():
+    """(import face_recognition ms, warmup ms, first detect after warmup ms)"""
+    import numpy as np
+
+    start = time.perf_counter()
+    import face_recognition  # noqa: F401
+    imported = time.perf_counter()
+    from modules.detection import locate_faces
+    from modules.startup import warm_up
+
+    warm_up()
+    warmed = time.perf_counter()
+    locate_faces(np.zeros((480, 640, 3), dtype=np.uint8))
+    done = time.perf_counter()
+    return (imported - start) * 1000, (warmed - imported) * 1000, (done - warmed) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("modules", nargs="*", default=list(PROFILE_MODULES))
+    parser.add_argument("--top", type=int, default=10, help="heaviest nested imports shown per module")
+    parser.add_argument("--no-warmup", action="store_true", help="skip timing the model warmup")
+    args = parser.parse_args()
+
+    profile = profile_imports(args.modules, cwd=os.getcwd())
+    for module, (total, entries) in profile.items():
+        if total is None:
+            print(f"{module:<24} import failed")
+            continue
+        print(f"{module:<24} {total:9.1f} ms")
+        for cumulative, own, name in entries[1:args.top + 1]:
+            print(f"    {name:<36} {cumulative:9.1f} ms cumulative {own:9.1f} ms self")
+
+    if not args.no_warmup:
+        try:
+            imported, warmup, first = time_warmup()
+        except ImportError as e:
+            print(f"warmup skipped: {str(e)}")
+            return
+        print(f"import face_recognition {imported:.1f} ms, warmup {warmup:.1f} ms, "
+              f"first detection after warmup {first:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,330 @@
+"""
+Benchmark suite for the recognition and attendance hot paths
+
+Run from the GeoFace directory:
+    python -m benchmarks.run                       # run everything, compare to baseline
+    python -m benchmarks.run matching db_insert    # run selected benchmarks
+    python -m benchmarks.run --save-baseline       # record the current numbers
+
+Metrics ending in _ms are lower-is-better, metrics ending in _per_sec are
+higher-is-better. A metric that is worse than the baseline by more than
+--threshold is reported as a regression and the exit status is 1.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+RESOLUTIONS = [(320, 240), (640, 480), (1280, 720)]
+
+
+def measure(fn, repeat=5, warmup=1):
+    """Median wall time of fn in milliseconds"""
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times) * 1000
+
+
+@contextlib.contextmanager
+def scratch_dir():
+    """Run inside a temporary working directory (database.py uses relative paths)"""
+    old = os.getcwd()
+    tmp = tempfile.mkdtemp(prefix="geoface-bench-")
+    os.chdir(tmp)
+    try:
+        yield tmp
+    finally:
+        from modules.database import close_connections
+
+        close_connections()
+        os.chdir(old)
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def sample_images(data_dir="data"):
+    from face_utils import list_employee_images
+
+    return [p for paths in list_employee_images(data_dir).values() for p in paths]
+
+
+def bench_gallery_load(args):
+    """Cold and warm load_employee_encodings over galleries of N employees"""
+    from face_utils import load_employee_encodings
+
+    images = sample_images(args.data_dir)
+    results = {}
+    for size in args.gallery_sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_dir = os.path.join(tmp, "data")
+            # Replicate the bundled photos into `size` synthetic employees
+            for emp in range(size):
+                emp_dir = os.path.join(data_dir, f"B{emp:05d}")
+                os.makedirs(emp_dir)
+                for i in range(5):
+                    src = images[(emp * 5 + i) % len(images)]
+                    shutil.copy2(src, os.path.join(emp_dir, f"B{emp:05d}_{i}.jpg"))
+            cache_path = os.path.join(tmp, "cache.npz")
+            with contextlib.redirect_stdout(None):
+                cold = measure(lambda: load_employee_encodings(data_dir, cache_path, rebuild=True),
+                               repeat=1, warmup=0)
+                warm = measure(lambda: load_employee_encodings(data_dir, cache_path), repeat=3)
+        results[f"gallery_{size}_cold_ms"] = cold
+        results[f"gallery_{size}_warm_ms"] = warm
+    return results
+
+
+def bench_detection(args):
+    """Detection and encoding latency per frame resolution"""
+    import cv2
+    from face_utils import read_image
+    from modules.detection import encode_faces, locate_faces
+
+    image = read_image(sample_images(args.data_dir)[0])
+    results = {}
+    for width, height in RESOLUTIONS:
+        frame = cv2.resize(image, (width, height), interpolation=cv2.INTER_AREA)
+        locations = locate_faces(frame)
+        results[f"detect_{width}x{height}_ms"] = measure(lambda: locate_faces(frame), args.repeat)
+        if locations:
+            results[f"encode_{width}x{height}_ms"] = measure(
+                lambda: encode_faces(frame, locations[:1]), args.repeat)
+    return results
+
+
+def bench_matching(args):
+    """GalleryMatcher latency for a 4-face frame against synthetic galleries"""
+    from modules.matcher import GalleryMatcher
+
+    rng = np.random.default_rng(0)
+    results = {}
+    for size in args.match_sizes:
+        gallery = rng.normal(0.0, 0.09, size=(size, 128)).astype(np.float32)
+        matcher = GalleryMatcher(gallery, range(size))
+        del gallery
+        faces = list(matcher.encodings[:4] + 0.01)
+        results[f"match_{size}_ms"] = measure(lambda: matcher.match(faces), args.repeat)
+    return results
+
+
+def _fill_attendance(rows):
+    """Insert synthetic attendance rows straight into the scratch database"""
+    conn = sqlite3.connect("database/attendance.db")
+    batch = [(f"E{i % 2000:04d}", 22.42, 87.32, "Bench site", f"faces/e{i % 2000}.jpg")
+             for i in range(min(rows, 100000))]
+    remaining = rows
+    while remaining > 0:
+        chunk = batch[:remaining]
+        conn.executemany(
+            "INSERT INTO attendance (employee_name, latitude, longitude, location_name, image_path) "
+            "VALUES (?, ?, ?, ?, ?)", chunk)
+        remaining -= len(chunk)
+    conn.commit()
+    conn.close()
+
+
+def bench_db_insert(args):
+    """add_attendance_record and add_attendance_records_bulk throughput"""
+    from modules.database import add_attendance_record, add_attendance_records_bulk, init_db
+
+    rows = [(f"E{i:04d}", 22.42, 87.32, "Bench site", "faces/bench.jpg") for i in range(args.insert_rows)]
+    with scratch_dir():
+        init_db()
+        start = time.perf_counter()
+        for row in rows:
+            add_attendance_record(*row)
+        single = time.perf_counter() - start
+        start = time.perf_counter()
+        add_attendance_records_bulk(rows)
+        bulk = time.perf_counter() - start
+    return {"insert_rows_per_sec": args.insert_rows / single,
+            "bulk_insert_rows_per_sec": args.insert_rows / bulk}
+
+
+def bench_db_concurrency(args):
+    """Writes and reads per second with 2 writer and 2 reader threads"""
+    from benchmarks.bench_db_concurrency import run_mode
+
+    results = {}
+    for mode in ("pooled", "bulk"):
+        rates = run_mode(mode, writers=2, readers=2, seconds=2.0)
+        results[f"{mode}_writes_per_sec"] = rates["writes_per_sec"]
+        results[f"{mode}_reads_per_sec"] = rates["reads_per_sec"]
+    return results
+
+
+def bench_db_read(args):
+    """Full-table, latest-page and log refresh read times at growing table sizes"""
+    from modules.database import get_all_records, init_db, query_records
+
+    results = {}
+    with scratch_dir():
+        init_db()
+        filled = 0
+        for rows in sorted(args.read_rows):
+            _fill_attendance(rows - filled)
+            filled = rows
+            results[f"get_all_records_{rows}_ms"] = measure(get_all_records, repeat=3)
+            results[f"latest_page_{rows}_ms"] = measure(query_records, args.repeat)
+            results[f"employee_page_{rows}_ms"] = measure(
+                lambda: query_records(employee="E0042"), args.repeat)
+            refresh_ms = _time_log_refresh(query_records)
+            if refresh_ms is not None:
+                results[f"refresh_log_{rows}_ms"] = refresh_ms
+    return results
+
+
+def _time_log_refresh(fetch):
+    """Time the GUI log refresh (clear + fill a Treeview); None without a display"""
+    try:
+        import tkinter as tk
+        from tkinter import ttk
+
+        root = tk.Tk()
+    except Exception:
+        return None
+    try:
+        root.withdraw()
+        table = ttk.Treeview(root, columns=("id", "name", "time", "location"), show="headings")
+
+        def refresh():
+            for item in table.get_children():
+                table.delete(item)
+            for record in fetch():
+                table.insert("", "end", values=record)
+            root.update_idletasks()
+
+        return measure(refresh, repeat=1, warmup=1)
+    finally:
+        root.destroy()
+
+
+def bench_buffers(args):
+    """Bytes allocated per 720p frame by the frame conversions, legacy vs pooled buffers"""
+    from benchmarks.bench_buffers import run
+
+    return run(frames=100)
+
+
+def bench_startup(args):
+    """Import time of the heavy modules and the entry points, each in a fresh interpreter"""
+    from modules.startup import PROFILE_MODULES, profile_imports
+
+    results = {}
+    for module, (total, _) in profile_imports(PROFILE_MODULES, cwd=os.getcwd()).items():
+        if total is not None:
+            results[f"import_{module.replace('.', '_')}_ms"] = total
+    return results
+
+
+BENCHMARKS = {
+    "gallery_load": bench_gallery_load,
+    "detection": bench_detection,
+    "matching": bench_matching,
+    "db_insert": bench_db_insert,
+    "db_concurrency": bench_db_concurrency,
+    "db_read": bench_db_read,
+    "startup": bench_startup,
+    "buffers": bench_buffers,
+}
+
+
+def compare(results, baseline, threshold):
+    """Return (name, metric, baseline, current, change) for every regression"""
+    regressions = []
+    for name, metrics in results.items():
+        for metric, value in metrics.items():
+            old = baseline.get(name, {}).get(metric)
+            if not old:
+                continue
+            if metric.endswith("_per_sec"):
+                change = (old - value) / old
+            else:
+                change = (value - old) / old
+            if change > threshold:
+                regressions.append((name, metric, old, value, change))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("names", nargs="*", help=f"benchmarks to run: {', '.join(sorted(BENCHMARKS))} "
+                                                 "(default: all)")
+    parser.add_argument("--data-dir", default=os.path.abspath("data"))
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed slowdown (0.2 = 20%%)")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--gallery-sizes", type=int, nargs="+", default=[5, 20])
+    parser.add_argument("--match-sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--insert-rows", type=int, default=2000)
+    parser.add_argument("--read-rows", type=int, nargs="+", default=[10000, 100000, 1000000])
+    parser.add_argument("--large", action="store_true",
+                        help="add the 1M-encoding gallery and 10M-row table")
+    parser.add_argument("--output", help="also write this run's results to a JSON file")
+    args = parser.parse_args()
+    unknown = set(args.names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(sorted(unknown))}")
+    if args.large:
+        args.match_sizes = sorted(set(args.match_sizes) | {1000000})
+        args.read_rows = sorted(set(args.read_rows) | {10000000})
+
+    results = {}
+    for name in args.names or sorted(BENCHMARKS):
+        print(f"== {name}")
+        try:
+            results[name] = BENCHMARKS[name](args)
+        except Exception as e:
+            print(f"   failed: {str(e)}")
+            continue
+        for metric, value in results[name].items():
+            print(f"   {metric:<32} {value:12.3f}")
+
+    run = {"machine": platform.node(), "python": platform.python_version(),
+           "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "results": results}
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(run, f, indent=2)
+
+    if args.save_baseline:
+        baseline = {}
+        if os.path.isfile(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f).get("results", {})
+        baseline.update(results)
+        run["results"] = baseline
+        with open(args.baseline, "w") as f:
+            json.dump(run, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return 0
+
+    if not os.path.isfile(args.baseline):
+        print("No baseline yet; run with --save-baseline to record one")
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    regressions = compare(results, baseline.get("results", {}), args.threshold)
+    for name, metric, old, new, change in regressions:
+        print(f"REGRESSION {name}.{metric}: {old:.3f} -> {new:.3f} ({change:+.0%})")
+    if not regressions:
+        print(f"No regressions against {args.baseline} ({baseline.get('machine')}, {baseline.get('timestamp')})")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,27 @@
+import argparse
+import sys
+from modules.enrollment import bulk_enroll
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-enroll the data/<emp_id>/ photo gallery")
+    parser.add_argument("--data-dir", default="data")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--chunk-size", type=int, default=16, help="images per work item")
+    parser.add_argument("--rebuild", action="store_true", help="ignore the encoding cache and start over")
+    parser.add_argument("--errors", default="enroll_errors.jsonl", help="where to write failed images")
+    args = parser.parse_args()
+
+    def progress(done, total):
+        sys.stdout.write(f"\rEncoded {done}/{total} images")
+        sys.stdout.flush()
+
+    report = bulk_enroll(args.data_dir, args.workers, args.chunk_size, rebuild=args.rebuild,
+                         progress=progress)
+    print()
+    print(report.summary())
+    if report.errors:
+        report.write_errors(args.errors)
+        print(f"{len(report.errors)} images failed, see {args.errors}")
+
+if __name__ == "__main__":
+    main()
\ No newline at end of file
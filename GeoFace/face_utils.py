@@ -1,62 +1,87 @@
 import os
+import json
 import cv2
 import numpy as np
-import face_recognition
 from PIL import Image
+from modules.encoding_cache import CACHE_DIR, EncodingCache
+from modules.face_recognition import _face_recognition_version
+from modules.ann_index import gallery_digest, load_index, make_index
+from modules.buffers import to_rgb
+from modules.detection import detect_and_encode, face_crop
+from modules.matcher import GalleryMatcher
+from modules.metrics import metrics
 
-def validate_image(img_path):
-    """Validate and convert image to proper format for face recognition"""
+# Cache of per-image encodings for the data/<emp_id>/ gallery.
+ENCODING_CACHE_PATH = os.path.join(CACHE_DIR, "employee_encodings.npz")
+# Identifies the pipeline that produced cached encodings; change it whenever
+# the enrollment encoder (encode_face_single_pass) changes so the cache is rebuilt.
+ENCODING_MODEL_TAG = f"align-v2:face_recognition-{_face_recognition_version()}"
+# Enrollment photos with several faces: 'largest' keeps the biggest, 'reject' skips the photo
+ENROLL_MULTIPLE_FACES = 'largest'
+# Context kept around the face when rotating the enrollment crop
+ENROLL_CROP_MARGIN = 0.5
+
+def read_image(img_path):
+    """Load an image as an RGB uint8 array, raising ValueError if unreadable"""
+    # First check if file exists and is readable
+    if not os.path.isfile(img_path):
+        raise ValueError(f"File not found: {img_path}")
+    errors = []
+        
+    # Try with PIL first
     try:
-        # First check if file exists and is readable
-        if not os.path.isfile(img_path):
-            print(f"File not found: {img_path}")
-            return None
-            
-        # Try with PIL first
-        try:
-            pil_img = Image.open(img_path)
-            if pil_img.mode != 'RGB':
-                pil_img = pil_img.convert('RGB')
-            img_array = np.array(pil_img)
-            
-            if img_array.dtype != 'uint8':
-                img_array = img_array.astype('uint8')
-                
-            return img_array
-        except Exception as e:
-            print(f"PIL processing failed for {img_path}: {str(e)}")
-            
-        # Fallback to OpenCV
-        try:
-            img = cv2.imread(img_path)
-            if img is not None:
-                return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
-        except Exception as e:
-            print(f"OpenCV processing failed for {img_path}: {str(e)}")
+        pil_img = Image.open(img_path)
+        if pil_img.mode != 'RGB':
+            pil_img = pil_img.convert('RGB')
+        img_array = np.array(pil_img)
+        
+        if img_array.dtype != 'uint8':
+            img_array = img_array.astype('uint8')
             
+        return img_array
+    except Exception as e:
+        errors.append(f"PIL processing failed: {str(e)}")
+        
+    # Fallback to OpenCV
+    try:
+        img = cv2.imread(img_path)
+        if img is not None:
+            return cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+        errors.append("OpenCV could not decode the file")
     except Exception as e:
-        print(f"General image validation error for {img_path}: {str(e)}")
+        errors.append(f"OpenCV processing failed: {str(e)}")
         
+    raise ValueError("; ".join(errors))
+
+def validate_image(img_path):
+    """Validate and convert image to proper format for face recognition"""
+    try:
+        return read_image(img_path)
+    except Exception as e:
+        print(f"Image validation failed for {img_path}: {str(e)}")
     return None
 
+def eye_alignment(landmarks):
+    """Return (eyes_center, angle) that levels the eyes of one face"""
+    left_eye_center = np.mean(landmarks['left_eye'], axis=0).astype("int")
+    right_eye_center = np.mean(landmarks['right_eye'], axis=0).astype("int")
+    
+    dy = right_eye_center[1] - left_eye_center[1]
+    dx = right_eye_center[0] - left_eye_center[0]
+    angle = np.degrees(np.arctan2(dy, dx))
+    
+    eyes_center = (float((left_eye_center[0] + right_eye_center[0]) // 2),
+                   float((left_eye_center[1] + right_eye_center[1]) // 2))
+    return eyes_center, float(angle)
+
 def align_face(image):
     """Align face based on eye positions"""
+    import face_recognition
+
     try:
         face_landmarks = face_recognition.face_landmarks(image)
         if face_landmarks:
-            left_eye = face_landmarks[0]['left_eye']
-            right_eye = face_landmarks[0]['right_eye']
-            
-            left_eye_center = np.mean(left_eye, axis=0).astype("int")
-            right_eye_center = np.mean(right_eye, axis=0).astype("int")
-            
-            dy = right_eye_center[1] - left_eye_center[1]
-            dx = right_eye_center[0] - left_eye_center[0]
-            angle = np.degrees(np.arctan2(dy, dx))
-            
-            eyes_center = ((left_eye_center[0] + right_eye_center[0]) // 2,
-                          (left_eye_center[1] + right_eye_center[1]) // 2)
-            
+            eyes_center, angle = eye_alignment(face_landmarks[0])
             M = cv2.getRotationMatrix2D(eyes_center, angle, 1)
             aligned = cv2.warpAffine(image, M, (image.shape[1], image.shape[0]))
             return aligned
@@ -65,76 +90,215 @@ def align_face(image):
     
     return image
 
-def load_employee_encodings(data_dir='data'):
-    """Load and process all employee face encodings"""
-    encodings = []
-    employees = []
-    
+def encode_face_single_pass(image, multiple_faces=ENROLL_MULTIPLE_FACES):
+    """Encode an enrollment photo with a single face detection
+
+    The face is detected once; landmarks come from that known box, only a
+    crop around the face is rotated to level the eyes, and the encoder runs
+    on the rotated crop with the known box, so no second detection happens.
+    multiple_faces is 'largest' (use the biggest face) or 'reject'.
+    Returns (encoding, error message).
+    """
+    import face_recognition
+
+    locations = face_recognition.face_locations(image)
+    if not locations:
+        return None, "No face found"
+    if len(locations) > 1 and multiple_faces == 'reject':
+        return None, f"{len(locations)} faces found"
+    location = max(locations, key=lambda b: (b[2] - b[0]) * (b[1] - b[3]))
+
+    crop, box = face_crop(image, location, ENROLL_CROP_MARGIN)
+    landmarks = face_recognition.face_landmarks(image, [location])
+    if landmarks:
+        y0, x0 = location[0] - box[0], location[3] - box[3]
+        (cx, cy), angle = eye_alignment(landmarks[0])
+        M = cv2.getRotationMatrix2D((cx - x0, cy - y0), angle, 1)
+        crop = cv2.warpAffine(crop, M, (crop.shape[1], crop.shape[0]))
+    face_encs = face_recognition.face_encodings(crop, [box])
+    if not face_encs:
+        return None, "No face found"
+    return face_encs[0], None
+
+def is_face_count_error(error):
+    """True for the definitive 'no face' / 'several faces' outcomes of encode_face_single_pass
+
+    Those depend only on the image and are safe to cache; any other error
+    (unreadable file, dlib failure) may not happen again and is retried.
+    """
+    return error == "No face found" or error.endswith(" faces found")
+
+def encode_employee_image_checked(img_path):
+    """Return (encoding, error message) for one enrollment image"""
+    try:
+        img_array = read_image(img_path)
+        return encode_face_single_pass(img_array)
+    except Exception as e:
+        return None, str(e)
+
+def encode_employee_image(img_path):
+    """Compute the face encoding of a single enrollment image"""
+    encoding, error = encode_employee_image_checked(img_path)
+    if error:
+        print(f"Error processing {img_path}: {error}")
+    return encoding
+
+def list_employee_images(data_dir='data'):
+    """Return {emp_id: [image paths]} for the data/<emp_id>/ gallery"""
+    gallery = {}
     if not os.path.exists(data_dir):
-        return [], []
-    
-    for emp_id in os.listdir(data_dir):
+        return gallery
+
+    for emp_id in sorted(os.listdir(data_dir)):
         emp_folder = os.path.join(data_dir, emp_id)
         if not os.path.isdir(emp_folder):
             continue
-            
+
+        gallery[emp_id] = [
+            os.path.join(emp_folder, img_name)
+            for img_name in sorted(os.listdir(emp_folder))
+            if img_name.lower().endswith(('.png', '.jpg', '.jpeg'))
+        ]
+    return gallery
+
+def load_employee_image_encodings(data_dir='data', cache_path=ENCODING_CACHE_PATH, rebuild=False):
+    """Return {emp_id: [encodings]}, re-encoding only new or changed images
+
+    Pass cache_path=None to bypass the on-disk cache, or rebuild=True to
+    discard it and encode every image again.
+    """
+    gallery = list_employee_images(data_dir)
+    cache = None
+    if cache_path:
+        cache = EncodingCache(cache_path, ENCODING_MODEL_TAG, rebuild=rebuild)
+
+    employee_encodings = {}
+    for emp_id, img_paths in gallery.items():
         emp_encodings = []
-        valid_images = 0
-        
-        for img_name in os.listdir(emp_folder):
-            if not img_name.lower().endswith(('.png', '.jpg', '.jpeg')):
-                continue
-                
-            img_path = os.path.join(emp_folder, img_name)
-            img_array = validate_image(img_path)
-            
-            if img_array is None:
-                continue
-                
-            try:
-                aligned_img = align_face(img_array)
-                face_encs = face_recognition.face_encodings(aligned_img)
-                if face_encs:
-                    emp_encodings.append(face_encs[0])
-                    valid_images += 1
-            except Exception as e:
-                print(f"Error processing {img_path}: {str(e)}")
-                continue
-        
+        for img_path in img_paths:
+            if cache is not None:
+                encoding = cache.encode(img_path, encode_employee_image)
+            else:
+                encoding = encode_employee_image(img_path)
+            if encoding is not None:
+                emp_encodings.append(encoding)
         if emp_encodings:
-            avg_encoding = np.mean(emp_encodings, axis=0)
-            encodings.append(avg_encoding)
-            employees.append(emp_id)
-            print(f"Loaded {valid_images} images for employee {emp_id}")
-    
+            employee_encodings[emp_id] = emp_encodings
+
+    if cache is not None:
+        cache.prune(p for paths in gallery.values() for p in paths)
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Could not write encoding cache {cache_path}: {str(e)}")
+        print(f"Encoding cache: {cache.hits} cached, {cache.misses} encoded")
+
+    return employee_encodings
+
+def select_templates(emp_encodings, max_templates=5):
+    """Pick up to max_templates diverse encodings by farthest-point sampling
+
+    Starts from the encoding closest to the mean (the most typical image)
+    and repeatedly adds the one farthest from everything selected so far,
+    so pose and lighting variety survive while near-duplicates are pruned.
+    """
+    points = np.asarray(emp_encodings, dtype=np.float64)
+    if len(points) <= max_templates:
+        return list(points)
+
+    first = int(np.argmin(np.linalg.norm(points - points.mean(axis=0), axis=1)))
+    selected = [first]
+    nearest = np.linalg.norm(points - points[first], axis=1)
+    while len(selected) < max_templates:
+        nxt = int(np.argmax(nearest))
+        selected.append(nxt)
+        nearest = np.minimum(nearest, np.linalg.norm(points - points[nxt], axis=1))
+    return [points[i] for i in selected]
+
+def load_employee_encodings(data_dir='data', cache_path=ENCODING_CACHE_PATH, rebuild=False,
+                            mode='mean', max_templates=5):
+    """Load and process all employee face encodings
+
+    mode='mean' returns one averaged encoding per employee. mode='multi'
+    keeps up to max_templates diverse encodings per employee, with the
+    employee id repeated once per template.
+    """
+    if mode not in ('mean', 'multi'):
+        raise ValueError("mode must be 'mean' or 'multi'")
+    encodings = []
+    employees = []
+
+    employee_encodings = load_employee_image_encodings(data_dir, cache_path, rebuild)
+    for emp_id, emp_encodings in employee_encodings.items():
+        if mode == 'mean':
+            templates = [np.mean(emp_encodings, axis=0)]
+        else:
+            templates = select_templates(emp_encodings, max_templates)
+        encodings.extend(templates)
+        employees.extend([emp_id] * len(templates))
+        print(f"Loaded {len(emp_encodings)} images for employee {emp_id}")
+
     return employees, encodings
 
+def load_employee_matcher(data_dir='data', tolerance=0.5, index='flat', index_params=None,
+                          index_path=None, cache_path=ENCODING_CACHE_PATH, rebuild=False,
+                          mode='mean', max_templates=5, aggregate='min', top_k=2):
+    """Build a GalleryMatcher over the employee gallery
+
+    index selects the search backend ('flat', 'ivf' or 'rptree'). With
+    index_path the built index is saved there and reused on the next start
+    as long as the gallery has not changed. mode/max_templates choose the
+    gallery layout (see load_employee_encodings) and aggregate/top_k how
+    multi-template distances are combined per employee.
+    """
+    employees, encodings = load_employee_encodings(data_dir, cache_path, rebuild, mode, max_templates)
+    matcher_options = {'aggregate': aggregate, 'top_k': top_k}
+    digest = gallery_digest(np.asarray(encodings, dtype=np.float32).reshape(-1, 128))
+    labels_json = json.dumps(employees)
+
+    if index_path and os.path.isfile(index_path) and not rebuild:
+        try:
+            saved, meta = load_index(index_path)
+            if (saved.kind == index and meta["digest"] == digest
+                    and meta.get("labels") == labels_json):
+                return GalleryMatcher(encodings, employees, tolerance, index=saved, **matcher_options)
+            print(f"Index {index_path} is stale, rebuilding")
+        except Exception as e:
+            print(f"Could not load index {index_path}: {str(e)}")
+
+    built = make_index(index, **(index_params or {})).build(encodings)
+    if index_path:
+        try:
+            index_dir = os.path.dirname(index_path)
+            if index_dir:
+                os.makedirs(index_dir, exist_ok=True)
+            built.save(index_path, labels=labels_json)
+        except OSError as e:
+            print(f"Could not write index {index_path}: {str(e)}")
+    return GalleryMatcher(encodings, employees, tolerance, index=built, **matcher_options)
+
 def recognize_face(frame, known_encodings, known_ids, tolerance=0.5):
-    """Recognize faces in a video frame"""
+    """Recognize faces in a video frame
+
+    known_encodings may also be a prebuilt GalleryMatcher, which avoids
+    rebuilding the gallery matrix on every call.
+    """
+    if isinstance(known_encodings, GalleryMatcher):
+        matcher = known_encodings
+    else:
+        matcher = GalleryMatcher(known_encodings, known_ids, tolerance)
+
+    metrics.incr("frames")
     try:
-        # Convert and validate frame
-        if len(frame.shape) == 3:  # Color image
-            if frame.shape[2] == 3:  # BGR → RGB
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-            elif frame.shape[2] == 4:  # BGRA → RGB
-                rgb = cv2.cvtColor(frame, cv2.COLOR_BGRA2RGB)
-            else:  # Assume already RGB
-                rgb = frame.copy()
-        else:  # Grayscale
-            rgb = cv2.cvtColor(frame, cv2.COLOR_GRAY2RGB)
-        
-        # Ensure uint8
-        if rgb.dtype != 'uint8':
-            rgb = rgb.astype('uint8')
+        # Convert BGR, BGRA or grayscale to uint8 RGB in this thread's pooled buffer
+        with metrics.stage("color_convert"):
+            rgb = to_rgb(frame)
 
-        face_locations = face_recognition.face_locations(rgb)
-        face_encodings = face_recognition.face_encodings(rgb, face_locations)
+        face_locations, face_encodings = detect_and_encode(rgb)
         
-        for face_encoding in face_encodings:
-            matches = face_recognition.compare_faces(known_encodings, face_encoding, tolerance)
-            if True in matches:
-                first_match_index = matches.index(True)
-                return known_ids[first_match_index]
+        matches = [m for m in matcher.match(face_encodings, tolerance) if m.label is not None]
+        if matches:
+            return min(matches, key=lambda m: m.distance).label
     except Exception as e:
         print(f"Recognition error: {str(e)}")
     
@@ -1,60 +1,307 @@
+import time
+STARTED_AT = time.perf_counter()  # origin of the startup milestones
+import argparse
+import sqlite3
 import cv2
-import face_recognition  # Add this import
 from modules.face_recognition import recognize_face
-from modules.geolocation import get_current_location
-from modules.database import add_attendance_record
+from modules.geofence import get_geofence
+from modules.geolocation import HTTPBackend, LocationProvider, StaticBackend, get_current_location, set_provider
+from modules.database import init_db, record_attendance_event
+from modules.dedup import AttendanceCooldown
+from modules.detection import DETECTION_SCALE, MIN_FACE_SIZE, UPSAMPLE, detect_and_encode, face_crop
+from modules.buffers import copy_into, to_rgb
+from modules.matcher import GalleryMatcher
+from modules.metrics import metrics, start_metrics, stop_metrics
+from modules.motion import MAX_SKIP, MIN_CHANGED_FRACTION, MotionGate, parse_roi
+from modules.pipeline import FramePipeline
+from modules.snapshots import get_snapshot_store
+from modules.startup import ModelLoader, StartupClock
+from modules.tracking import FaceTracker, track_and_recognize
 import os
 
+STATS_INTERVAL = 5.0  # seconds between pipeline stats printouts
+startup_clock = StartupClock(STARTED_AT)
+
+def recognize_frame(frame, matcher, detection=None, tracker=None, gate=None):
+    """Locate, encode and match every face in a BGR frame
+
+    detection holds keyword options for modules.detection.detect_and_encode
+    (scale, upsample, min_face_size, model). With a FaceTracker only new or
+    due tracks are encoded. With a MotionGate unchanged frames reuse the
+    previous result without running detection.
+    """
+    metrics.incr("frames")
+    if gate is not None and not gate.should_process(frame):
+        metrics.incr("frames_skipped")
+        return gate.last_result
+    with metrics.stage("color_convert"):
+        rgb_frame = to_rgb(frame)  # contiguous, reused per thread
+    if tracker is not None:
+        faces = track_and_recognize(rgb_frame, tracker, matcher, detection)
+    else:
+        face_locations, face_encodings = detect_and_encode(rgb_frame, **(detection or {}))
+        faces = list(zip(face_locations, matcher.match(face_encodings)))
+    if gate is not None:
+        gate.last_result = faces
+    return faces
+
+def recognize_when_ready(frame, loader, detection=None, tracker=None, gate=None):
+    """recognize_frame once the background loader has a matcher; no faces before that"""
+    matcher = loader.matcher
+    if matcher is None:
+        return []
+    faces = recognize_frame(frame, matcher, detection, tracker, gate)
+    if startup_clock.mark("first_recognition"):
+        print(f"Startup: {startup_clock.summary()}")
+    return faces
+
+def draw_loading(frame, loader):
+    """Overlay the model loading progress on a frame"""
+    stage, done, total = loader.progress
+    text = f"{stage} {done}/{total}" if total else f"{stage}..."
+    if loader.error is not None:
+        text = f"recognition unavailable: {loader.error}"
+    cv2.putText(frame, text, (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 200, 255), 2)
+
+def draw_faces(frame, faces):
+    """Draw a box and name for every recognized face"""
+    for (top, right, bottom, left), match in faces:
+        if match.label is not None:
+            cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
+            cv2.putText(frame, match.label, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+
+# Per-employee cooldown shared by every 'A' press in this process
+attendance_cooldown = AttendanceCooldown()
+
+def mark_attendance(name, crop=None):
+    """Record attendance for a recognized employee at the current location
+
+    crop is the BGR face image from the marking frame; it is queued for the
+    snapshot store and the row points at its content-addressed path.
+    """
+    if not attendance_cooldown.allow(name):
+        return
+    location = get_current_location()
+    if location:
+        img_path = get_snapshot_store().submit(crop) if crop is not None else None
+        fence = get_geofence().check(location["latitude"], location["longitude"])
+        try:
+            event = record_attendance_event(
+                name=name,
+                lat=location["latitude"],
+                lon=location["longitude"],
+                place=location["place"],
+                img_path=img_path,
+                site_id=fence.site_id,
+                in_fence=fence.in_fence,
+                min_gap_s=attendance_cooldown.cooldown_s
+            )
+        except sqlite3.Error as e:
+            attendance_cooldown.release(name)
+            print(f"Attendance not marked for {name}: database error: {str(e)}")
+            return
+        if event is None:
+            print(f"{name} was already marked moments ago; skipping")
+            return
+        print(f"Attendance marked for {name} at {location['place']} ({event.replace('_', '-')})")
+        if fence.in_fence is False:
+            print(f"Warning: {name} is outside every configured site")
+        if location["stale"]:
+            print(f"Warning: location is {location['age_s']:.0f}s old ({location['error'] or 'refresh pending'})")
+    else:
+        attendance_cooldown.release(name)
+        print(f"Attendance not marked for {name}: no location reading yet")
+
+def mark_faces(frame, faces):
+    """Mark attendance once for each recognized person in view"""
+    marked = set()
+    for location, match in faces:
+        if match.label is not None and match.label not in marked:
+            marked.add(match.label)
+            crop, _ = face_crop(frame, location)
+            mark_attendance(match.label, crop)
+
+def print_snapshot_stats():
+    stats = get_snapshot_store().stats()
+    if stats["written"] or stats["dropped"] or stats["failed"]:
+        print(f"snapshots: {stats['written']} written, {stats['deduplicated']} deduplicated, "
+              f"{stats['dropped']} dropped, {stats['failed']} failed, "
+              f"p95 write {stats['write_p95_ms']} ms")
+
+def print_tracker_stats(tracker):
+    stats = tracker.stats()
+    print(f"tracks: {stats['active_tracks']} active, {stats['encodings_run']} encoded, "
+          f"{stats['encodings_avoided']} avoided ({stats['avoided_per_min']}/min)")
+
+def print_gate_stats(gate):
+    stats = gate.stats()
+    print(f"motion gate: {stats['processed']} processed, {stats['skipped']} skipped "
+          f"({stats['skip_ratio']:.0%})")
+
+def print_attendance_stats(cooldown):
+    stats = cooldown.stats()
+    if stats["accepted"] or stats["suppressed"]:
+        print(f"attendance: {stats['accepted']} marked, {stats['suppressed']} duplicates suppressed")
+
+def print_stats(tracker, gate):
+    print_attendance_stats(attendance_cooldown)
+    print_snapshot_stats()
+    if tracker is not None:
+        print_tracker_stats(tracker)
+    if gate is not None:
+        print_gate_stats(gate)
+
+def run_pipeline(cap, loader, workers=1, queue_size=2, detection=None, tracker=None, gate=None):
+    """Display loop fed by background capture and recognition threads"""
+    pipeline = FramePipeline(cap, lambda image: recognize_when_ready(image, loader, detection, tracker, gate),
+                             workers, queue_size)
+    pipeline.start()
+    shown_id = 0
+    last_report = time.perf_counter()
+    
+    try:
+        while pipeline.running:
+            key = cv2.waitKey(1) & 0xFF
+            if key == ord('q'):
+                break
+            
+            result = pipeline.latest_result()
+            faces = result.faces if result else []
+            if key == ord('a') and result is not None:
+                # Crop from the frame the boxes were found in
+                mark_faces(result.image, faces)
+            
+            frame = pipeline.latest_frame()
+            
+            if frame is None or frame.frame_id == shown_id:
+                continue
+            shown_id = frame.frame_id
+            
+            display = copy_into(frame.image, name="display")
+            draw_faces(display, faces)
+            if not loader.ready:
+                draw_loading(display, loader)
+            cv2.imshow("Face Recognition Attendance", display)
+            startup_clock.mark("first_frame")
+            pipeline.display_stats.record(time.perf_counter() - frame.captured_at)
+            
+            now = time.perf_counter()
+            if now - last_report >= STATS_INTERVAL:
+                last_report = now
+                print(" | ".join(
+                    f"{s['stage']}: {s['fps']} fps, {s['latency_ms']} ms, {s['dropped']} dropped"
+                    for s in pipeline.stats()))
+                print_stats(tracker, gate)
+    finally:
+        pipeline.stop()
+
 def main():
-    # Initialize face recognition
-    known_faces, known_names = recognize_face()
+    parser = argparse.ArgumentParser(description="GeoFace attendance kiosk")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="run capture and recognition on background threads")
+    parser.add_argument("--workers", type=int, default=1, help="recognition threads in pipeline mode")
+    parser.add_argument("--queue-size", type=int, default=2, help="frames buffered for recognition")
+    parser.add_argument("--detection-scale", type=float, default=DETECTION_SCALE,
+                        help="resize factor applied before face detection")
+    parser.add_argument("--upsample", type=int, default=UPSAMPLE, help="HOG upsampling passes")
+    parser.add_argument("--min-face-size", type=int, default=MIN_FACE_SIZE,
+                        help="ignore faces smaller than this many pixels")
+    parser.add_argument("--track", action="store_true",
+                        help="track faces across frames and encode each person once per visit")
+    parser.add_argument("--reverify-every", type=int, default=15,
+                        help="frames between re-encoding a tracked face")
+    parser.add_argument("--motion-gate", action="store_true",
+                        help="only run face detection when the scene changes")
+    parser.add_argument("--motion-threshold", type=float, default=MIN_CHANGED_FRACTION,
+                        help="fraction of changed pixels that counts as motion")
+    parser.add_argument("--max-skip", type=int, default=MAX_SKIP,
+                        help="run detection at least every N frames")
+    parser.add_argument("--roi", type=parse_roi, default=None,
+                        help="motion region of interest as x,y,w,h frame fractions")
+    parser.add_argument("--cooldown", type=float, default=attendance_cooldown.cooldown_s,
+                        help="seconds before the same employee can be marked again")
+    parser.add_argument("--location", help="fixed kiosk coordinates as 'lat,lon[,place]' instead of IP lookup")
+    parser.add_argument("--location-url", help="fetch the location as JSON from this URL instead of IP lookup")
+    parser.add_argument("--metrics-json", help="write rolling per-stage latency stats to this JSON file")
+    parser.add_argument("--metrics-port", type=int, help="serve Prometheus-style /metrics on this port")
+    parser.add_argument("--metrics-interval", type=float, default=10.0, help="seconds between JSON exports")
+    parser.add_argument("--no-warmup", action="store_true",
+                        help="skip the dummy-frame warmup of the detector and encoder")
+    args = parser.parse_args()
+    exporters = start_metrics(args.metrics_json, args.metrics_port, args.metrics_interval)
+    # Creates the schema, or migrates an older database, before anything writes to it
+    init_db()
+    attendance_cooldown.cooldown_s = args.cooldown
+    # Start the background location refresh now so marking attendance never waits on it
+    if args.location:
+        lat, lon, *place = args.location.split(",", 2)
+        set_provider(LocationProvider(StaticBackend(lat, lon, place[0].strip() if place else "")))
+    elif args.location_url:
+        set_provider(LocationProvider(HTTPBackend(args.location_url)))
+    get_current_location()
+    tracker = FaceTracker(reverify_every=args.reverify_every) if args.track else None
+    gate = None
+    if args.motion_gate:
+        gate = MotionGate(min_changed_fraction=args.motion_threshold, max_skip=args.max_skip, roi=args.roi)
+    detection = {
+        "scale": args.detection_scale,
+        "upsample": args.upsample,
+        "min_face_size": args.min_face_size,
+    }
+    
+    # Load face recognition in the background while the camera opens;
+    # frames are shown (without recognition) until it is ready
+    loader = ModelLoader(
+        lambda progress: GalleryMatcher(*recognize_face(progress=progress), tolerance=0.6),
+        detection, startup_clock, warm=not args.no_warmup).start()
     
     # Initialize camera
     cap = cv2.VideoCapture(0)
     
     print("Press 'A' to mark attendance when face is detected")
+    if args.pipeline:
+        run_pipeline(cap, loader, args.workers, args.queue_size, detection, tracker, gate)
+        cap.release()
+        cv2.destroyAllWindows()
+        get_snapshot_store().close()
+        stop_metrics(exporters)
+        return
+    
+    last_report = time.perf_counter()
+    frame = None
     while True:
-        ret, frame = cap.read()
+        # Reading into the previous frame's array avoids a new allocation per
+        # frame; nothing holds on to it (snapshots copy their crops)
+        with metrics.stage("capture"):
+            ret, frame = cap.read(frame)
         if not ret:
             break
         
-        rgb_frame = frame[:, :, ::-1]  # BGR to RGB
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
-        
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_faces, face_encoding, tolerance=0.6)
-            name = "Unknown"
-            
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = known_names[first_match_index]
-                
-                # Draw rectangle and name
-                cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
-                cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            
-            # Mark attendance on 'A' key press
-            if cv2.waitKey(1) & 0xFF == ord('a') and name != "Unknown":
-                location = get_current_location()
-                if location:
-                    img_path = f"faces/{name.lower().replace(' ', '_')}.jpg"
-                    add_attendance_record(
-                        name=name,
-                        lat=location["latitude"],
-                        lon=location["longitude"],
-                        place=location["place"],
-                        img_path=img_path
-                    )
-                    print(f"Attendance marked for {name} at {location['place']}")
+        faces = recognize_when_ready(frame, loader, detection, tracker, gate)
+        if time.perf_counter() - last_report >= STATS_INTERVAL:
+            last_report = time.perf_counter()
+            print_stats(tracker, gate)
         
-        cv2.imshow("Face Recognition Attendance", frame)
+        # Draw on a copy so attendance snapshots are cropped from the clean frame
+        display = copy_into(frame, name="display")
+        draw_faces(display, faces)
+        if not loader.ready:
+            draw_loading(display, loader)
+        with metrics.stage("display"):
+            cv2.imshow("Face Recognition Attendance", display)
+        startup_clock.mark("first_frame")
         
-        if cv2.waitKey(1) & 0xFF == ord('q'):
+        # One key read per frame: 'A' marks everyone recognized in view
+        key = cv2.waitKey(1) & 0xFF
+        if key == ord('q'):
             break
+        if key == ord('a'):
+            mark_faces(frame, faces)
     
     cap.release()
     cv2.destroyAllWindows()
+    get_snapshot_store().close()
+    stop_metrics(exporters)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,394 @@
+import ast
+import hashlib
+import heapq
+import time
+
+import numpy as np
+
+ENCODING_SIZE = 128
+# Candidates re-scored exactly after the fast float32 pass of FlatIndex
+REFINE_CANDIDATES = 4
+
+
+def gallery_digest(encodings):
+    """Fingerprint of a gallery matrix, used to detect stale saved indexes"""
+    matrix = np.ascontiguousarray(encodings, dtype=np.float32)
+    return hashlib.sha1(matrix.tobytes()).hexdigest()
+
+
+def _as_queries(queries, dtype=np.float32):
+    return np.asarray(queries, dtype=dtype).reshape(-1, ENCODING_SIZE)
+
+
+def _exact_topk(matrix, query, cand, k):
+    """Exact float64 distances from one query to candidate rows, best k first"""
+    cand = np.unique(cand)
+    dist = np.linalg.norm(matrix[cand].astype(np.float64) - query, axis=1)
+    if k < len(cand):
+        top = np.argpartition(dist, k - 1)[:k]
+        cand, dist = cand[top], dist[top]
+    order = np.argsort(dist)
+    return dist[order], cand[order]
+
+
+def _pack_results(results, k):
+    """Stack per-query (dist, idx) pairs into (F, k) arrays padded with inf/-1"""
+    out_dist = np.full((len(results), k), np.inf)
+    out_idx = np.full((len(results), k), -1, dtype=np.int64)
+    for i, (dist, idx) in enumerate(results):
+        out_dist[i, :len(dist)] = dist
+        out_idx[i, :len(idx)] = idx
+    return out_dist, out_idx
+
+
+class FlatIndex:
+    """Exact brute-force search over a contiguous float32 matrix"""
+
+    kind = "flat"
+
+    def __init__(self):
+        self.encodings = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        self.norms = np.zeros(0, dtype=np.float32)
+
+    def __len__(self):
+        return len(self.encodings)
+
+    def params(self):
+        return {}
+
+    def build(self, encodings):
+        """Index the given (N, 128) encodings and return self"""
+        matrix = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        self.encodings = np.ascontiguousarray(matrix)
+        self.norms = np.einsum("ij,ij->i", self.encodings, self.encodings)
+        self._build()
+        return self
+
+    def _build(self):
+        pass
+
+    def distances(self, queries):
+        """Return the (faces x templates) float32 distance matrix"""
+        queries = _as_queries(queries)
+        q_norms = np.einsum("ij,ij->i", queries, queries)
+        sq = self.norms[None, :] - 2.0 * (queries @ self.encodings.T)
+        sq += q_norms[:, None]
+        np.maximum(sq, 0.0, out=sq)
+        return np.sqrt(sq, out=sq)
+
+    def search(self, queries, k=1):
+        """Return (distances, indices) of the k nearest rows for each query"""
+        queries = _as_queries(queries, np.float64)
+        if len(self) == 0:
+            return _pack_results([(np.zeros(0), np.zeros(0, dtype=np.int64))] * len(queries), k)
+
+        dist = self.distances(queries)
+        n_cand = min(max(k, REFINE_CANDIDATES), len(self))
+        if n_cand < dist.shape[1]:
+            cand = np.argpartition(dist, n_cand - 1, axis=1)[:, :n_cand]
+        else:
+            cand = np.broadcast_to(np.arange(dist.shape[1]), dist.shape)
+        exact = np.linalg.norm(
+            self.encodings[cand].astype(np.float64) - queries[:, None, :], axis=2)
+        order = np.argsort(exact, axis=1)[:, :k]
+        return _pack_results(
+            list(zip(np.take_along_axis(exact, order, axis=1),
+                     np.take_along_axis(cand, order, axis=1))), k)
+
+    def _state(self):
+        return {}
+
+    def _restore(self, data):
+        pass
+
+    def save(self, path, **meta):
+        """Write the index to an .npz file"""
+        arrays = {
+            "kind": np.array(self.kind),
+            "params": np.array(repr(self.params())),
+            "encodings": self.encodings,
+            "digest": np.array(gallery_digest(self.encodings)),
+        }
+        for key, value in meta.items():
+            arrays[f"meta_{key}"] = np.array(value)
+        arrays.update(self._state())
+        with open(path, "wb") as f:
+            np.savez(f, **arrays)
+
+
+class IVFIndex(FlatIndex):
+    """Inverted-file index: k-means coarse quantizer plus exact re-ranking
+
+    nlist controls the number of partitions; nprobe (per search) how many of
+    the closest partitions are scanned. Higher nprobe trades speed for recall.
+    """
+
+    kind = "ivf"
+
+    def __init__(self, nlist=None, nprobe=8, n_iter=10, train_size=65536, seed=0):
+        super().__init__()
+        self.nlist = nlist
+        # Partitions actually built; nlist=None picks 4*sqrt(N) on each build
+        self._nlist = 0
+        self.nprobe = nprobe
+        self.n_iter = n_iter
+        self.train_size = train_size
+        self.seed = seed
+        self.centroids = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        self.order = np.zeros(0, dtype=np.int64)
+        self.offsets = np.zeros(1, dtype=np.int64)
+
+    def params(self):
+        return {"nlist": self.nlist, "nprobe": self.nprobe, "n_iter": self.n_iter,
+                "train_size": self.train_size, "seed": self.seed}
+
+    @staticmethod
+    def _assign(points, centroids, chunk=8192):
+        c_norms = np.einsum("ij,ij->i", centroids, centroids)
+        labels = np.empty(len(points), dtype=np.int64)
+        for start in range(0, len(points), chunk):
+            block = points[start:start + chunk]
+            labels[start:start + chunk] = np.argmin(c_norms[None, :] - 2.0 * (block @ centroids.T), axis=1)
+        return labels
+
+    def _build(self):
+        n = len(self.encodings)
+        if n == 0:
+            return
+        nlist = self.nlist or int(4 * np.sqrt(n))
+        nlist = max(1, min(nlist, n))
+        self._nlist = nlist
+        rng = np.random.default_rng(self.seed)
+
+        sample = self.encodings
+        if n > self.train_size:
+            sample = self.encodings[rng.choice(n, self.train_size, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.n_iter):
+            labels = self._assign(sample, centroids)
+            counts = np.bincount(labels, minlength=nlist)
+            order = np.argsort(labels, kind="stable")
+            nonempty = counts > 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])[nonempty]
+            sums = np.add.reduceat(sample[order], starts, axis=0)
+            centroids[nonempty] = sums / counts[nonempty, None]
+            # Re-seed empty partitions so nlist stays meaningful
+            empty = np.flatnonzero(~nonempty)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), len(empty), replace=False)]
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+
+        labels = self._assign(self.encodings, self.centroids)
+        self.order = np.argsort(labels, kind="stable")
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=nlist))])
+
+    def search(self, queries, k=1, nprobe=None):
+        queries = _as_queries(queries, np.float64)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        results = []
+        if len(self) == 0:
+            return _pack_results([(np.zeros(0), np.zeros(0, dtype=np.int64))] * len(queries), k)
+
+        c_norms = np.einsum("ij,ij->i", self.centroids, self.centroids)
+        c_dist = c_norms[None, :] - 2.0 * (queries.astype(np.float32) @ self.centroids.T)
+        if nprobe < len(self.centroids):
+            probes = np.argpartition(c_dist, nprobe - 1, axis=1)[:, :nprobe]
+        else:
+            probes = np.broadcast_to(np.arange(len(self.centroids)), c_dist.shape)
+        for query, lists in zip(queries, probes):
+            cand = np.concatenate([self.order[self.offsets[l]:self.offsets[l + 1]] for l in lists])
+            if len(cand) == 0:
+                results.append((np.zeros(0), cand))
+                continue
+            results.append(_exact_topk(self.encodings, query, cand, k))
+        return _pack_results(results, k)
+
+    def _state(self):
+        return {"centroids": self.centroids, "order": self.order, "offsets": self.offsets}
+
+    def _restore(self, data):
+        self.centroids = data["centroids"]
+        self.order = data["order"]
+        self.offsets = data["offsets"]
+        self._nlist = len(self.centroids)
+
+
+class RPTreeIndex(FlatIndex):
+    """Forest of random-projection trees searched best-first (Annoy-style)
+
+    n_trees and leaf_size are fixed at build time; search_k (per search) caps
+    the number of candidates collected before exact re-ranking. Higher
+    search_k trades speed for recall.
+    """
+
+    kind = "rptree"
+
+    def __init__(self, n_trees=8, leaf_size=64, search_k=None, seed=0):
+        super().__init__()
+        self.n_trees = n_trees
+        self.leaf_size = leaf_size
+        self.search_k = search_k
+        self.seed = seed
+        # Internal nodes of all trees; children < 0 encode leaf -(leaf + 1)
+        self.normals = np.zeros((0, ENCODING_SIZE), dtype=np.float32)
+        self.thresholds = np.zeros(0, dtype=np.float32)
+        self.children = np.zeros((0, 2), dtype=np.int64)
+        self.roots = np.zeros(0, dtype=np.int64)
+        self.leaf_items = np.zeros(0, dtype=np.int64)
+        self.leaf_offsets = np.zeros(1, dtype=np.int64)
+
+    def params(self):
+        return {"n_trees": self.n_trees, "leaf_size": self.leaf_size,
+                "search_k": self.search_k, "seed": self.seed}
+
+    def _build(self):
+        rng = np.random.default_rng(self.seed)
+        normals, thresholds, children, roots = [], [], [], []
+        leaves = []
+
+        def add_leaf(items):
+            leaves.append(items)
+            return -len(leaves)
+
+        for _ in range(self.n_trees):
+            if len(self.encodings) == 0:
+                break
+            # (items, parent node, side); parent -1 marks the tree root
+            stack = [(np.arange(len(self.encodings)), -1, 0)]
+            root = None
+            while stack:
+                items, parent, side = stack.pop()
+                node = None
+                if len(items) > self.leaf_size:
+                    a, b = self.encodings[rng.choice(items, 2, replace=False)]
+                    normal = a - b
+                    length = np.linalg.norm(normal)
+                    if length > 0:
+                        normal /= length
+                        proj = self.encodings[items] @ normal
+                        threshold = np.median(proj)
+                        left = proj < threshold
+                        if 0 < left.sum() < len(items):
+                            node = len(normals)
+                            normals.append(normal)
+                            thresholds.append(threshold)
+                            children.append([0, 0])
+                            stack.append((items[left], node, 0))
+                            stack.append((items[~left], node, 1))
+                if node is None:
+                    node = add_leaf(items)
+                if parent < 0:
+                    root = node
+                else:
+                    children[parent][side] = node
+            roots.append(root)
+
+        self.normals = np.array(normals, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+        self.thresholds = np.array(thresholds, dtype=np.float32)
+        self.children = np.array(children, dtype=np.int64).reshape(-1, 2)
+        self.roots = np.array(roots, dtype=np.int64)
+        sizes = [len(items) for items in leaves]
+        self.leaf_items = np.concatenate(leaves) if leaves else np.zeros(0, dtype=np.int64)
+        self.leaf_offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+
+    def _candidates(self, query, search_k):
+        heap = [(-np.inf, int(root)) for root in self.roots]
+        heapq.heapify(heap)
+        found = []
+        n_found = 0
+        while heap and n_found < search_k:
+            priority, node = heapq.heappop(heap)
+            if node < 0:
+                leaf = -node - 1
+                items = self.leaf_items[self.leaf_offsets[leaf]:self.leaf_offsets[leaf + 1]]
+                found.append(items)
+                n_found += len(items)
+                continue
+            margin = float(query @ self.normals[node] - self.thresholds[node])
+            left, right = self.children[node]
+            # Priority is the negated smallest margin along the path (min-heap)
+            heapq.heappush(heap, (max(priority, margin), int(left)))
+            heapq.heappush(heap, (max(priority, -margin), int(right)))
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def search(self, queries, k=1, search_k=None):
+        queries = _as_queries(queries, np.float64)
+        search_k = search_k or self.search_k or self.n_trees * self.leaf_size
+        results = []
+        for query in queries:
+            cand = self._candidates(query.astype(np.float32), max(search_k, k))
+            if len(cand) == 0:
+                results.append((np.zeros(0), cand))
+                continue
+            results.append(_exact_topk(self.encodings, query, cand, k))
+        return _pack_results(results, k)
+
+    def _state(self):
+        return {"normals": self.normals, "thresholds": self.thresholds,
+                "children": self.children, "roots": self.roots,
+                "leaf_items": self.leaf_items, "leaf_offsets": self.leaf_offsets}
+
+    def _restore(self, data):
+        for key in self._state():
+            setattr(self, key, data[key])
+
+
+INDEX_TYPES = {
+    FlatIndex.kind: FlatIndex,
+    IVFIndex.kind: IVFIndex,
+    RPTreeIndex.kind: RPTreeIndex,
+}
+
+
+def make_index(kind="flat", **params):
+    """Create an empty index of the given kind ('flat', 'ivf' or 'rptree')"""
+    try:
+        return INDEX_TYPES[kind](**params)
+    except KeyError:
+        raise ValueError(f"Unknown index type {kind!r}; choose from {sorted(INDEX_TYPES)}")
+
+
+def load_index(path):
+    """Load an index written by save(); returns (index, meta dict)"""
+    with np.load(path, allow_pickle=False) as data:
+        kind = str(data["kind"])
+        index = make_index(kind, **ast.literal_eval(str(data["params"])))
+        index.encodings = np.ascontiguousarray(data["encodings"])
+        index.norms = np.einsum("ij,ij->i", index.encodings, index.encodings)
+        index._restore(data)
+        meta = {key[5:]: data[key].item() for key in data.files if key.startswith("meta_")}
+        meta["digest"] = str(data["digest"])
+    return index, meta
+
+
+def recall_report(index, queries, exact=None, k=1, batch=4, **search_params):
+    """Compare an index against exact search: recall@1 and per-query latency
+
+    Queries are issued in batches of `batch`, the number of faces a kiosk
+    typically sees per frame, so both latencies reflect per-frame cost.
+    """
+    queries = _as_queries(queries, np.float64)
+    if exact is None:
+        exact = FlatIndex().build(index.encodings)
+
+    def run(search, **params):
+        results = []
+        start = time.perf_counter()
+        for i in range(0, len(queries), batch):
+            results.append(search(queries[i:i + batch], k, **params)[1])
+        elapsed = time.perf_counter() - start
+        found = np.vstack(results) if results else np.zeros((0, k), dtype=np.int64)
+        return found, elapsed * 1000 / max(len(queries), 1)
+
+    truth, exact_ms = run(exact.search)
+    found, index_ms = run(index.search, **search_params)
+
+    hits = np.any(found == truth[:, :1], axis=1)
+    return {
+        "kind": index.kind,
+        "params": dict(index.params(), **search_params),
+        "queries": len(queries),
+        f"recall@{k}": float(hits.mean()) if len(queries) else 1.0,
+        "exact_ms_per_query": exact_ms,
+        "index_ms_per_query": index_ms,
+    }
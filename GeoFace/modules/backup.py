@@ -0,0 +1,330 @@
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime
+
+from modules.database import DB_PATH
+from modules.reporting import ARCHIVE_DIR, rebuild_summaries
+
+BACKUP_DIR = "db_backups"
+MANIFEST_NAME = "manifest.json"
+# Pages copied per backup step, and the pause between steps that lets
+# writers (the recognition loop) take the database lock
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.01
+# Take a new full backup when the last one is older than this
+FULL_EVERY_S = 24 * 3600
+# Full backups kept: newest per hour / day / ISO week, for this many periods
+RETENTION = {"hourly": 24, "daily": 7, "weekly": 4}
+TABLE = "attendance"
+
+
+def sha256_file(path, chunk_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def gzip_file(src, dest):
+    """Compress src into dest atomically"""
+    tmp_path = dest + ".tmp"
+    with open(src, "rb") as f_in, gzip.open(tmp_path, "wb", compresslevel=6) as f_out:
+        shutil.copyfileobj(f_in, f_out, 1 << 20)
+    os.replace(tmp_path, dest)
+
+
+def load_manifest(backup_dir=BACKUP_DIR):
+    """Backups written by this module, oldest first"""
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    if not os.path.isfile(path):
+        return []
+    with open(path) as f:
+        return json.load(f)["backups"]
+
+
+def save_manifest(entries, backup_dir=BACKUP_DIR):
+    path = os.path.join(backup_dir, MANIFEST_NAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"backups": entries}, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _changelog_seq(conn):
+    """Highest change-log sequence number in a database (0 without a change log)"""
+    try:
+        return conn.execute("SELECT COALESCE(MAX(seq), 0) FROM attendance_changelog").fetchone()[0]
+    except sqlite3.OperationalError:
+        return 0
+
+
+def _stamp():
+    return datetime.now().strftime("%Y%m%d_%H%M%S")
+
+
+def _entry(kind, name, backup_dir, seq, **extra):
+    path = os.path.join(backup_dir, name)
+    entry = {
+        "name": name,
+        "kind": kind,
+        "created": time.time(),
+        "seq": seq,
+        "size": os.path.getsize(path),
+        "sha256": sha256_file(path),
+    }
+    entry.update(extra)
+    return entry
+
+
+def full_backup(db_path=DB_PATH, backup_dir=BACKUP_DIR, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP,
+                progress=None):
+    """Copy the database with the online backup API and store it gzip-compressed
+
+    The copy runs pages at a time with a pause between steps, so writers
+    are only ever held up for one step. SQLite restarts the copy when
+    another connection writes mid-way; at kiosk write rates that costs
+    little, but under a constant write load pass pages=-1, which in WAL
+    mode copies in one step without blocking writers. Returns the
+    manifest entry.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".db", dir=backup_dir)
+    os.close(fd)
+    try:
+        src = sqlite3.connect(db_path)
+        dst = sqlite3.connect(tmp_path)
+        try:
+            src.backup(dst, pages=pages, sleep=sleep,
+                       progress=(lambda status, remaining, total: progress(total - remaining, total))
+                       if progress else None)
+            # The copy is a consistent snapshot, so its change log position
+            # is exactly where the next incremental has to start
+            seq = _changelog_seq(dst)
+        finally:
+            dst.close()
+            src.close()
+        name = f"attendance_full_{_stamp()}_{seq}.db.gz"
+        gzip_file(tmp_path, os.path.join(backup_dir, name))
+    finally:
+        os.remove(tmp_path)
+
+    entries = load_manifest(backup_dir)
+    entry = _entry("full", name, backup_dir, seq, base=name)
+    entries.append(entry)
+    save_manifest(entries, backup_dir)
+    return entry
+
+
+def incremental_backup(db_path=DB_PATH, backup_dir=BACKUP_DIR):
+    """Store the rows changed since the last backup as gzip-compressed JSON lines
+
+    Each changed row is written once with its current values, or as a
+    deletion. Returns the manifest entry, or None if nothing changed.
+    Raises ValueError when there is no full backup to build on.
+    """
+    entries = load_manifest(backup_dir)
+    if not any(e["kind"] == "full" for e in entries):
+        raise ValueError("no full backup yet; run a full backup first")
+    last = entries[-1]
+
+    conn = sqlite3.connect(db_path)
+    try:
+        # One read transaction: the change log and the rows come from the same snapshot
+        conn.execute("BEGIN")
+        seq = _changelog_seq(conn)
+        if seq <= last["seq"]:
+            return None
+        columns = [row[1] for row in conn.execute(f"PRAGMA table_info({TABLE})")]
+        cursor = conn.execute(f'''
+            SELECT c.row_id, a.* FROM
+                (SELECT DISTINCT row_id FROM attendance_changelog WHERE seq > ? AND seq <= ?) c
+            LEFT JOIN {TABLE} a ON a.id = c.row_id
+            ORDER BY c.row_id
+        ''', (last["seq"], seq))
+        name = f"attendance_incr_{_stamp()}_{seq}.jsonl.gz"
+        path = os.path.join(backup_dir, name)
+        changed = 0
+        with gzip.open(path + ".tmp", "wt", compresslevel=6) as f:
+            f.write(json.dumps({"table": TABLE, "columns": columns, "from_seq": last["seq"], "to_seq": seq}) + "\n")
+            for row in cursor:
+                row_id, values = row[0], row[1:]
+                if values[0] is None:
+                    f.write(json.dumps({"id": row_id, "deleted": True}) + "\n")
+                else:
+                    f.write(json.dumps({"id": row_id, "row": list(values)}) + "\n")
+                changed += 1
+        os.replace(path + ".tmp", path)
+        conn.rollback()
+    finally:
+        conn.close()
+
+    entry = _entry("incremental", name, backup_dir, seq, base=last["base"], parent=last["name"], rows=changed)
+    entries.append(entry)
+    save_manifest(entries, backup_dir)
+    return entry
+
+
+def prune_changelog(db_path=DB_PATH, backup_dir=BACKUP_DIR):
+    """Drop change-log entries already covered by the oldest retained chain"""
+    entries = load_manifest(backup_dir)
+    fulls = [e for e in entries if e["kind"] == "full"]
+    if not fulls:
+        return 0
+    conn = sqlite3.connect(db_path, timeout=5.0)
+    try:
+        with conn:
+            return conn.execute("DELETE FROM attendance_changelog WHERE seq <= ?",
+                                (min(e["seq"] for e in fulls),)).rowcount
+    finally:
+        conn.close()
+
+
+def run_backup(db_path=DB_PATH, backup_dir=BACKUP_DIR, full_every_s=FULL_EVERY_S, progress=None):
+    """Take a full backup if the last one is older than full_every_s, else an incremental"""
+    fulls = [e for e in load_manifest(backup_dir) if e["kind"] == "full"]
+    if not fulls or time.time() - fulls[-1]["created"] >= full_every_s:
+        return full_backup(db_path, backup_dir, progress=progress)
+    return incremental_backup(db_path, backup_dir)
+
+
+def _period_keys(created):
+    t = datetime.fromtimestamp(created)
+    year, week, _ = t.isocalendar()
+    return {
+        "hourly": t.strftime("%Y%m%d%H"),
+        "daily": t.strftime("%Y%m%d"),
+        "weekly": f"{year}W{week:02d}",
+    }
+
+
+def apply_retention(backup_dir=BACKUP_DIR, retention=None):
+    """Delete full backups (and their incrementals) outside the retention policy
+
+    For each period the newest full backup of the most recent N periods is
+    kept; the newest full backup is always kept. Returns deleted names.
+    """
+    retention = retention or RETENTION
+    entries = load_manifest(backup_dir)
+    fulls = sorted((e for e in entries if e["kind"] == "full"), key=lambda e: e["created"], reverse=True)
+    keep = {fulls[0]["name"]} if fulls else set()
+    for period, count in retention.items():
+        seen = []
+        for entry in fulls:
+            key = _period_keys(entry["created"])[period]
+            if key in seen:
+                continue
+            if len(seen) >= count:
+                break
+            seen.append(key)
+            keep.add(entry["name"])
+
+    deleted = []
+    kept_entries = []
+    for entry in entries:
+        if entry["base"] in keep:
+            kept_entries.append(entry)
+            continue
+        try:
+            os.remove(os.path.join(backup_dir, entry["name"]))
+        except FileNotFoundError:
+            pass
+        deleted.append(entry["name"])
+    save_manifest(kept_entries, backup_dir)
+    return deleted
+
+
+def restore_chain(entries, target=None):
+    """Manifest entries to restore for target (a backup name; default the newest)"""
+    if not entries:
+        raise ValueError("no backups in the manifest")
+    names = [e["name"] for e in entries]
+    if target is None:
+        end = len(entries) - 1
+    elif target in names:
+        end = names.index(target)
+    else:
+        raise ValueError(f"unknown backup {target}")
+    base = entries[end]["base"]
+    chain = [e for e in entries[:end + 1] if e["base"] == base]
+    if chain[0]["kind"] != "full":
+        raise ValueError(f"full backup {base} is missing from the manifest")
+    return chain
+
+
+def _apply_incremental(conn, path):
+    with gzip.open(path, "rt") as f:
+        header = json.loads(f.readline())
+        columns = header["columns"]
+        placeholders = ", ".join("?" * len(columns))
+        upsert = f"INSERT OR REPLACE INTO {header['table']} ({', '.join(columns)}) VALUES ({placeholders})"
+        delete = f"DELETE FROM {header['table']} WHERE id = ?"
+        for line in f:
+            change = json.loads(line)
+            if change.get("deleted"):
+                conn.execute(delete, (change["id"],))
+            else:
+                conn.execute(upsert, change["row"])
+
+
+def verify_database(path):
+    """Return (ok, message) after an integrity check of a restored database"""
+    conn = sqlite3.connect(path)
+    try:
+        result = conn.execute("PRAGMA integrity_check").fetchone()[0]
+        if result != "ok":
+            return False, result
+        rows = conn.execute(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {TABLE}").fetchone()
+        return True, f"{rows[0]} rows, max id {rows[1]}"
+    except sqlite3.Error as e:
+        return False, str(e)
+    finally:
+        conn.close()
+
+
+def restore(dest, backup_dir=BACKUP_DIR, target=None, overwrite=False, archive_dir=ARCHIVE_DIR):
+    """Rebuild a database at dest from a full backup and its incrementals
+
+    Every file is checked against its manifest checksum before use, and the
+    result must pass PRAGMA integrity_check before it is moved into place.
+    Returns the verification message. Take a full backup after restoring
+    into the live path, since the change log restarts from the restore.
+    """
+    if os.path.exists(dest) and not overwrite:
+        raise ValueError(f"{dest} already exists")
+    chain = restore_chain(load_manifest(backup_dir), target)
+    for entry in chain:
+        path = os.path.join(backup_dir, entry["name"])
+        if sha256_file(path) != entry["sha256"]:
+            raise ValueError(f"checksum mismatch for {entry['name']}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    tmp_path = dest + ".restoring"
+    with gzip.open(os.path.join(backup_dir, chain[0]["name"]), "rb") as f_in, open(tmp_path, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out, 1 << 20)
+    conn = sqlite3.connect(tmp_path)
+    try:
+        with conn:
+            for entry in chain[1:]:
+                _apply_incremental(conn, os.path.join(backup_dir, entry["name"]))
+        if len(chain) > 1:
+            # Replayed rows went through the summary triggers again
+            rebuild_summaries(conn, archive_dir)
+    finally:
+        conn.close()
+
+    ok, message = verify_database(tmp_path)
+    if not ok:
+        os.remove(tmp_path)
+        raise ValueError(f"restored database failed verification: {message}")
+    for suffix in ("-wal", "-shm"):
+        if os.path.exists(dest + suffix):
+            os.remove(dest + suffix)
+    os.replace(tmp_path, dest)
+    return message
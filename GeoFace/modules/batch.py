@@ -0,0 +1,209 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from modules.buffers import to_rgb
+from modules.database import add_attendance_records_bulk, init_db
+from modules.detection import detect_and_encode
+from modules.matcher import GalleryMatcher
+
+VIDEO_EXTENSIONS = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.mpg', '.mpeg', '.wmv')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp')
+EVENT_FIELDS = ["source", "frame", "time_s", "top", "right", "bottom", "left",
+                "label", "distance", "margin"]
+
+# Per-process state set up by _init_worker
+_worker = {}
+
+
+def collect_sources(paths):
+    """Expand CLI paths into (kind, path) sources: video files and image folders"""
+    sources = []
+    for path in paths:
+        if os.path.isdir(path):
+            images = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+            if images:
+                sources.append(("images", path))
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(VIDEO_EXTENSIONS):
+                    sources.append(("video", os.path.join(path, name)))
+        elif path.lower().endswith(VIDEO_EXTENSIONS):
+            sources.append(("video", path))
+        else:
+            print(f"Skipping unsupported source {path}")
+    return sources
+
+
+def plan_work(sources, chunk_frames=500, every=1):
+    """Split sources into independent (kind, path, start, stop, every) units"""
+    units = []
+    for kind, path in sources:
+        if kind == "images":
+            total = len([n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS)])
+        else:
+            cap = cv2.VideoCapture(path)
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            cap.release()
+            if total <= 0:
+                # Unknown length (some containers): process as one unit
+                units.append((kind, path, 0, None, every))
+                continue
+        for start in range(0, total, chunk_frames):
+            units.append((kind, path, start, min(start + chunk_frames, total), every))
+    return units
+
+
+def _init_worker(encodings, labels, tolerance, detection):
+    _worker["matcher"] = GalleryMatcher(encodings, labels, tolerance)
+    _worker["detection"] = detection or {}
+
+
+def _frames(kind, path, start, stop, every):
+    """Yield (frame index, seconds, BGR frame) for one work unit"""
+    if kind == "images":
+        names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+        # Sample on the global index so chunk boundaries do not shift the stride
+        first = start + (-start) % every
+        for index in range(first, stop, every):
+            frame = cv2.imread(os.path.join(path, names[index]))
+            if frame is not None:
+                yield index, None, frame
+        return
+
+    cap = cv2.VideoCapture(path)
+    fps = cap.get(cv2.CAP_PROP_FPS) or 0.0
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    index = start
+    try:
+        while stop is None or index < stop:
+            if index % every:
+                if not cap.grab():
+                    break
+            else:
+                ret, frame = cap.read()
+                if not ret:
+                    break
+                yield index, (index / fps if fps else None), frame
+            index += 1
+    finally:
+        cap.release()
+
+
+def _process_unit(unit):
+    """Worker: run detect -> encode -> match over one unit"""
+    kind, path, start, stop, every = unit
+    matcher = _worker["matcher"]
+    detection = _worker["detection"]
+    events = []
+    frames = 0
+    for index, seconds, frame in _frames(kind, path, start, stop, every):
+        frames += 1
+        rgb = to_rgb(frame)
+        locations, encodings = detect_and_encode(rgb, **detection)
+        for (top, right, bottom, left), match in zip(locations, matcher.match(encodings)):
+            events.append({
+                "source": path, "frame": index,
+                "time_s": round(seconds, 3) if seconds is not None else None,
+                "top": top, "right": right, "bottom": bottom, "left": left,
+                "label": match.label, "distance": round(match.distance, 4),
+                "margin": round(match.margin, 4) if match.margin != float("inf") else None,
+            })
+    return frames, events
+
+
+class JsonlWriter:
+    def __init__(self, path):
+        self.file = open(path, "w")
+
+    def write(self, event):
+        self.file.write(json.dumps(event) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CsvWriter:
+    def __init__(self, path):
+        self.file = open(path, "w", newline="")
+        self.writer = csv.DictWriter(self.file, fieldnames=EVENT_FIELDS)
+        self.writer.writeheader()
+
+    def write(self, event):
+        self.writer.writerow(event)
+
+    def close(self):
+        self.file.close()
+
+
+class AttendanceWriter:
+    """Insert recognized people into the attendance table
+
+    A person is recorded at most once per source within cooldown_s
+    seconds of video time, so a long visit produces one row rather than
+    thousands. Events without a timestamp (image folders, or videos whose
+    frame rate is unknown) have no time base and are all recorded.
+    Rows are committed in batches of flush_every.
+    """
+
+    def __init__(self, cooldown_s=300.0, flush_every=500):
+        init_db()
+        self.cooldown_s = cooldown_s
+        self.flush_every = flush_every
+        self.last_seen = {}
+        self.pending = []
+
+    def write(self, event):
+        if event["label"] is None:
+            return
+        when = event["time_s"]
+        if when is not None:
+            key = (event["source"], event["label"])
+            last = self.last_seen.get(key)
+            if last is not None and when - last < self.cooldown_s:
+                return
+            self.last_seen[key] = when
+        self.pending.append((event["label"], None, None, os.path.basename(event["source"]), event["source"]))
+        if len(self.pending) >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        add_attendance_records_bulk(self.pending)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+
+
+def open_writer(output):
+    """Pick a writer from the output argument: *.jsonl, *.csv or 'db'"""
+    if output == "db":
+        return AttendanceWriter()
+    if output.lower().endswith(".csv"):
+        return CsvWriter(output)
+    return JsonlWriter(output)
+
+
+def run_batch(units, encodings, labels, writer, tolerance=0.6, detection=None, workers=None):
+    """Process work units on a process pool; events are written in input order"""
+    frames = faces = 0
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(encodings, labels, tolerance, detection)) as pool:
+        for unit_frames, events in pool.map(_process_unit, units):
+            frames += unit_frames
+            faces += len(events)
+            for event in events:
+                writer.write(event)
+    elapsed = time.perf_counter() - start
+    return {
+        "frames": frames,
+        "faces": faces,
+        "seconds": round(elapsed, 2),
+        "frames_per_sec": round(frames / elapsed, 2) if elapsed else 0.0,
+        "faces_per_sec": round(faces / elapsed, 2) if elapsed else 0.0,
+    }
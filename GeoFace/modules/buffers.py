@@ -0,0 +1,117 @@
+import threading
+
+import cv2
+import numpy as np
+
+from modules.metrics import metrics
+
+
+class BufferPool:
+    """Named, reusable frame buffers for one thread
+
+    get() hands back the same array for a name as long as the requested
+    shape and dtype stay the same, so per-frame conversions can write into
+    it with dst= instead of allocating. A buffer is only valid until the
+    next get() of the same name: copy anything that must outlive the frame.
+    """
+
+    def __init__(self):
+        self._buffers = {}
+        self.allocations = 0
+        self.reuses = 0
+        self.allocated_bytes = 0
+
+    def get(self, name, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        buf = self._buffers.get(name)
+        if buf is not None and buf.shape == shape and buf.dtype == dtype:
+            self.reuses += 1
+            return buf
+        buf = self._buffers[name] = np.empty(shape, dtype)
+        self.allocations += 1
+        self.allocated_bytes += buf.nbytes
+        metrics.incr("buffer_allocations")
+        return buf
+
+    def nbytes(self):
+        return sum(buf.nbytes for buf in self._buffers.values())
+
+    def stats(self):
+        return {
+            "buffers": len(self._buffers),
+            "bytes": self.nbytes(),
+            "allocations": self.allocations,
+            "reuses": self.reuses,
+            "allocated_bytes": self.allocated_bytes,
+        }
+
+
+_local = threading.local()
+
+
+def get_buffer_pool():
+    """The calling thread's pool (capture, recognition and Tk threads each get their own)"""
+    pool = getattr(_local, "pool", None)
+    if pool is None:
+        pool = _local.pool = BufferPool()
+    return pool
+
+
+def to_rgb(frame, pool=None, name="rgb"):
+    """Contiguous uint8 RGB version of a BGR, BGRA or gray frame, in a pooled buffer
+
+    Unlike frame[:, :, ::-1] the result has positive strides, so dlib uses
+    it as-is instead of copying it again.
+    """
+    pool = pool or get_buffer_pool()
+    if frame.dtype != np.uint8:
+        staged = pool.get(name + "_uint8", frame.shape)
+        np.copyto(staged, frame, casting="unsafe")
+        frame = staged
+    if frame.ndim == 2:
+        code = cv2.COLOR_GRAY2RGB
+    elif frame.shape[2] == 4:
+        code = cv2.COLOR_BGRA2RGB
+    elif frame.shape[2] == 3:
+        code = cv2.COLOR_BGR2RGB
+    else:
+        raise ValueError(f"unsupported frame shape {frame.shape}")
+    rgb = pool.get(name, frame.shape[:2] + (3,))
+    cv2.cvtColor(frame, code, dst=rgb)
+    return rgb
+
+
+def to_gray(frame, pool=None, name="gray"):
+    """uint8 grayscale version of a BGR (or already gray) frame, in a pooled buffer"""
+    if frame.ndim == 2:
+        return frame
+    pool = pool or get_buffer_pool()
+    gray = pool.get(name, frame.shape[:2])
+    cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY, dst=gray)
+    return gray
+
+
+def resize_into(image, size, pool=None, name="resized", interpolation=cv2.INTER_AREA):
+    """image resized to size (width, height), in a pooled buffer"""
+    pool = pool or get_buffer_pool()
+    width, height = size
+    out = pool.get(name, (height, width) + image.shape[2:], image.dtype)
+    cv2.resize(image, size, dst=out, interpolation=interpolation)
+    return out
+
+
+def scale_into(image, scale, pool=None, name="scaled", interpolation=cv2.INTER_AREA):
+    """image resized by scale, like cv2.resize(image, (0, 0), fx=scale, fy=scale), in a pooled buffer"""
+    pool = pool or get_buffer_pool()
+    height, width = image.shape[:2]
+    # OpenCV rounds the scaled size to nearest; the same size keeps dst in use
+    out = pool.get(name, (int(round(height * scale)), int(round(width * scale))) + image.shape[2:], image.dtype)
+    return cv2.resize(image, (0, 0), dst=out, fx=scale, fy=scale, interpolation=interpolation)
+
+
+def copy_into(image, pool=None, name="copy"):
+    """A copy of image in a pooled buffer (e.g. a frame to draw on for display)"""
+    pool = pool or get_buffer_pool()
+    out = pool.get(name, image.shape, image.dtype)
+    np.copyto(out, image)
+    return out
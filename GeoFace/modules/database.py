@@ -1,11 +1,227 @@
 import sqlite3
 import os
+import threading
 from datetime import datetime
+from modules.metrics import metrics
+
+DB_PATH = os.path.join("database", "attendance.db")
+
+# Applied to every new connection. WAL lets readers (the GUI log) run while
+# the recognition loop writes; synchronous=NORMAL is durable across app
+# crashes in WAL mode and only fsyncs at checkpoints.
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA foreign_keys=ON",
+)
+# Prepared statements kept per connection by the sqlite3 module
+STATEMENT_CACHE_SIZE = 256
+
+INSERT_SQL = '''
+    INSERT INTO attendance (employee_name, latitude, longitude, location_name, image_path, site_id, in_fence)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+'''
+SELECT_ALL_SQL = "SELECT * FROM attendance"
+
+# Columns added after the original schema, created on older databases by init_db()
+ADDED_COLUMNS = (
+    ("site_id", "TEXT"),
+    ("in_fence", "INTEGER"),
+    ("event_type", "TEXT"),
+    ("day", "TEXT"),
+)
+
+# Row-level change log read by incremental backups (modules/backup.py)
+CHANGELOG_DDL = (
+    '''CREATE TABLE IF NOT EXISTS attendance_changelog (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        row_id INTEGER NOT NULL,
+        op TEXT NOT NULL
+    )''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_changelog_insert AFTER INSERT ON attendance
+    BEGIN INSERT INTO attendance_changelog (row_id, op) VALUES (NEW.id, 'I'); END''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_changelog_update AFTER UPDATE ON attendance
+    BEGIN INSERT INTO attendance_changelog (row_id, op) VALUES (NEW.id, 'U'); END''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_changelog_delete AFTER DELETE ON attendance
+    BEGIN INSERT INTO attendance_changelog (row_id, op) VALUES (OLD.id, 'D'); END''',
+)
+
+def _refresh_daily_sql(row):
+    """Trigger statements recomputing the attendance_daily row of OLD or NEW
+
+    The daily row is deleted and re-inserted from the raw rows left for that
+    employee and day (none if the last one is gone), so the monthly triggers
+    see the change as one day removed and one added.
+    """
+    day = f"COALESCE({row}.day, date({row}.timestamp))"
+    # Same rows as COALESCE(day, date(timestamp)) = day, but the columns stay indexable
+    key = (f"employee_name = {row}.employee_name "
+           f"AND (day = {day} OR (day IS NULL AND date(timestamp) = {day}))")
+    return f'''
+        DELETE FROM attendance_daily WHERE employee_name = {row}.employee_name AND day = {day};
+        INSERT INTO attendance_daily (employee_name, day, first_in, last_out, count, site_id)
+        SELECT employee_name, {day}, MIN(timestamp), MAX(timestamp), COUNT(*),
+               (SELECT site_id FROM attendance WHERE {key} ORDER BY timestamp LIMIT 1)
+        FROM attendance WHERE {key} GROUP BY employee_name;'''
+
+# Per-employee daily and monthly summaries for reporting (modules/reporting.py),
+# kept current by triggers as attendance rows are written. A row's day is
+# its local day column, or the UTC date of its timestamp for older rows.
+SUMMARY_DDL = (
+    '''CREATE TABLE IF NOT EXISTS attendance_daily (
+        employee_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        first_in DATETIME,
+        last_out DATETIME,
+        count INTEGER NOT NULL DEFAULT 0,
+        site_id TEXT,
+        PRIMARY KEY (employee_name, day)
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_attendance_daily_day ON attendance_daily (day)",
+    '''CREATE TABLE IF NOT EXISTS attendance_monthly (
+        employee_name TEXT NOT NULL,
+        month TEXT NOT NULL,
+        days INTEGER NOT NULL DEFAULT 0,
+        count INTEGER NOT NULL DEFAULT 0,
+        seconds REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (employee_name, month)
+    )''',
+    "CREATE INDEX IF NOT EXISTS idx_attendance_monthly_month ON attendance_monthly (month)",
+    '''CREATE TRIGGER IF NOT EXISTS attendance_daily_insert AFTER INSERT ON attendance
+    BEGIN
+        INSERT INTO attendance_daily (employee_name, day, first_in, last_out, count, site_id)
+        VALUES (NEW.employee_name, COALESCE(NEW.day, date(NEW.timestamp)), NEW.timestamp, NEW.timestamp, 1,
+                NEW.site_id)
+        ON CONFLICT (employee_name, day) DO UPDATE SET
+            site_id = CASE WHEN excluded.first_in < first_in THEN excluded.site_id
+                           ELSE COALESCE(site_id, excluded.site_id) END,
+            first_in = min(first_in, excluded.first_in),
+            last_out = max(last_out, excluded.last_out),
+            count = count + 1;
+    END''',
+    # Replaced by attendance_daily_change, which also handles moved rows
+    "DROP TRIGGER IF EXISTS attendance_daily_update",
+    '''CREATE TRIGGER IF NOT EXISTS attendance_daily_change
+    AFTER UPDATE OF employee_name, timestamp, day ON attendance
+    BEGIN''' + _refresh_daily_sql("OLD") + _refresh_daily_sql("NEW") + '''
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_daily_delete AFTER DELETE ON attendance
+    BEGIN''' + _refresh_daily_sql("OLD") + '''
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_monthly_insert AFTER INSERT ON attendance_daily
+    BEGIN
+        INSERT INTO attendance_monthly (employee_name, month, days, count, seconds)
+        VALUES (NEW.employee_name, substr(NEW.day, 1, 7), 1, NEW.count,
+                (julianday(NEW.last_out) - julianday(NEW.first_in)) * 86400)
+        ON CONFLICT (employee_name, month) DO UPDATE SET
+            days = days + 1,
+            count = count + excluded.count,
+            seconds = seconds + excluded.seconds;
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_monthly_update AFTER UPDATE ON attendance_daily
+    BEGIN
+        UPDATE attendance_monthly SET
+            count = count + NEW.count - OLD.count,
+            seconds = seconds + (julianday(NEW.last_out) - julianday(NEW.first_in)) * 86400
+                              - (julianday(OLD.last_out) - julianday(OLD.first_in)) * 86400
+        WHERE employee_name = NEW.employee_name AND month = substr(NEW.day, 1, 7);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS attendance_monthly_delete AFTER DELETE ON attendance_daily
+    BEGIN
+        UPDATE attendance_monthly SET
+            days = days - 1,
+            count = count - OLD.count,
+            seconds = seconds - (julianday(OLD.last_out) - julianday(OLD.first_in)) * 86400
+        WHERE employee_name = OLD.employee_name AND month = substr(OLD.day, 1, 7);
+        DELETE FROM attendance_monthly
+        WHERE employee_name = OLD.employee_name AND month = substr(OLD.day, 1, 7) AND days <= 0;
+    END''',
+)
+# Recompute attendance_daily from the raw rows; the monthly trigger rebuilds
+# attendance_monthly from it. The bare site_id comes from the MIN(timestamp) row.
+SUMMARY_SELECT_SQL = '''
+    SELECT f.employee_name, f.day, f.first_in, l.last_out, f.count, f.site_id
+    FROM (SELECT employee_name, COALESCE(day, date(timestamp)) AS day, MIN(timestamp) AS first_in,
+                 site_id, COUNT(*) AS count
+          FROM attendance GROUP BY 1, 2) f
+    JOIN (SELECT employee_name, COALESCE(day, date(timestamp)) AS day, MAX(timestamp) AS last_out
+          FROM attendance GROUP BY 1, 2) l
+    USING (employee_name, day)
+'''
+SUMMARY_BACKFILL_SQL = (
+    "INSERT INTO attendance_daily (employee_name, day, first_in, last_out, count, site_id)"
+    + SUMMARY_SELECT_SQL)
+
+CHECK_IN = "check_in"
+CHECK_OUT = "check_out"
+# Marks closer together than this are duplicates, even from different kiosks
+MIN_EVENT_GAP_S = 300
+
+LAST_EVENT_SQL = '''
+    SELECT 1 FROM attendance
+    WHERE employee_name = ? AND day = ? AND timestamp > datetime('now', ?)
+    LIMIT 1
+'''
+# The day's check-in and check-out rows are looked up before writing: an
+# INSERT OR IGNORE or upsert that ends up not inserting still uses up an
+# AUTOINCREMENT id, which would leave gaps in the id sequence
+DAY_EVENTS_SQL = '''
+    SELECT event_type, id FROM attendance
+    WHERE employee_name = ? AND day = ? AND event_type IN ('check_in', 'check_out')
+'''
+EVENT_INSERT_SQL = '''
+    INSERT INTO attendance (employee_name, latitude, longitude, location_name, image_path,
+                            site_id, in_fence, day, event_type)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+'''
+# The day's check-out is a single row moved forward by each later mark
+CHECK_OUT_UPDATE_SQL = '''
+    UPDATE attendance SET
+        latitude = ?,
+        longitude = ?,
+        location_name = ?,
+        image_path = ?,
+        site_id = ?,
+        in_fence = ?,
+        timestamp = CURRENT_TIMESTAMP
+    WHERE id = ?
+'''
+
+# Rows per page for query_records() and per fetch for iter_records()
+PAGE_SIZE = 500
+
+# One connection per (thread, database file); sqlite3 connections must not
+# be shared across threads
+_local = threading.local()
+
+def get_connection(path=None):
+    """Return the calling thread's long-lived connection to the database"""
+    path = os.path.abspath(path or DB_PATH)
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=5.0, cached_statements=STATEMENT_CACHE_SIZE)
+        for pragma in PRAGMAS:
+            conn.execute(pragma)
+        connections[path] = conn
+    return conn
+
+def close_connections():
+    """Close the calling thread's connections (call before a worker thread exits)"""
+    connections = getattr(_local, "connections", None) or {}
+    for conn in connections.values():
+        conn.close()
+    connections.clear()
 
 def init_db():
     """Initialize the SQLite database"""
-    os.makedirs("database", exist_ok=True)
-    conn = sqlite3.connect("database/attendance.db")
+    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+    conn = get_connection()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -16,32 +232,195 @@ def init_db():
             longitude REAL,
             location_name TEXT,
             timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-            image_path TEXT
+            image_path TEXT,
+            site_id TEXT,
+            in_fence INTEGER,
+            event_type TEXT,
+            day TEXT
         )
     ''')
+    existing = {row[1] for row in cursor.execute("PRAGMA table_info(attendance)")}
+    for column, sql_type in ADDED_COLUMNS:
+        if column not in existing:
+            cursor.execute(f"ALTER TABLE attendance ADD COLUMN {column} {sql_type}")
+    # Both indexes end in the rowid, so employee filters can page by id
+    # and date ranges are range scans instead of full-table scans
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_employee ON attendance (employee_name)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_attendance_timestamp ON attendance (timestamp)")
+    # At most one check-in and one check-out per employee and day. Rows
+    # without a day (older rows, batch imports) are not constrained.
+    cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_attendance_daily_event "
+                   "ON attendance (employee_name, day, event_type)")
+    for ddl in CHANGELOG_DDL:
+        cursor.execute(ddl)
+    has_summaries = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'attendance_daily'").fetchone()
+    for ddl in SUMMARY_DDL:
+        cursor.execute(ddl)
+    if not has_summaries:
+        # First run with reporting: summarise the rows written before it existed
+        cursor.execute(SUMMARY_BACKFILL_SQL)
     conn.commit()
-    conn.close()
 
-def add_attendance_record(name, lat, lon, place, img_path):
-    """Add a new attendance record to the database"""
-    conn = sqlite3.connect("database/attendance.db")
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        INSERT INTO attendance (employee_name, latitude, longitude, location_name, image_path)
-        VALUES (?, ?, ?, ?, ?)
-    ''', (name, lat, lon, place, img_path))
-    
-    conn.commit()
-    conn.close()
+def _in_fence_value(in_fence):
+    return None if in_fence is None else int(bool(in_fence))
+
+def add_attendance_record(name, lat, lon, place, img_path, site_id=None, in_fence=None):
+    """Add a new attendance record to the database
+
+    site_id and in_fence come from the geofence check; None means unknown.
+    """
+    with metrics.stage("db_insert"):
+        conn = get_connection()
+        with conn:
+            conn.execute(INSERT_SQL, (name, lat, lon, place, img_path, site_id, _in_fence_value(in_fence)))
+
+def record_attendance_event(name, lat, lon, place, img_path, site_id=None, in_fence=None,
+                            day=None, min_gap_s=MIN_EVENT_GAP_S):
+    """Record a check-in or check-out, guarded by the daily unique index
+
+    The first mark of the (local) day is the check-in; later marks move
+    the day's single check-out forward. Returns CHECK_IN, CHECK_OUT, or
+    None when the employee was already marked within min_gap_s (by any
+    process sharing the database).
+    """
+    day = day or datetime.now().strftime("%Y-%m-%d")
+    values = (name, lat, lon, place, img_path, site_id, _in_fence_value(in_fence), day)
+    with metrics.stage("db_insert"):
+        conn = get_connection()
+        # IMMEDIATE takes the write lock up front, so the gap check and the
+        # write are atomic across kiosk processes
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute(LAST_EVENT_SQL, (name, day, f"-{int(min_gap_s)} seconds")).fetchone():
+                event = None
+            else:
+                existing = dict(conn.execute(DAY_EVENTS_SQL, (name, day)).fetchall())
+                if CHECK_IN not in existing:
+                    event = CHECK_IN
+                    conn.execute(EVENT_INSERT_SQL, values + (CHECK_IN,))
+                elif CHECK_OUT not in existing:
+                    event = CHECK_OUT
+                    conn.execute(EVENT_INSERT_SQL, values + (CHECK_OUT,))
+                else:
+                    event = CHECK_OUT
+                    conn.execute(CHECK_OUT_UPDATE_SQL, values[1:7] + (existing[CHECK_OUT],))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    metrics.incr(f"attendance_{event}" if event else "attendance_suppressed_db")
+    return event
+
+def add_attendance_records_bulk(records):
+    """Insert (name, lat, lon, place, img_path[, site_id, in_fence]) tuples in a single transaction
+
+    Returns the number of rows written. Either every row is committed or,
+    if one fails, none are.
+    """
+    records = [tuple(r[:5]) + (r[5] if len(r) > 5 else None,
+                               _in_fence_value(r[6]) if len(r) > 6 else None) for r in records]
+    if not records:
+        return 0
+    with metrics.stage("db_insert_bulk"):
+        conn = get_connection()
+        with conn:
+            conn.executemany(INSERT_SQL, records)
+    metrics.incr("db_rows_inserted", len(records))
+    return len(records)
+
+def _timestamp(value):
+    """Format a date, datetime or string bound like the timestamp column (UTC)"""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if hasattr(value, "strftime"):
+        return value.strftime("%Y-%m-%d 00:00:00")
+    return value
+
+def _where(employee=None, start=None, end=None, after_id=None, before_id=None):
+    """Build a WHERE clause and parameters for the record filters"""
+    clauses, params = [], []
+    if employee is not None:
+        clauses.append("employee_name = ?")
+        params.append(employee)
+    if start is not None:
+        clauses.append("timestamp >= ?")
+        params.append(_timestamp(start))
+    if end is not None:
+        clauses.append("timestamp < ?")
+        params.append(_timestamp(end))
+    if after_id is not None:
+        clauses.append("id > ?")
+        params.append(after_id)
+    if before_id is not None:
+        clauses.append("id < ?")
+        params.append(before_id)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+def query_records(employee=None, start=None, end=None, before_id=None, after_id=None,
+                  limit=PAGE_SIZE, newest_first=True):
+    """Return one page of attendance records matching the filters
+
+    Pages are keyset-based: pass the smallest id of the previous page as
+    before_id (newest_first) or the largest as after_id (oldest first) to
+    get the next page. start is inclusive and end exclusive; both take a
+    date, datetime or 'YYYY-MM-DD HH:MM:SS' string in UTC.
+    """
+    where, params = _where(employee, start, end, after_id, before_id)
+    order = "DESC" if newest_first else "ASC"
+    with metrics.stage("db_query"):
+        cursor = get_connection().execute(
+            f"SELECT * FROM attendance{where} ORDER BY id {order} LIMIT ?", params + [limit])
+        records = cursor.fetchall()
+    return records
+
+def get_records_since(last_id, limit=PAGE_SIZE):
+    """Return records with id greater than last_id, oldest first"""
+    return query_records(after_id=last_id, limit=limit, newest_first=False)
+
+def get_changelog_seq():
+    """Newest attendance change-log sequence number (0 when empty)"""
+    return get_connection().execute("SELECT COALESCE(MAX(seq), 0) FROM attendance_changelog").fetchone()[0]
+
+def get_updated_records_since(seq):
+    """Return (newest seq, records updated after change-log seq), in change order
+
+    Covers rows changed in place, e.g. a check-out that moves the timestamp
+    of an existing row; new rows come from get_records_since().
+    """
+    conn = get_connection()
+    newest = get_changelog_seq()
+    rows = conn.execute('''
+        SELECT a.* FROM attendance a
+        JOIN (SELECT row_id, MAX(seq) AS seq FROM attendance_changelog
+              WHERE seq > ? AND seq <= ? AND op = 'U' GROUP BY row_id) c ON a.id = c.row_id
+        ORDER BY c.seq
+    ''', (seq, newest)).fetchall()
+    return newest, rows
+
+def iter_records(employee=None, start=None, end=None, batch_size=PAGE_SIZE):
+    """Yield every matching record in id order, fetching batch_size rows at a time
+
+    Only one batch is held in memory, so exports of large tables stay
+    flat in memory use.
+    """
+    last_id = 0
+    while True:
+        batch = query_records(employee, start, end, after_id=last_id, limit=batch_size, newest_first=False)
+        yield from batch
+        if len(batch) < batch_size:
+            return
+        last_id = batch[-1][0]
+
+def count_records(employee=None, start=None, end=None):
+    """Number of records matching the filters"""
+    where, params = _where(employee, start, end)
+    with metrics.stage("db_query"):
+        return get_connection().execute(f"SELECT COUNT(*) FROM attendance{where}", params).fetchone()[0]
 
 def get_all_records():
-    """Retrieve all attendance records"""
-    conn = sqlite3.connect("database/attendance.db")
-    cursor = conn.cursor()
-    
-    cursor.execute("SELECT * FROM attendance")
-    records = cursor.fetchall()
-    
-    conn.close()
-    return records
\ No newline at end of file
+    """Retrieve all attendance records
+
+    Materialises the whole table; prefer query_records() or iter_records().
+    """
+    return list(iter_records())
\ No newline at end of file
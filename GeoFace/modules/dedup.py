@@ -0,0 +1,63 @@
+import threading
+import time
+from collections import OrderedDict
+
+from modules.metrics import metrics
+
+# Seconds after a mark during which the same employee is not marked again
+COOLDOWN_S = 300.0
+# Employees remembered at once; the least recently marked are forgotten first
+MAX_ENTRIES = 4096
+
+
+class AttendanceCooldown:
+    """Per-employee cooldown held in a bounded LRU/TTL map
+
+    allow(name) reserves a mark for name and returns True, or returns
+    False (counted as suppressed) if name was marked within cooldown_s.
+    Because every accepted mark moves its entry to the end, the map is
+    ordered by mark time and expired entries are dropped from the front.
+    """
+
+    def __init__(self, cooldown_s=COOLDOWN_S, max_entries=MAX_ENTRIES, clock=time.monotonic):
+        self.cooldown_s = cooldown_s
+        self.max_entries = max_entries
+        self.clock = clock
+        self.accepted = 0
+        self.suppressed = 0
+        self._marked = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now):
+        while self._marked:
+            name, marked_at = next(iter(self._marked.items()))
+            if now - marked_at < self.cooldown_s and len(self._marked) <= self.max_entries:
+                break
+            self._marked.popitem(last=False)
+
+    def allow(self, name):
+        now = self.clock()
+        with self._lock:
+            self._expire(now)
+            if name in self._marked:
+                self.suppressed += 1
+                metrics.incr("attendance_suppressed")
+                return False
+            self._marked[name] = now
+            self.accepted += 1
+            self._expire(now)
+            return True
+
+    def release(self, name):
+        """Undo a reservation whose mark did not go through"""
+        with self._lock:
+            if self._marked.pop(name, None) is not None:
+                self.accepted -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "accepted": self.accepted,
+                "suppressed": self.suppressed,
+                "tracked": len(self._marked),
+            }
@@ -0,0 +1,82 @@
+import numpy as np
+
+from modules.buffers import scale_into
+from modules.metrics import metrics
+
+# face_recognition (dlib and its model files) takes seconds to import, so it
+# is imported on first use; modules.startup loads it on a background thread
+
+# Detection runs on a frame resized by this factor (1.0 = full resolution)
+DETECTION_SCALE = 0.5
+# HOG upsampling passes on the resized frame; each pass halves the smallest
+# detectable face (dlib's HOG window is ~80 px) at roughly 4x the cost
+UPSAMPLE = 1
+# Faces smaller than this (in full-frame pixels) are ignored
+MIN_FACE_SIZE = 40
+DETECTION_MODEL = "hog"
+# Context kept around a face when cropping it for landmarks and encoding
+CROP_MARGIN = 0.25
+
+
+def smallest_detectable_face(scale=DETECTION_SCALE, upsample=UPSAMPLE):
+    """Approximate smallest face (full-frame pixels) the HOG detector can find"""
+    return int(80 / (scale * (2 ** upsample)))
+
+
+def locate_faces(rgb, scale=DETECTION_SCALE, upsample=UPSAMPLE, min_face_size=MIN_FACE_SIZE,
+                 model=DETECTION_MODEL):
+    """Detect faces on a downscaled copy of rgb (a pooled buffer of the calling thread)
+
+    Returns (top, right, bottom, left) boxes in full-frame coordinates,
+    clipped to the frame and filtered by min_face_size.
+    """
+    height, width = rgb.shape[:2]
+    if scale != 1.0:
+        small = scale_into(rgb, scale, name="detect_small")
+    else:
+        small = rgb
+
+    import face_recognition
+
+    locations = []
+    with metrics.stage("detect"):
+        detected = face_recognition.face_locations(small, upsample, model)
+    for top, right, bottom, left in detected:
+        top = max(0, int(round(top / scale)))
+        right = min(width, int(round(right / scale)))
+        bottom = min(height, int(round(bottom / scale)))
+        left = max(0, int(round(left / scale)))
+        if min(bottom - top, right - left) >= min_face_size:
+            locations.append((top, right, bottom, left))
+    return locations
+
+
+def face_crop(rgb, location, margin=CROP_MARGIN):
+    """Return a contiguous crop around a face and the box relative to it"""
+    height, width = rgb.shape[:2]
+    top, right, bottom, left = location
+    pad_y = int((bottom - top) * margin)
+    pad_x = int((right - left) * margin)
+    y0, y1 = max(0, top - pad_y), min(height, bottom + pad_y)
+    x0, x1 = max(0, left - pad_x), min(width, right + pad_x)
+    crop = np.ascontiguousarray(rgb[y0:y1, x0:x1])
+    return crop, (top - y0, right - x0, bottom - y0, left - x0)
+
+
+def encode_faces(rgb, locations, num_jitters=1):
+    """Encode faces at full resolution, one crop per known location"""
+    import face_recognition
+
+    encodings = []
+    with metrics.stage("encode"):
+        for location in locations:
+            crop, box = face_crop(rgb, location)
+            encodings.extend(face_recognition.face_encodings(crop, [box], num_jitters))
+    return encodings
+
+
+def detect_and_encode(rgb, scale=DETECTION_SCALE, upsample=UPSAMPLE, min_face_size=MIN_FACE_SIZE,
+                      model=DETECTION_MODEL):
+    """Shared detection stage: downscaled detection, full-resolution encoding"""
+    locations = locate_faces(rgb, scale, upsample, min_face_size, model)
+    return locations, encode_faces(rgb, locations)
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# Bump when the on-disk layout changes; old files are rebuilt from scratch.
+CACHE_VERSION = 1
+CACHE_DIR = "cache"
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """Return the SHA-1 hex digest of a file's contents"""
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def file_fingerprint(path, with_digest=False):
+    """Return the (size, mtime_ns[, sha1]) fingerprint used as cache key"""
+    st = os.stat(path)
+    if with_digest:
+        return st.st_size, st.st_mtime_ns, file_digest(path)
+    return st.st_size, st.st_mtime_ns
+
+
+class EncodingCache:
+    """Per-image face encoding cache stored as a single .npz file.
+
+    Entries are keyed by image path and validated against the file's size,
+    mtime and content hash. The hash is only recomputed when size or mtime
+    changed (or when verify_hashes is set), so an unchanged gallery loads
+    without reading any image. A model tag mismatch discards the whole file.
+    """
+
+    def __init__(self, cache_path, model_tag, rebuild=False, verify_hashes=False):
+        self.cache_path = cache_path
+        self.model_tag = model_tag
+        self.verify_hashes = verify_hashes
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self.dirty = False
+        if not rebuild:
+            self._load()
+        else:
+            self.dirty = True
+
+    def _load(self):
+        if not os.path.isfile(self.cache_path):
+            return
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                version = int(data["version"])
+                model_tag = str(data["model"])
+                manifest = json.loads(str(data["manifest"]))
+                encodings = data["encodings"]
+        except Exception as e:
+            print(f"Ignoring unreadable encoding cache {self.cache_path}: {str(e)}")
+            self.dirty = True
+            return
+
+        if version != CACHE_VERSION or model_tag != self.model_tag:
+            print(f"Encoding cache {self.cache_path} is stale, rebuilding")
+            self.dirty = True
+            return
+
+        for path, meta in manifest.items():
+            row = meta["row"]
+            meta["encoding"] = None if row is None else encodings[row]
+            self.entries[path] = meta
+
+    def lookup(self, path):
+        """Return (hit, encoding) for an image without computing anything"""
+        key = os.path.normpath(path)
+        meta = self.entries.get(key)
+        if meta is None:
+            return False, None
+        try:
+            size, mtime_ns = file_fingerprint(path)
+        except OSError:
+            return False, None
+
+        if size == meta["size"] and mtime_ns == meta["mtime_ns"] and not self.verify_hashes:
+            return True, meta["encoding"]
+        if size != meta["size"]:
+            return False, None
+        # Touched but maybe not modified (copy, checkout): fall back to the hash
+        if file_digest(path) == meta["sha1"]:
+            if mtime_ns != meta["mtime_ns"]:
+                meta["mtime_ns"] = mtime_ns
+                self.dirty = True
+            return True, meta["encoding"]
+        return False, None
+
+    def store(self, path, encoding, fingerprint=None):
+        """Record the encoding (or None for 'no face') computed for an image"""
+        if fingerprint is None:
+            fingerprint = file_fingerprint(path, with_digest=True)
+        size, mtime_ns, sha1 = fingerprint
+        self.entries[os.path.normpath(path)] = {
+            "size": size,
+            "mtime_ns": mtime_ns,
+            "sha1": sha1,
+            "encoding": None if encoding is None else np.asarray(encoding, dtype=np.float64),
+        }
+        self.dirty = True
+
+    def encode(self, path, compute):
+        """Return the cached encoding for path, calling compute(path) on a miss"""
+        hit, encoding = self.lookup(path)
+        if hit:
+            self.hits += 1
+            return encoding
+
+        self.misses += 1
+        fingerprint = file_fingerprint(path, with_digest=True)
+        encoding = compute(path)
+        self.store(path, encoding, fingerprint)
+        return encoding
+
+    def prune(self, keep_paths):
+        """Drop entries for images that no longer exist in the gallery"""
+        keep = {os.path.normpath(p) for p in keep_paths}
+        for path in list(self.entries):
+            if path not in keep:
+                del self.entries[path]
+                self.dirty = True
+
+    def save(self):
+        """Atomically write the cache file if anything changed"""
+        if not self.dirty:
+            return
+        manifest = {}
+        rows = []
+        for path, meta in self.entries.items():
+            encoding = meta["encoding"]
+            row = None
+            if encoding is not None:
+                row = len(rows)
+                rows.append(encoding)
+            manifest[path] = {
+                "size": meta["size"],
+                "mtime_ns": meta["mtime_ns"],
+                "sha1": meta["sha1"],
+                "row": row,
+            }
+        encodings = np.vstack(rows) if rows else np.zeros((0, 128))
+
+        cache_dir = os.path.dirname(self.cache_path)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                version=np.array(CACHE_VERSION),
+                model=np.array(self.model_tag),
+                manifest=np.array(json.dumps(manifest)),
+                encodings=encodings,
+            )
+        os.replace(tmp_path, self.cache_path)
+        self.dirty = False
@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from modules.encoding_cache import EncodingCache, file_fingerprint
+import face_utils
+
+# One row per enrollment image; encoding is None when error is set
+ImageResult = namedtuple("ImageResult", ["emp_id", "path", "encoding", "error", "seconds", "worker"])
+
+
+def _encode_chunk(chunk):
+    """Worker: encode (emp_id, path) pairs and report per-image errors"""
+    results = []
+    for emp_id, path in chunk:
+        start = time.perf_counter()
+        fingerprint = None
+        try:
+            fingerprint = file_fingerprint(path, with_digest=True)
+            encoding, error = face_utils.encode_employee_image_checked(path)
+        except Exception as e:
+            encoding, error = None, str(e)
+        results.append((ImageResult(emp_id, path, encoding, error, time.perf_counter() - start, os.getpid()),
+                        fingerprint))
+    return results
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class EnrollmentReport:
+    """Outcome of a bulk enrollment run"""
+
+    def __init__(self):
+        self.results = []
+        self.cached = 0
+        self.elapsed = 0.0
+        self.worker_images = defaultdict(int)
+        self.worker_seconds = defaultdict(float)
+
+    @property
+    def errors(self):
+        return [r for r in self.results if r.error]
+
+    def add(self, result):
+        self.results.append(result)
+        self.worker_images[result.worker] += 1
+        self.worker_seconds[result.worker] += result.seconds
+
+    def summary(self):
+        encoded = len(self.results)
+        lines = [
+            f"Images: {encoded + self.cached} total, {self.cached} from cache, "
+            f"{encoded} encoded, {len(self.errors)} failed",
+            f"Wall time: {self.elapsed:.1f}s "
+            f"({encoded / self.elapsed if self.elapsed else 0.0:.1f} images/sec overall)",
+        ]
+        for worker in sorted(self.worker_images):
+            images = self.worker_images[worker]
+            seconds = self.worker_seconds[worker]
+            lines.append(f"  worker {worker}: {images} images, "
+                         f"{images / seconds if seconds else 0.0:.2f} images/sec")
+        return "\n".join(lines)
+
+    def write_errors(self, path):
+        """Write failed images as JSON lines, in gallery order"""
+        with open(path, "w") as f:
+            for r in sorted(self.errors, key=lambda r: r.path):
+                f.write(json.dumps({"emp_id": r.emp_id, "path": r.path, "error": r.error}) + "\n")
+
+
+def bulk_enroll(data_dir="data", workers=None, chunk_size=16, cache_path=face_utils.ENCODING_CACHE_PATH,
+                rebuild=False, checkpoint_every=30.0, progress=None):
+    """Encode every image under data_dir/<emp_id>/ on a process pool
+
+    Encodings and 'no face' / 'several faces' outcomes go into the
+    encoding cache, which is saved every checkpoint_every seconds so a
+    crashed or interrupted run resumes where it stopped; other errors are
+    not cached and are retried on the next run. Work is handed out in chunks of chunk_size images; the
+    report and the cache contents do not depend on completion order.
+    progress(done, total) is called after every chunk if given.
+    """
+    gallery = face_utils.list_employee_images(data_dir)
+    cache = EncodingCache(cache_path, face_utils.ENCODING_MODEL_TAG, rebuild=rebuild)
+    all_paths = [p for paths in gallery.values() for p in paths]
+    cache.prune(all_paths)
+
+    report = EnrollmentReport()
+    pending = []
+    for emp_id, paths in gallery.items():
+        for path in paths:
+            hit, _ = cache.lookup(path)
+            if hit:
+                report.cached += 1
+            else:
+                pending.append((emp_id, path))
+
+    start = time.perf_counter()
+    last_checkpoint = start
+    done = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(_encode_chunk, chunk) for chunk in _chunks(pending, chunk_size)]
+            for future in as_completed(futures):
+                results = future.result()
+                for result, fingerprint in results:
+                    report.add(result)
+                    # Transient failures stay out of the cache so the next run retries them
+                    if fingerprint is not None and (result.error is None
+                                                    or face_utils.is_face_count_error(result.error)):
+                        cache.store(result.path, result.encoding, fingerprint)
+                done += len(results)
+                if progress:
+                    progress(done, len(pending))
+                if time.perf_counter() - last_checkpoint >= checkpoint_every:
+                    cache.save()
+                    last_checkpoint = time.perf_counter()
+    finally:
+        cache.save()
+        report.elapsed = time.perf_counter() - start
+
+    report.results.sort(key=lambda r: r.path)
+    return report
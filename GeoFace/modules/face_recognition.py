@@ -1,10 +1,27 @@
-import cv2
-import face_recognition
 import os
 from datetime import datetime
+from importlib import metadata
+from modules.encoding_cache import CACHE_DIR, EncodingCache
+from modules.buffers import to_rgb
+from modules.detection import detect_and_encode
+from modules.matcher import GalleryMatcher
+
+FACES_CACHE_PATH = os.path.join(CACHE_DIR, "registered_faces.npz")
+
+def _face_recognition_version():
+    """Installed face_recognition version, read without importing dlib"""
+    try:
+        return metadata.version("face_recognition")
+    except metadata.PackageNotFoundError:
+        return "unknown"
+
+FACES_MODEL_TAG = f"faces-v1:face_recognition-{_face_recognition_version()}"
 
 def register_face(name):
     """Register a new employee face"""
+    import cv2
+    import face_recognition
+
     os.makedirs("faces", exist_ok=True)
     cap = cv2.VideoCapture(0)
     
@@ -33,42 +50,74 @@ def register_face(name):
     cv2.destroyAllWindows()
     return img_path
 
-def recognize_face():
-    """Recognize faces and return matches"""
+def _encode_registered_face(img_path):
+    """Encode the first face found in a registered photo"""
+    import face_recognition
+
+    img = face_recognition.load_image_file(img_path)
+    encodings = face_recognition.face_encodings(img)
+    if not encodings:
+        print(f"No face found in {img_path}")
+        return None
+    return encodings[0]
+
+def recognize_face(faces_dir="faces", cache_path=FACES_CACHE_PATH, rebuild=False, progress=None):
+    """Recognize faces and return matches
+
+    progress(done, total) is called as each registered photo is loaded.
+    """
     known_faces = []
     known_names = []
+    cache = EncodingCache(cache_path, FACES_MODEL_TAG, rebuild=rebuild) if cache_path else None
+    img_paths = []
+    img_files = sorted(os.listdir(faces_dir))
     
     # Load registered faces
-    for img_file in os.listdir("faces"):
+    for done, img_file in enumerate(img_files, 1):
+        if progress is not None:
+            progress(done, len(img_files))
         name = os.path.splitext(img_file)[0].replace('_', ' ')
-        img_path = os.path.join("faces", img_file)
-        img = face_recognition.load_image_file(img_path)
-        encoding = face_recognition.face_encodings(img)[0]
+        img_path = os.path.join(faces_dir, img_file)
+        img_paths.append(img_path)
+        if cache is not None:
+            encoding = cache.encode(img_path, _encode_registered_face)
+        else:
+            encoding = _encode_registered_face(img_path)
+        if encoding is None:
+            continue
         known_faces.append(encoding)
         known_names.append(name)
+
+    if cache is not None:
+        cache.prune(img_paths)
+        try:
+            cache.save()
+        except OSError as e:
+            print(f"Could not write encoding cache {cache_path}: {str(e)}")
     
     return known_faces, known_names
 
 def detect_faces(known_faces, known_names):
     """Detect and recognize faces in real-time"""
+    import cv2
+
+    matcher = GalleryMatcher(known_faces, known_names, tolerance=0.6)
     cap = cv2.VideoCapture(0)
     
+    frame = None
     while True:
-        ret, frame = cap.read()
+        # Reading into the previous frame's array avoids a new allocation per frame
+        ret, frame = cap.read(frame)
         if not ret:
             break
         
-        rgb_frame = frame[:, :, ::-1]  # BGR to RGB
-        face_locations = face_recognition.face_locations(rgb_frame)
-        face_encodings = face_recognition.face_encodings(rgb_frame, face_locations)
+        rgb_frame = to_rgb(frame)
+        face_locations, face_encodings = detect_and_encode(rgb_frame)
         
-        for (top, right, bottom, left), face_encoding in zip(face_locations, face_encodings):
-            matches = face_recognition.compare_faces(known_faces, face_encoding, tolerance=0.6)
-            name = "Unknown"
-            
-            if True in matches:
-                first_match_index = matches.index(True)
-                name = known_names[first_match_index]
+        matches = matcher.match(face_encodings)
+        
+        for (top, right, bottom, left), match in zip(face_locations, matches):
+            name = match.label if match.label is not None else "Unknown"
             
             cv2.rectangle(frame, (left, top), (right, bottom), (0, 255, 0), 2)
             cv2.putText(frame, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
@@ -0,0 +1,238 @@
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import defaultdict, namedtuple
+
+import numpy as np
+
+# Site definitions: {"sites": [{"id", "name", "lat", "lon", "radius_m"} or
+#                              {"id", "name", "polygon": [[lat, lon], ...]}]}
+SITES_PATH = "sites.json"
+# Legacy single-site settings table (allowed_lat, allowed_lon, tolerance_m)
+SETTINGS_DB_PATH = "attendance.db"
+# Grid cell edge in degrees (~5.5 km of latitude)
+CELL_DEG = 0.05
+# Sites whose bounding box covers more cells than this are checked on every query
+MAX_CELLS_PER_SITE = 400
+# Seconds between checks of the sites file for changes
+RELOAD_CHECK_INTERVAL = 5.0
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_DEG_LAT = 111320.0
+
+Site = namedtuple("Site", ["id", "name", "lat", "lon", "radius_m", "polygon"])
+# site_id is None when the point is outside every site; in_fence is None
+# when no sites are configured at all
+FenceResult = namedtuple("FenceResult", ["site_id", "in_fence", "distance_m", "sites"])
+
+
+def haversine_m(lat, lon, lats, lons):
+    """Great-circle distance in meters from one point to arrays of points"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    dlat = lat2 - lat1
+    dlon = np.radians(lons) - math.radians(lon)
+    a = np.sin(dlat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def point_in_polygon(lat, lon, polygon):
+    """Even-odd ray casting over an (n, 2) array of (lat, lon) vertices"""
+    y, x = polygon[:, 0], polygon[:, 1]
+    y2, x2 = np.roll(y, -1), np.roll(x, -1)
+    crosses = (y > lat) != (y2 > lat)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_at = x + (lat - y) * (x2 - x) / (y2 - y)
+    return bool(np.count_nonzero(crosses & (lon < x_at)) % 2)
+
+
+def parse_site(entry):
+    """Build a Site from one sites.json entry"""
+    site_id = str(entry["id"])
+    name = entry.get("name", site_id)
+    if "polygon" in entry:
+        polygon = np.asarray(entry["polygon"], dtype=np.float64)
+        if polygon.ndim != 2 or polygon.shape[0] < 3 or polygon.shape[1] != 2:
+            raise ValueError(f"site {site_id}: polygon needs at least 3 [lat, lon] vertices")
+        lat, lon = polygon.mean(axis=0)
+        return Site(site_id, name, float(lat), float(lon), None, polygon)
+    return Site(site_id, name, float(entry["lat"]), float(entry["lon"]), float(entry["radius_m"]), None)
+
+
+def load_sites(path=SITES_PATH):
+    """Read site definitions from a JSON file"""
+    with open(path) as f:
+        data = json.load(f)
+    entries = data["sites"] if isinstance(data, dict) else data
+    return [parse_site(entry) for entry in entries]
+
+
+def load_settings_site(db_path=SETTINGS_DB_PATH):
+    """The legacy settings-table fence as a one-site list (empty if absent)"""
+    if not os.path.isfile(db_path):
+        return []
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        try:
+            row = conn.execute("SELECT allowed_lat, allowed_lon, tolerance_m FROM settings LIMIT 1").fetchone()
+        finally:
+            conn.close()
+    except sqlite3.Error:
+        return []
+    if row is None or None in row:
+        return []
+    return [Site("default", "Default site", float(row[0]), float(row[1]), float(row[2]), None)]
+
+
+class GridIndex:
+    """Sites bucketed by the CELL_DEG grid cells their bounding boxes overlap
+
+    A query looks up the point's cell, then runs one vectorized haversine
+    over the candidate circles and ray casting over candidate polygons.
+    """
+
+    def __init__(self, sites, cell_deg=CELL_DEG):
+        self.sites = list(sites)
+        self.cell_deg = cell_deg
+        self.lats = np.array([s.lat for s in self.sites], dtype=np.float64)
+        self.lons = np.array([s.lon for s in self.sites], dtype=np.float64)
+        self.radii = np.array([s.radius_m if s.radius_m is not None else np.nan for s in self.sites])
+        buckets = defaultdict(list)
+        always = []
+        for i, site in enumerate(self.sites):
+            lat0, lat1, lon0, lon1 = self._bounds(site)
+            rows = range(self._cell(lat0), self._cell(lat1) + 1)
+            cols = range(self._cell(lon0), self._cell(lon1) + 1)
+            if len(rows) * len(cols) > MAX_CELLS_PER_SITE:
+                always.append(i)
+                continue
+            for r in rows:
+                for c in cols:
+                    buckets[(r, c)].append(i)
+        self.always = np.array(always, dtype=np.int64)
+        self.cells = {key: np.array(ids, dtype=np.int64) for key, ids in buckets.items()}
+
+    def _cell(self, degrees):
+        return int(math.floor(degrees / self.cell_deg))
+
+    @staticmethod
+    def _bounds(site):
+        if site.polygon is not None:
+            lat0, lon0 = site.polygon.min(axis=0)
+            lat1, lon1 = site.polygon.max(axis=0)
+            return lat0, lat1, lon0, lon1
+        dlat = site.radius_m / METERS_PER_DEG_LAT
+        dlon = site.radius_m / (METERS_PER_DEG_LAT * max(math.cos(math.radians(site.lat)), 1e-6))
+        return site.lat - dlat, site.lat + dlat, site.lon - dlon, site.lon + dlon
+
+    def candidates(self, lat, lon):
+        ids = self.cells.get((self._cell(lat), self._cell(lon)))
+        if self.always.size:
+            ids = self.always if ids is None else np.concatenate([ids, self.always])
+        return ids
+
+    def query(self, lat, lon):
+        """Return [(site, distance_m)] for every site containing the point, nearest first"""
+        ids = self.candidates(lat, lon)
+        if ids is None or not ids.size:
+            return []
+        distances = haversine_m(lat, lon, self.lats[ids], self.lons[ids])
+        radii = self.radii[ids]
+        hits = []
+        for i, distance, radius in zip(ids, distances, radii):
+            site = self.sites[i]
+            if site.polygon is None:
+                if distance <= radius:
+                    hits.append((site, float(distance)))
+            elif point_in_polygon(lat, lon, site.polygon):
+                hits.append((site, float(distance)))
+        hits.sort(key=lambda hit: hit[1])
+        return hits
+
+
+class Geofence:
+    """Multi-site geofence with hot reload of the sites file
+
+    Sites come from sites_path if it exists, else from the legacy settings
+    table. The file's mtime is checked at most every check_interval
+    seconds; a changed file is re-read and the index swapped atomically.
+    A bad file is reported and the previous sites stay in effect.
+    """
+
+    def __init__(self, sites_path=SITES_PATH, settings_db=SETTINGS_DB_PATH, cell_deg=CELL_DEG,
+                 check_interval=RELOAD_CHECK_INTERVAL):
+        self.sites_path = sites_path
+        self.settings_db = settings_db
+        self.cell_deg = cell_deg
+        self.check_interval = check_interval
+        self.index = GridIndex([], cell_deg)
+        self._mtime = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        self.reload()
+
+    def _sites_mtime(self):
+        try:
+            return os.stat(self.sites_path).st_mtime_ns
+        except OSError:
+            return None
+
+    def reload(self):
+        """Re-read the site definitions; returns True if the index changed"""
+        mtime = self._sites_mtime()
+        try:
+            if mtime is not None:
+                sites = load_sites(self.sites_path)
+            else:
+                sites = load_settings_site(self.settings_db)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Could not load sites from {self.sites_path}: {str(e)}")
+            self._mtime = mtime
+            return False
+        self.index = GridIndex(sites, self.cell_deg)
+        self._mtime = mtime
+        return True
+
+    def reload_if_changed(self):
+        now = time.monotonic()
+        if now < self._next_check:
+            return False
+        with self._lock:
+            self._next_check = now + self.check_interval
+            if self._sites_mtime() == self._mtime:
+                return False
+            return self.reload()
+
+    @property
+    def sites(self):
+        return self.index.sites
+
+    def sites_at(self, lat, lon):
+        """Return [(site, distance_m)] for every site containing the point"""
+        self.reload_if_changed()
+        return self.index.query(lat, lon)
+
+    def check(self, lat, lon):
+        """Classify a reading: the nearest containing site and an in/out-of-fence flag"""
+        self.reload_if_changed()
+        index = self.index
+        if not index.sites or lat is None or lon is None:
+            return FenceResult(None, None, None, [])
+        hits = index.query(lat, lon)
+        if not hits:
+            return FenceResult(None, False, None, [])
+        site, distance = hits[0]
+        return FenceResult(site.id, True, distance, [s.id for s, _ in hits])
+
+
+_geofence = None
+
+
+def get_geofence():
+    """Process-wide geofence loaded from GEOFACE_SITES (default sites.json)"""
+    global _geofence
+    if _geofence is None:
+        _geofence = Geofence(os.environ.get("GEOFACE_SITES", SITES_PATH))
+    return _geofence
@@ -1,12 +1,265 @@
-import geocoder
+import json
+import os
+import tempfile
+import threading
+import time
+import urllib.request
+from modules.metrics import metrics
 
-def get_current_location():
-    """Get current geolocation data"""
-    g = geocoder.ip('me')
-    if g.ok:
-        return {
-            "latitude": g.latlng[0],
-            "longitude": g.latlng[1],
-            "place": g.address
+# Seconds a reading stays fresh; kiosks don't move, so this is generous
+LOCATION_TTL = 3600.0
+# Retry delay after a failed refresh
+RETRY_INTERVAL = 60.0
+# Last good reading, reused (marked stale) after a restart without network
+LOCATION_CACHE_PATH = os.path.join("cache", "location.json")
+
+class LocationBackend:
+    """Source of (latitude, longitude, place) readings
+
+    Subclasses implement locate(), which may block on the network and
+    returns a dict with latitude, longitude and place, or raises.
+    instant backends never block and are queried synchronously at startup.
+    """
+    name = "backend"
+    instant = False
+
+    def locate(self):
+        raise NotImplementedError
+
+class IPBackend(LocationBackend):
+    """IP-based lookup through geocoder (the original behaviour)"""
+    name = "ip"
+
+    def locate(self):
+        import geocoder
+
+        g = geocoder.ip('me')
+        if not g.ok:
+            raise RuntimeError(f"IP geolocation failed: {g.status}")
+        return {"latitude": g.latlng[0], "longitude": g.latlng[1], "place": g.address}
+
+class StaticBackend(LocationBackend):
+    """Fixed, configured coordinates for a kiosk that never moves"""
+    name = "static"
+    instant = True
+
+    def __init__(self, latitude, longitude, place=""):
+        self.reading = {"latitude": float(latitude), "longitude": float(longitude), "place": place}
+
+    def locate(self):
+        return dict(self.reading)
+
+class HTTPBackend(LocationBackend):
+    """GET a JSON {"latitude", "longitude", "place"} document from a URL
+
+    Lets a site-local service (or a stub server in tests) supply the location.
+    """
+    name = "http"
+
+    def __init__(self, url, timeout=5.0):
+        self.url = url
+        self.timeout = timeout
+
+    def locate(self):
+        with urllib.request.urlopen(self.url, timeout=self.timeout) as response:
+            data = json.load(response)
+        return {"latitude": float(data["latitude"]), "longitude": float(data["longitude"]),
+                "place": data.get("place", "")}
+
+def backend_from_env():
+    """Pick a backend from GEOFACE_LOCATION ('lat,lon[,place]') or GEOFACE_LOCATION_URL"""
+    static = os.environ.get("GEOFACE_LOCATION")
+    if static:
+        lat, lon, *place = static.split(",", 2)
+        return StaticBackend(lat, lon, place[0].strip() if place else "")
+    url = os.environ.get("GEOFACE_LOCATION_URL")
+    if url:
+        return HTTPBackend(url)
+    return IPBackend()
+
+class LocationProvider:
+    """Cached, non-blocking wrapper around a LocationBackend
+
+    get() returns the cached reading immediately and never touches the
+    network; a background thread refreshes it every ttl seconds (retrying
+    every retry_interval after failures). Each reading carries staleness
+    metadata:
+        source      backend name, or "cache" for a reading loaded from disk
+        backend     backend that produced the reading
+        fetched_at  epoch seconds of the backend call that produced it
+        age_s       seconds since fetched_at
+        stale       True once age_s exceeds ttl
+        error       message from the last failed refresh, else None
+    """
+
+    def __init__(self, backend, ttl=LOCATION_TTL, retry_interval=RETRY_INTERVAL,
+                 cache_path=LOCATION_CACHE_PATH):
+        self.backend = backend
+        self.ttl = ttl
+        self.retry_interval = retry_interval
+        self.cache_path = cache_path
+        self.reading = None
+        self.error = None
+        # A wake-up or refresh is under way; get() then does not wake the thread again
+        self._pending = False
+        self._last_failure = None
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop_event = threading.Event()
+        self._thread = None
+        if backend.instant:
+            self.refresh()
+        else:
+            self._load_cache()
+
+    def _load_cache(self):
+        if not self.cache_path or not os.path.isfile(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                reading = json.load(f)
+            if reading.get("backend") != self.backend.name:
+                return
+            reading["source"] = "cache"
+            self.reading = reading
+        except (OSError, ValueError) as e:
+            print(f"Ignoring location cache {self.cache_path}: {str(e)}")
+
+    def _save_cache(self, reading):
+        if not self.cache_path:
+            return
+        tmp_path = None
+        try:
+            cache_dir = os.path.dirname(self.cache_path) or "."
+            os.makedirs(cache_dir, exist_ok=True)
+            # A unique name, so a write cut short at exit never clobbers another one
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=cache_dir)
+            with os.fdopen(fd, "w") as f:
+                json.dump(reading, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not write location cache {self.cache_path}: {str(e)}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def refresh(self):
+        """Query the backend now (blocking); returns True on success"""
+        try:
+            with metrics.stage("geolocation"):
+                location = self.backend.locate()
+        except Exception as e:
+            with self._lock:
+                self.error = str(e)
+                self._last_failure = time.time()
+                self._pending = False
+            metrics.incr("geolocation_errors")
+            return False
+        reading = {
+            "latitude": location["latitude"],
+            "longitude": location["longitude"],
+            "place": location.get("place", ""),
+            "source": self.backend.name,
+            "backend": self.backend.name,
+            "fetched_at": time.time(),
         }
-    return None
\ No newline at end of file
+        with self._lock:
+            self.reading = reading
+            self.error = None
+            self._last_failure = None
+            self._pending = False
+        self._save_cache(reading)
+        return True
+
+    def _fresh_for(self):
+        """Seconds until the current reading goes stale (0 if there is none)"""
+        with self._lock:
+            if self.reading is None:
+                return 0.0
+            return max(0.0, self.ttl - (time.time() - self.reading.get("fetched_at", 0)))
+
+    def _run(self):
+        # An instant backend was already queried by the constructor, and a
+        # recent cache file is as good as a new reading: wait for it to age
+        delay = self._fresh_for()
+        while not self._stop_event.is_set():
+            if delay > 0:
+                self._wake.wait(delay)
+                self._wake.clear()
+                if self._stop_event.is_set():
+                    break
+            with self._lock:
+                self._pending = True
+            ok = self.refresh()
+            delay = self.ttl if ok else self.retry_interval
+
+    def start(self):
+        """Start background refreshing (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="geolocation", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop_event.set()
+        self._wake.set()
+
+    def refresh_soon(self):
+        """Ask the background thread to refresh now
+
+        Does nothing while a refresh is already pending or within
+        retry_interval of the last failure, so callers polling a stale
+        reading cannot defeat the retry backoff.
+        """
+        with self._lock:
+            if self._pending:
+                return
+            if self._last_failure is not None and time.time() - self._last_failure < self.retry_interval:
+                return
+            self._pending = True
+        self._wake.set()
+
+    def get(self, wait=0.0):
+        """Return the cached reading with staleness metadata, or None if there is none yet
+
+        wait > 0 blocks up to that many seconds for a first reading.
+        """
+        if self.reading is None and wait > 0:
+            deadline = time.time() + wait
+            while self.reading is None and time.time() < deadline:
+                time.sleep(0.05)
+        with self._lock:
+            if self.reading is None:
+                return None
+            reading = dict(self.reading)
+            error = self.error
+        # A cache file without fetched_at (older format) counts as stale
+        reading["age_s"] = round(max(0.0, time.time() - reading.get("fetched_at", 0)), 1)
+        reading["stale"] = reading["age_s"] > self.ttl
+        reading["error"] = error
+        if reading["stale"]:
+            self.refresh_soon()
+        return reading
+
+_provider = None
+# Serialises creation so concurrent first calls share one provider and thread
+_provider_lock = threading.Lock()
+
+def get_provider():
+    """Process-wide provider, created from the environment and started on first use"""
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            _provider = LocationProvider(backend_from_env()).start()
+        return _provider
+
+def set_provider(provider):
+    """Replace the process-wide provider (e.g. with a StaticBackend in tests)"""
+    global _provider
+    with _provider_lock:
+        if _provider is not None and _provider is not provider:
+            _provider.stop()
+        _provider = provider.start() if provider is not None else None
+
+def get_current_location():
+    """Get current geolocation data from the cache without blocking on the network"""
+    return get_provider().get()
\ No newline at end of file
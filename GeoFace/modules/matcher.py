@@ -0,0 +1,171 @@
+from collections import namedtuple
+
+import numpy as np
+
+from modules.ann_index import ENCODING_SIZE, FlatIndex, make_index
+from modules.metrics import metrics
+
+# label is None when the best distance is above tolerance; index is the
+# gallery row of the nearest template (-1 for an empty gallery); margin is
+# the distance gap to the runner-up identity (inf when there is none).
+Match = namedtuple("Match", ["label", "index", "distance", "margin"])
+
+AGGREGATES = ("min", "topk")
+# With an approximate index, templates fetched per face before aggregation
+CANDIDATES_PER_TEMPLATE = 4
+
+
+class GalleryMatcher:
+    """Nearest-neighbour matcher over a gallery of face encodings.
+
+    The gallery lives in a search index (modules.ann_index). The default
+    FlatIndex keeps one contiguous float32 matrix with precomputed squared
+    norms, scores all faces of a frame with a single matrix product and
+    re-scores the best candidates exactly, so tolerance decisions match
+    face_recognition.compare_faces (distance <= tolerance), except that the
+    closest template wins instead of the first one under tolerance.
+
+    index may be an index kind ('flat', 'ivf', 'rptree') built from the
+    given encodings with index_params, or an already built index instance.
+
+    Labels may repeat when an identity has several templates. Distances are
+    then aggregated per identity, either as the closest template ('min') or
+    the mean of the top_k closest templates ('topk').
+    """
+
+    def __init__(self, encodings, labels, tolerance=0.6, index="flat", index_params=None,
+                 aggregate="min", top_k=2):
+        if aggregate not in AGGREGATES:
+            raise ValueError(f"aggregate must be one of {AGGREGATES}")
+        self.labels = list(labels)
+        self.tolerance = tolerance
+        self.aggregate = aggregate
+        self.top_k = top_k
+        if isinstance(index, str):
+            index = make_index(index, **(index_params or {})).build(encodings)
+        self.index = index
+        if len(self.labels) != len(self.index):
+            raise ValueError("encodings and labels must have the same length")
+        self._build_identities()
+
+    def _build_identities(self):
+        """Map template rows to identities, padded to (identities, max templates)"""
+        identities = {}
+        codes = np.empty(len(self.labels), dtype=np.int64)
+        for row, label in enumerate(self.labels):
+            codes[row] = identities.setdefault(label, len(identities))
+        self.identities = list(identities)
+        self.codes = codes
+        self.multi_template = len(self.identities) < len(self.labels)
+        if not self.multi_template:
+            return
+
+        counts = np.bincount(codes, minlength=len(self.identities))
+        order = np.argsort(codes, kind="stable")
+        starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+        slot = np.arange(len(codes)) - np.repeat(starts, counts)
+        self.templates = np.full((len(self.identities), counts.max()), -1, dtype=np.int64)
+        self.templates[codes[order], slot] = order
+        self.template_mask = self.templates >= 0
+        self.templates[~self.template_mask] = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    @property
+    def encodings(self):
+        return self.index.encodings
+
+    def distances(self, face_encodings):
+        """Return the (faces x templates) Euclidean distance matrix"""
+        return FlatIndex.distances(self.index, face_encodings)
+
+    def _aggregate(self, dist, mask):
+        """Reduce (..., templates) distances to one score per identity"""
+        dist = np.where(mask, dist, np.inf)
+        if self.aggregate == "min":
+            return dist.min(axis=-1)
+        top = np.sort(dist, axis=-1)[..., :self.top_k]
+        finite = np.isfinite(top)
+        total = np.where(finite, top, 0.0).sum(axis=-1)
+        return total / np.maximum(finite.sum(axis=-1), 1)
+
+    def _exact_identities(self, query, ids):
+        """Exact aggregated distances and nearest rows for the given identities"""
+        rows = self.templates[ids]
+        mask = self.template_mask[ids]
+        dist = np.linalg.norm(self.encodings[rows].astype(np.float64) - query, axis=-1)
+        scores = self._aggregate(dist, mask)
+        nearest = rows[np.arange(len(ids)), np.argmin(np.where(mask, dist, np.inf), axis=-1)]
+        return scores, nearest
+
+    def _match_identities(self, queries, search_params):
+        """Best two identities per face as (scores, nearest rows, identity ids)"""
+        n_ids = len(self.identities)
+        if type(self.index) is FlatIndex:
+            # One vectorized pass over every template, then exact re-scoring
+            dist = self.distances(queries)[:, self.templates]
+            approx = self._aggregate(dist, self.template_mask)
+            k = min(2, n_ids)
+            if k < n_ids:
+                candidates = np.argpartition(approx, k - 1, axis=1)[:, :k]
+            else:
+                candidates = np.broadcast_to(np.arange(n_ids), approx.shape)
+        else:
+            k_templates = CANDIDATES_PER_TEMPLATE * self.templates.shape[1]
+            _, idx = self.index.search(queries, k_templates, **search_params)
+            candidates = [np.unique(self.codes[row[row >= 0]]) for row in idx]
+
+        results = []
+        for query, ids in zip(queries, candidates):
+            ids = np.asarray(ids)
+            scores, nearest = self._exact_identities(query, ids)
+            order = np.argsort(scores)[:2]
+            results.append((scores[order], nearest[order], ids[order]))
+        return results
+
+    def match(self, face_encodings, tolerance=None, **search_params):
+        """Return one Match per face encoding, closest identity first"""
+        with metrics.stage("match"):
+            results = self._match(face_encodings, tolerance, search_params)
+        if metrics.enabled and results:
+            matched = sum(1 for m in results if m.label is not None)
+            metrics.incr("faces", len(results))
+            metrics.incr("matches", matched)
+            metrics.incr("unknowns", len(results) - matched)
+        return results
+
+    def _match(self, face_encodings, tolerance, search_params):
+        if tolerance is None:
+            tolerance = self.tolerance
+        n_faces = len(face_encodings)
+        if n_faces == 0:
+            return []
+        if len(self) == 0:
+            return [Match(None, -1, float("inf"), float("inf"))] * n_faces
+
+        queries = np.asarray(face_encodings, dtype=np.float64).reshape(-1, ENCODING_SIZE)
+        if self.multi_template:
+            results = []
+            for scores, nearest, ids in self._match_identities(queries, search_params):
+                if len(ids) == 0:
+                    results.append(Match(None, -1, float("inf"), float("inf")))
+                    continue
+                distance = float(scores[0])
+                margin = float(scores[1] - distance) if len(ids) > 1 else float("inf")
+                label = self.identities[ids[0]] if distance <= tolerance else None
+                results.append(Match(label, int(nearest[0]), distance, margin))
+            return results
+
+        best_dist, best_idx = self.index.search(queries, 2, **search_params)
+        results = []
+        for i in range(n_faces):
+            idx = int(best_idx[i, 0])
+            distance = float(best_dist[i, 0])
+            if idx < 0:
+                results.append(Match(None, -1, float("inf"), float("inf")))
+                continue
+            margin = float(best_dist[i, 1] - distance)
+            label = self.labels[idx] if distance <= tolerance else None
+            results.append(Match(label, idx, distance, margin))
+        return results
@@ -0,0 +1,223 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Samples kept per stage for the rolling p50/p95/p99
+WINDOW = 2048
+QUANTILES = (0.5, 0.95, 0.99)
+EXPORT_INTERVAL = 10.0
+
+
+class _NullStage:
+    """Shared no-op context manager handed out while metrics are disabled"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class _Stage:
+    def __init__(self, registry, name):
+        self.registry = registry
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.name, time.perf_counter() - self.start)
+        return False
+
+
+class Histogram:
+    """Rolling window of stage durations plus lifetime count and sum"""
+
+    def __init__(self, window=WINDOW):
+        self.samples = deque(maxlen=window)
+        self.count = 0
+        self.total = 0.0
+
+    def add(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+
+    def quantiles(self):
+        if not self.samples:
+            return {q: 0.0 for q in QUANTILES}
+        ordered = sorted(self.samples)
+        last = len(ordered) - 1
+        return {q: ordered[min(last, int(round(q * last)))] for q in QUANTILES}
+
+
+class MetricsRegistry:
+    """Stage timers and counters for the recognition loop
+
+    Disabled by default: stage() then returns a shared no-op context manager
+    and incr() returns immediately, so instrumented code pays one attribute
+    check per call.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.histograms = {}
+        self.counters = {}
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+
+    def stage(self, name):
+        """Context manager timing one stage, e.g. with metrics.stage("detect"):"""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def observe(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            hist = self.histograms.get(name)
+            if hist is None:
+                hist = self.histograms[name] = Histogram()
+            hist.add(seconds)
+
+    def incr(self, name, n=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def reset(self):
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.started_at = time.time()
+
+    def snapshot(self):
+        """Current stats as a JSON-serialisable dict (milliseconds)"""
+        with self._lock:
+            stages = {}
+            for name, hist in sorted(self.histograms.items()):
+                q = hist.quantiles()
+                stages[name] = {
+                    "count": hist.count,
+                    "mean_ms": round(hist.total / hist.count * 1000, 3) if hist.count else 0.0,
+                    "p50_ms": round(q[0.5] * 1000, 3),
+                    "p95_ms": round(q[0.95] * 1000, 3),
+                    "p99_ms": round(q[0.99] * 1000, 3),
+                }
+            return {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "uptime_s": round(time.time() - self.started_at, 1),
+                "stages": stages,
+                "counters": dict(sorted(self.counters.items())),
+            }
+
+    def prometheus_text(self):
+        """Current stats in the Prometheus text exposition format"""
+        lines = ["# TYPE geoface_stage_seconds summary"]
+        with self._lock:
+            for name, hist in sorted(self.histograms.items()):
+                for q, value in hist.quantiles().items():
+                    lines.append(f'geoface_stage_seconds{{stage="{name}",quantile="{q}"}} {value:.6f}')
+                lines.append(f'geoface_stage_seconds_sum{{stage="{name}"}} {hist.total:.6f}')
+                lines.append(f'geoface_stage_seconds_count{{stage="{name}"}} {hist.count}')
+            for name, value in sorted(self.counters.items()):
+                lines.append(f"# TYPE geoface_{name}_total counter")
+                lines.append(f"geoface_{name}_total {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class JsonFileExporter(threading.Thread):
+    """Rewrites a JSON snapshot file every interval seconds"""
+
+    def __init__(self, registry, path, interval=EXPORT_INTERVAL):
+        super().__init__(name="metrics-json", daemon=True)
+        self.registry = registry
+        self.path = path
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def write(self):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.registry.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                print(f"Could not write metrics to {self.path}: {str(e)}")
+
+    def stop(self):
+        self._stop_event.set()
+        self.write()
+
+
+def serve_prometheus(registry, port, host="127.0.0.1"):
+    """Serve /metrics on a background thread; returns the HTTP server"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.prometheus_text().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+def start_metrics(json_path=None, port=None, interval=EXPORT_INTERVAL):
+    """Enable the global registry and start the requested exporters"""
+    exporters = []
+    if not json_path and not port:
+        return exporters
+    metrics.enabled = True
+    if json_path:
+        exporter = JsonFileExporter(metrics, json_path, interval)
+        exporter.start()
+        exporters.append(exporter)
+    if port:
+        exporters.append(serve_prometheus(metrics, port))
+    return exporters
+
+
+def start_metrics_from_env():
+    """start_metrics() configured by GEOFACE_METRICS_JSON / GEOFACE_METRICS_PORT"""
+    port = os.environ.get("GEOFACE_METRICS_PORT")
+    return start_metrics(
+        json_path=os.environ.get("GEOFACE_METRICS_JSON"),
+        port=int(port) if port else None,
+        interval=float(os.environ.get("GEOFACE_METRICS_INTERVAL", EXPORT_INTERVAL)),
+    )
+
+
+def stop_metrics(exporters):
+    for exporter in exporters:
+        if isinstance(exporter, JsonFileExporter):
+            exporter.stop()
+        else:
+            exporter.shutdown()
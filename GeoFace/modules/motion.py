@@ -0,0 +1,108 @@
+import threading
+
+import cv2
+import numpy as np
+
+from modules.buffers import get_buffer_pool, resize_into, to_gray
+
+# Width of the grayscale thumbnail frames are compared at
+GATE_WIDTH = 160
+# Per-pixel grey-level change that counts as "changed"
+PIXEL_THRESHOLD = 25
+# Fraction of changed ROI pixels that counts as motion
+MIN_CHANGED_FRACTION = 0.01
+# Run detection at least this often even if nothing moves
+MAX_SKIP = 30
+
+
+def parse_roi(text):
+    """Parse an 'x,y,w,h' string of frame fractions (0..1) into a tuple"""
+    if not text:
+        return None
+    values = tuple(float(v) for v in text.split(","))
+    if len(values) != 4 or not all(0.0 <= v <= 1.0 for v in values):
+        raise ValueError("ROI must be x,y,w,h as fractions between 0 and 1")
+    x, y, w, h = values
+    if w <= 0.0 or h <= 0.0:
+        raise ValueError("ROI width and height must be greater than 0")
+    if x + w > 1.0 or y + h > 1.0:
+        raise ValueError("ROI must lie inside the frame (x + w <= 1 and y + h <= 1)")
+    return values
+
+
+class MotionGate:
+    """Cheap pre-filter that skips face detection on unchanged frames
+
+    Each frame is reduced to a small blurred grayscale thumbnail and
+    compared with the thumbnail of the last processed frame. Detection runs
+    when at least min_changed_fraction of the region of interest changed by
+    more than pixel_threshold grey levels, or after max_skip skipped frames.
+
+    roi is (x, y, w, h) as fractions of the frame, or None for all of it.
+    last_result holds whatever the caller computed for the last processed
+    frame so it can be reused while frames are skipped.
+    """
+
+    def __init__(self, pixel_threshold=PIXEL_THRESHOLD, min_changed_fraction=MIN_CHANGED_FRACTION,
+                 max_skip=MAX_SKIP, roi=None, width=GATE_WIDTH):
+        self.pixel_threshold = pixel_threshold
+        self.min_changed_fraction = min_changed_fraction
+        self.max_skip = max_skip
+        self.roi = roi
+        self.width = width
+        self.processed = 0
+        self.skipped = 0
+        self.last_result = []
+        self._reference = None
+        self._since_processed = 0
+        self._lock = threading.Lock()
+
+    def _thumbnail(self, frame):
+        """Blurred grayscale thumbnail in the calling thread's pooled buffers"""
+        pool = get_buffer_pool()
+        frame = to_gray(frame, pool, "gate_gray")
+        height, width = frame.shape[:2]
+        if self.roi is not None:
+            x, y, w, h = self.roi
+            # At least one pixel each way, however small the ROI is on this frame
+            top = min(int(y * height), height - 1)
+            left = min(int(x * width), width - 1)
+            frame = frame[top:max(int((y + h) * height), top + 1), left:max(int((x + w) * width), left + 1)]
+            height, width = frame.shape[:2]
+        scale = min(1.0, self.width / float(max(width, 1)))
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        small = resize_into(frame, size, pool, "gate_small")
+        return cv2.GaussianBlur(small, (5, 5), 0, dst=pool.get("gate_thumb", small.shape))
+
+    def changed_fraction(self, thumb):
+        """Fraction of thumbnail pixels that differ from the reference"""
+        if self._reference is None or self._reference.shape != thumb.shape:
+            return 1.0
+        diff = cv2.absdiff(thumb, self._reference, dst=get_buffer_pool().get("gate_diff", thumb.shape))
+        return np.count_nonzero(diff > self.pixel_threshold) / float(diff.size)
+
+    def should_process(self, frame):
+        """Return True if detection should run on this BGR (or gray) frame"""
+        thumb = self._thumbnail(frame)
+        with self._lock:
+            motion = self.changed_fraction(thumb) >= self.min_changed_fraction
+            if motion or self._since_processed >= self.max_skip:
+                # thumb is a pooled buffer, so the reference keeps its own copy
+                if self._reference is None or self._reference.shape != thumb.shape:
+                    self._reference = thumb.copy()
+                else:
+                    np.copyto(self._reference, thumb)
+                self._since_processed = 0
+                self.processed += 1
+                return True
+            self._since_processed += 1
+            self.skipped += 1
+            return False
+
+    def stats(self):
+        total = self.processed + self.skipped
+        return {
+            "processed": self.processed,
+            "skipped": self.skipped,
+            "skip_ratio": round(self.skipped / total, 3) if total else 0.0,
+        }
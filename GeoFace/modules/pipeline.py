@@ -0,0 +1,204 @@
+import threading
+import time
+from collections import deque, namedtuple
+
+from modules.metrics import metrics
+
+# frame_id increases monotonically; captured_at is a time.perf_counter() value
+Frame = namedtuple("Frame", ["frame_id", "captured_at", "image"])
+# faces is a list of ((top, right, bottom, left), Match) pairs found in image,
+# the frame they were recognized in (crop from it, not from a newer frame)
+Result = namedtuple("Result", ["frame_id", "captured_at", "finished_at", "faces", "image"])
+
+
+class StageStats:
+    """Thread-safe throughput and latency counters for one pipeline stage"""
+
+    def __init__(self, name, window=2.0, alpha=0.1):
+        self.name = name
+        self.window = window
+        self.alpha = alpha
+        self.count = 0
+        self.dropped = 0
+        self.latency_ms = 0.0
+        self.last_latency_ms = 0.0
+        self._stamps = deque()
+        self._lock = threading.Lock()
+
+    def record(self, latency_s=None):
+        """Count one processed item, optionally with its latency in seconds"""
+        now = time.perf_counter()
+        with self._lock:
+            self.count += 1
+            self._stamps.append(now)
+            while self._stamps and now - self._stamps[0] > self.window:
+                self._stamps.popleft()
+            if latency_s is not None:
+                self.last_latency_ms = latency_s * 1000
+                if self.count == 1:
+                    self.latency_ms = self.last_latency_ms
+                else:
+                    self.latency_ms += self.alpha * (self.last_latency_ms - self.latency_ms)
+
+    def drop(self, n=1):
+        with self._lock:
+            self.dropped += n
+
+    @property
+    def fps(self):
+        with self._lock:
+            if len(self._stamps) < 2:
+                return 0.0
+            span = self._stamps[-1] - self._stamps[0]
+            return (len(self._stamps) - 1) / span if span > 0 else 0.0
+
+    def snapshot(self):
+        return {
+            "stage": self.name,
+            "count": self.count,
+            "dropped": self.dropped,
+            "fps": round(self.fps, 2),
+            "latency_ms": round(self.latency_ms, 2),
+        }
+
+
+class LatestQueue:
+    """Bounded queue that drops the oldest item when full
+
+    get() hands out the newest item and discards anything older, so a slow
+    consumer always works on the most recent frame.
+    """
+
+    def __init__(self, maxsize=2, stats=None):
+        self.maxsize = maxsize
+        self.stats = stats
+        self._items = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+
+    def put(self, item):
+        with self._cond:
+            if len(self._items) >= self.maxsize:
+                self._items.popleft()
+                if self.stats:
+                    self.stats.drop()
+            self._items.append(item)
+            self._cond.notify()
+
+    def get(self, timeout=None):
+        """Return the newest item, or None on timeout or after close()"""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._items or self._closed, timeout):
+                return None
+            if not self._items:
+                return None
+            item = self._items.pop()
+            if self._items and self.stats:
+                self.stats.drop(len(self._items))
+            self._items.clear()
+            return item
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items)
+
+
+class FramePipeline:
+    """Capture thread -> recognition workers -> latest-result slot
+
+    The capture thread keeps reading the camera so its buffer never fills
+    with stale frames; recognition workers always take the newest frame;
+    the caller's display loop reads latest_frame()/latest_result() and
+    never waits on recognition.
+
+    recognize(image) must return a list of (location, match) pairs. With
+    several workers results can finish out of order; older ones are dropped.
+    """
+
+    def __init__(self, cap, recognize, workers=1, queue_size=2):
+        self.cap = cap
+        self.recognize = recognize
+        self.workers = workers
+        self.capture_stats = StageStats("capture")
+        self.recognition_stats = StageStats("recognition")
+        self.display_stats = StageStats("display")
+        self.frames = LatestQueue(queue_size, self.recognition_stats)
+        self._latest_frame = None
+        self._latest_result = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._threads = []
+
+    def start(self):
+        self._stop.clear()
+        self._threads = [threading.Thread(target=self._capture_loop, name="capture", daemon=True)]
+        for i in range(self.workers):
+            self._threads.append(
+                threading.Thread(target=self._recognition_loop, name=f"recognition-{i}", daemon=True))
+        for thread in self._threads:
+            thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self.frames.close()
+        for thread in self._threads:
+            thread.join(timeout=2.0)
+        self._threads = []
+
+    @property
+    def running(self):
+        return not self._stop.is_set() and any(t.is_alive() for t in self._threads[:1])
+
+    def _capture_loop(self):
+        frame_id = 0
+        while not self._stop.is_set():
+            start = time.perf_counter()
+            ret, image = self.cap.read()
+            metrics.observe("capture", time.perf_counter() - start)
+            if not ret:
+                self._stop.set()
+                self.frames.close()
+                break
+            frame_id += 1
+            frame = Frame(frame_id, time.perf_counter(), image)
+            with self._lock:
+                self._latest_frame = frame
+            self.frames.put(frame)
+            self.capture_stats.record(time.perf_counter() - start)
+
+    def _recognition_loop(self):
+        while not self._stop.is_set():
+            frame = self.frames.get(timeout=0.5)
+            if frame is None:
+                continue
+            try:
+                faces = self.recognize(frame.image)
+            except Exception as e:
+                print(f"Recognition error: {str(e)}")
+                continue
+            finished = time.perf_counter()
+            result = Result(frame.frame_id, frame.captured_at, finished, faces, frame.image)
+            with self._lock:
+                if self._latest_result is None or result.frame_id > self._latest_result.frame_id:
+                    self._latest_result = result
+                else:
+                    self.recognition_stats.drop()
+            # Latency is measured from capture, so it includes queueing time
+            self.recognition_stats.record(finished - frame.captured_at)
+
+    def latest_frame(self):
+        with self._lock:
+            return self._latest_frame
+
+    def latest_result(self):
+        with self._lock:
+            return self._latest_result
+
+    def stats(self):
+        return [s.snapshot() for s in (self.capture_stats, self.recognition_stats, self.display_stats)]
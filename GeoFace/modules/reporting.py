@@ -0,0 +1,253 @@
+import glob
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from modules.database import SUMMARY_BACKFILL_SQL, SUMMARY_SELECT_SQL, get_connection
+
+ARCHIVE_DIR = "archive"
+# Closed months kept in the live database before they are archived, so
+# late rows for the previous month still land in the live summaries
+KEEP_CLOSED_MONTHS = 1
+
+# hours is the span between the first and last mark of the day
+HOURS_SQL = "ROUND((julianday(last_out) - julianday(first_in)) * 24, 2)"
+DAILY_SELECT = f"SELECT employee_name, day, first_in, last_out, {HOURS_SQL} AS hours, count, site_id FROM attendance_daily"
+# Archives never change, so their daily rows store hours and are clustered
+# by (day, employee_name): a month reads back sequentially, already sorted
+ARCHIVE_DAILY_SELECT = "SELECT employee_name, day, first_in, last_out, hours, count, site_id FROM attendance_daily"
+ARCHIVE_SCHEMA = (
+    '''CREATE TABLE IF NOT EXISTS attendance (
+        id INTEGER PRIMARY KEY,
+        employee_name TEXT NOT NULL,
+        latitude REAL,
+        longitude REAL,
+        location_name TEXT,
+        timestamp DATETIME,
+        image_path TEXT,
+        site_id TEXT,
+        in_fence INTEGER,
+        event_type TEXT,
+        day TEXT
+    )''',
+    '''CREATE TABLE IF NOT EXISTS attendance_daily (
+        employee_name TEXT NOT NULL,
+        day TEXT NOT NULL,
+        first_in DATETIME,
+        last_out DATETIME,
+        hours REAL,
+        count INTEGER NOT NULL DEFAULT 0,
+        site_id TEXT,
+        PRIMARY KEY (day, employee_name)
+    ) WITHOUT ROWID''',
+    "CREATE INDEX IF NOT EXISTS idx_attendance_employee ON attendance (employee_name)",
+    "CREATE INDEX IF NOT EXISTS idx_attendance_daily_employee ON attendance_daily (employee_name)",
+)
+MONTH_OF_ROW = "substr(COALESCE(day, date(timestamp)), 1, 7)"
+
+
+def archive_path(month, archive_dir=ARCHIVE_DIR):
+    """Archive file for a 'YYYY-MM' month"""
+    return os.path.join(archive_dir, f"attendance_{month.replace('-', '_')}.db")
+
+
+def archived_months(archive_dir=ARCHIVE_DIR):
+    """Sorted 'YYYY-MM' months that have an archive file"""
+    months = []
+    for path in glob.glob(os.path.join(archive_dir, "attendance_????_??.db")):
+        stem = os.path.basename(path)[len("attendance_"):-len(".db")]
+        months.append(stem.replace("_", "-"))
+    return sorted(months)
+
+
+def _shift_month(month, delta):
+    year, mon = int(month[:4]), int(month[5:7])
+    index = year * 12 + mon - 1 + delta
+    return f"{index // 12:04d}-{index % 12 + 1:02d}"
+
+
+def archive_closed_months(keep=KEEP_CLOSED_MONTHS, archive_dir=ARCHIVE_DIR, now=None):
+    """Move raw rows and daily summaries of old months into per-month archive files
+
+    Months before the current month minus keep are written to
+    archive/attendance_YYYY_MM.db (merged with any existing archive for
+    that month), checked, and then deleted from the live database.
+    attendance_monthly stays live, so monthly reports never need the
+    archives. Returns {month: rows archived}.
+    """
+    conn = get_connection()
+    current = (now or datetime.now()).strftime("%Y-%m")
+    cutoff = _shift_month(current, -keep)
+    months = [row[0] for row in conn.execute(
+        f"SELECT DISTINCT {MONTH_OF_ROW} FROM attendance WHERE {MONTH_OF_ROW} < ? ORDER BY 1", (cutoff,))]
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(attendance)")]
+    archived = {}
+    os.makedirs(archive_dir, exist_ok=True)
+    for month in months:
+        rows = conn.execute(f"SELECT * FROM attendance WHERE {MONTH_OF_ROW} = ?", (month,)).fetchall()
+        path = archive_path(month, archive_dir)
+        archive = sqlite3.connect(path)
+        try:
+            with archive:
+                for ddl in ARCHIVE_SCHEMA:
+                    archive.execute(ddl)
+                archive.executemany(
+                    f"INSERT OR REPLACE INTO attendance ({', '.join(columns)}) "
+                    f"VALUES ({', '.join('?' * len(columns))})", rows)
+                # Recompute the month's daily summaries from all of its archived rows
+                archive.execute("DELETE FROM attendance_daily")
+                archive.execute(f'''
+                    INSERT INTO attendance_daily (employee_name, day, first_in, last_out, hours, count, site_id)
+                    SELECT employee_name, day, first_in, last_out, {HOURS_SQL}, count, site_id
+                    FROM ({SUMMARY_SELECT_SQL})
+                ''')
+            stored = archive.execute("SELECT COUNT(*) FROM attendance WHERE id IN "
+                                     f"(SELECT value FROM json_each(?))",
+                                     (json.dumps([row[0] for row in rows]),)).fetchone()[0]
+            archive.execute("VACUUM")
+        finally:
+            archive.close()
+        if stored != len(rows):
+            print(f"Archive {path} is missing rows ({stored}/{len(rows)}); keeping {month} live")
+            continue
+        with conn:
+            # The delete triggers take the month out of attendance_monthly; put it back
+            monthly = conn.execute("SELECT employee_name, month, days, count, seconds FROM attendance_monthly "
+                                   "WHERE month = ?", (month,)).fetchall()
+            conn.execute(f"DELETE FROM attendance WHERE {MONTH_OF_ROW} = ?", (month,))
+            conn.execute("DELETE FROM attendance_daily WHERE substr(day, 1, 7) = ?", (month,))
+            conn.executemany("INSERT OR REPLACE INTO attendance_monthly (employee_name, month, days, count, seconds) "
+                             "VALUES (?, ?, ?, ?, ?)", monthly)
+        archived[month] = len(rows)
+    return archived
+
+
+def _archives_between(start_day, end_day, archive_dir):
+    """(path, fully_covered) for archive files whose month overlaps [start_day, end_day]"""
+    first = start_day[:7] if start_day else "0000-00"
+    last = end_day[:7] if end_day else "9999-99"
+    archives = []
+    for month in archived_months(archive_dir):
+        if first <= month <= last:
+            covered = ((not start_day or start_day <= f"{month}-01")
+                       and (not end_day or end_day >= f"{month}-31"))
+            archives.append((archive_path(month, archive_dir), covered))
+    return archives
+
+
+def _day_filter(start_day=None, end_day=None, employee=None, day_column="day"):
+    clauses, params = [], []
+    if start_day:
+        clauses.append(f"{day_column} >= ?")
+        params.append(start_day)
+    if end_day:
+        clauses.append(f"{day_column} <= ?")
+        params.append(end_day)
+    if employee is not None:
+        clauses.append("employee_name = ?")
+        params.append(employee)
+    return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+
+def daily_report(start_day=None, end_day=None, employee=None, archive_dir=ARCHIVE_DIR):
+    """First-in, last-out, hours, mark count and site per employee and day
+
+    Days are inclusive 'YYYY-MM-DD' strings. Archived months are read from
+    their archive files, so the result spans live and archived data.
+    Rows are (employee_name, day, first_in, last_out, hours, count, site_id)
+    ordered by day, then employee.
+    """
+    order = " ORDER BY day, employee_name"
+    parts = []
+    for path, covered in _archives_between(start_day, end_day, archive_dir):
+        # A month wholly inside the range needs no day bounds: a plain scan
+        where, params = _day_filter(None if covered else start_day, None if covered else end_day, employee)
+        archive = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            parts.append(archive.execute(ARCHIVE_DAILY_SELECT + where + order, params).fetchall())
+        finally:
+            archive.close()
+    where, params = _day_filter(start_day, end_day, employee)
+    parts.append(get_connection().execute(DAILY_SELECT + where + order, params).fetchall())
+
+    rows = []
+    in_order = True
+    for part in parts:
+        if part and rows and (part[0][1], part[0][0]) < (rows[-1][1], rows[-1][0]):
+            in_order = False
+        rows.extend(part)
+    if not in_order:
+        # Only when a month is both archived and live (e.g. a late row)
+        rows.sort(key=lambda row: (row[1], row[0]))
+    return rows
+
+
+def monthly_report(start_month=None, end_month=None, employee=None):
+    """Days present, mark count and hours per employee and 'YYYY-MM' month
+
+    Read from the live attendance_monthly table, which is never archived.
+    Rows are (employee_name, month, days, count, hours) ordered by month,
+    then employee.
+    """
+    where, params = _day_filter(start_month, end_month, employee, day_column="month")
+    return get_connection().execute(f'''
+        SELECT employee_name, month, days, count, ROUND(seconds / 3600.0, 2) AS hours
+        FROM attendance_monthly{where}
+        ORDER BY month, employee_name
+    ''', params).fetchall()
+
+
+def iter_all_records(start_day=None, end_day=None, employee=None, archive_dir=ARCHIVE_DIR):
+    """Yield raw attendance rows from the archives, then the live table, in id order per source"""
+    where, params = _day_filter(start_day, end_day, employee, day_column="COALESCE(day, date(timestamp))")
+    sql = f"SELECT * FROM attendance{where} ORDER BY id"
+    for path, _ in _archives_between(start_day, end_day, archive_dir):
+        archive = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+        try:
+            yield from archive.execute(sql, params)
+        finally:
+            archive.close()
+    yield from get_connection().execute(sql, params)
+
+
+def rebuild_summaries(conn=None, archive_dir=ARCHIVE_DIR):
+    """Recompute the live daily and monthly summaries from raw and archived rows
+
+    Use after bulk repairs or a restore. An archived day that still has
+    live rows (an interrupted archive run, or a late row) is counted from
+    the live rows only, so it is never counted twice.
+    """
+    conn = conn or get_connection()
+    with conn:
+        conn.execute("DELETE FROM attendance_monthly")
+        conn.execute("DELETE FROM attendance_daily")
+        conn.execute(SUMMARY_BACKFILL_SQL)
+        for month in archived_months(archive_dir):
+            live = set(conn.execute("SELECT employee_name, day FROM attendance_daily WHERE substr(day, 1, 7) = ?",
+                                    (month,)))
+            archive = sqlite3.connect(f"file:{archive_path(month, archive_dir)}?mode=ro", uri=True)
+            try:
+                days = archive.execute('''
+                    SELECT employee_name, day, count, (julianday(last_out) - julianday(first_in)) * 86400
+                    FROM attendance_daily
+                ''').fetchall()
+            finally:
+                archive.close()
+            sums = {}
+            for employee, day, count, seconds in days:
+                if (employee, day) in live:
+                    continue
+                total = sums.setdefault((employee, day[:7]), [0, 0, 0.0])
+                total[0] += 1
+                total[1] += count
+                total[2] += seconds or 0.0
+            totals = [key + tuple(total) for key, total in sums.items()]
+            conn.executemany('''
+                INSERT INTO attendance_monthly (employee_name, month, days, count, seconds)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (employee_name, month) DO UPDATE SET
+                    days = days + excluded.days,
+                    count = count + excluded.count,
+                    seconds = seconds + excluded.seconds
+            ''', totals)
@@ -0,0 +1,242 @@
+import hashlib
+import os
+import queue
+import threading
+import time
+from collections import deque
+
+import cv2
+
+from modules.metrics import metrics
+
+SNAPSHOT_DIR = "snapshots"
+# Stored face crops are re-encoded to at most this many pixels on the long side
+MAX_SIDE = 320
+JPEG_QUALITY = 85
+THUMB_SIDE = 64
+THUMB_QUALITY = 70
+# Crops waiting to be written; further submissions are dropped (and counted)
+QUEUE_SIZE = 64
+# Blobs younger than this are never garbage collected (their rows may not be committed yet)
+GC_MIN_AGE_S = 3600
+
+
+def snapshot_digest(image):
+    """Content address of a crop: sha256 over its shape and pixels
+
+    Hashing the pixels rather than the JPEG lets the caller know the path
+    before the (slower) encode and write have happened. Encoding is
+    deterministic, so equal crops map to equal blobs.
+    """
+    h = hashlib.sha256()
+    h.update(repr(image.shape).encode())
+    h.update(image.tobytes())
+    return h.hexdigest()
+
+
+def encode_jpeg(image, max_side, quality):
+    """Downscale so the long side is at most max_side, then JPEG-encode"""
+    height, width = image.shape[:2]
+    scale = max_side / float(max(height, width, 1))
+    if scale < 1.0:
+        size = (max(1, int(width * scale)), max(1, int(height * scale)))
+        image = cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+    ok, data = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise ValueError("JPEG encoding failed")
+    return data.tobytes()
+
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+class SnapshotStore:
+    """Content-addressed, deduplicated store for attendance face crops
+
+    Blobs live at <root>/blobs/ab/cd/<sha256>.jpg with a thumbnail at
+    <root>/thumbs/ab/cd/<sha256>.jpg. put() is synchronous; submit()
+    returns the blob path at once and leaves the encode and write to a
+    background thread, so the capture loop never waits on the disk.
+    """
+
+    def __init__(self, root=SNAPSHOT_DIR, max_side=MAX_SIDE, quality=JPEG_QUALITY,
+                 thumb_side=THUMB_SIDE, thumb_quality=THUMB_QUALITY, queue_size=QUEUE_SIZE):
+        self.root = root
+        self.max_side = max_side
+        self.quality = quality
+        self.thumb_side = thumb_side
+        self.thumb_quality = thumb_quality
+        self.written = 0
+        self.deduplicated = 0
+        self.dropped = 0
+        self.failed = 0
+        self.bytes_written = 0
+        self.latencies = deque(maxlen=1024)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _relative(self, kind, digest):
+        return os.path.join(self.root, kind, digest[:2], digest[2:4], f"{digest}.jpg")
+
+    def blob_path(self, digest):
+        return self._relative("blobs", digest)
+
+    def thumb_path(self, digest):
+        return self._relative("thumbs", digest)
+
+    @staticmethod
+    def digest_of(path):
+        """Digest from a blob or thumbnail path, or None for other paths"""
+        name = os.path.basename(path or "")
+        stem = name[:-len(".jpg")] if name.endswith(".jpg") else ""
+        return stem if len(stem) == 64 and all(c in "0123456789abcdef" for c in stem) else None
+
+    def _store(self, digest, image):
+        start = time.perf_counter()
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            with self._lock:
+                self.deduplicated += 1
+            return path
+        with metrics.stage("snapshot_write"):
+            blob = encode_jpeg(image, self.max_side, self.quality)
+            thumb = encode_jpeg(image, self.thumb_side, self.thumb_quality)
+            # Thumbnail first: a present blob always has its thumbnail
+            _write_atomic(self.thumb_path(digest), thumb)
+            _write_atomic(path, blob)
+        with self._lock:
+            self.written += 1
+            self.bytes_written += len(blob) + len(thumb)
+            self.latencies.append(time.perf_counter() - start)
+        return path
+
+    def put(self, image):
+        """Store a BGR crop now; returns its blob path"""
+        return self._store(snapshot_digest(image), image)
+
+    def submit(self, image):
+        """Queue a BGR crop for storage and return the path it will have
+
+        Returns None if the queue is full; the crop is then dropped.
+        """
+        self.start()
+        digest = snapshot_digest(image)
+        try:
+            self._queue.put_nowait((digest, image.copy()))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            metrics.incr("snapshots_dropped")
+            return None
+        return self.blob_path(digest)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                digest, image = item
+                try:
+                    self._store(digest, image)
+                except (OSError, ValueError) as e:
+                    with self._lock:
+                        self.failed += 1
+                    print(f"Could not store snapshot {digest}: {str(e)}")
+            finally:
+                self._queue.task_done()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def flush(self):
+        """Wait until every queued crop has been written"""
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+
+    def disk_usage(self):
+        """(files, bytes) for blobs and for thumbnails"""
+        usage = {}
+        for kind in ("blobs", "thumbs"):
+            files = size = 0
+            for dirpath, _, names in os.walk(os.path.join(self.root, kind)):
+                for name in names:
+                    if name.endswith(".jpg"):
+                        files += 1
+                        size += os.path.getsize(os.path.join(dirpath, name))
+            usage[kind] = (files, size)
+        return usage
+
+    def stats(self, with_disk=False):
+        with self._lock:
+            ordered = sorted(self.latencies)
+            stats = {
+                "written": self.written,
+                "deduplicated": self.deduplicated,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "pending": self._queue.qsize(),
+                "bytes_written": self.bytes_written,
+                "write_p50_ms": round(ordered[len(ordered) // 2] * 1000, 2) if ordered else 0.0,
+                "write_p95_ms": round(ordered[int(len(ordered) * 0.95)] * 1000, 2) if ordered else 0.0,
+            }
+        if with_disk:
+            usage = self.disk_usage()
+            stats["blobs"], stats["blob_bytes"] = usage["blobs"]
+            stats["thumbs"], stats["thumb_bytes"] = usage["thumbs"]
+        return stats
+
+    def gc(self, referenced_paths, min_age_s=GC_MIN_AGE_S, dry_run=False):
+        """Delete blobs (and thumbnails) no attendance row refers to
+
+        referenced_paths is an iterable of image_path values. Blobs newer
+        than min_age_s are kept so in-flight writes are never collected.
+        Returns (blobs removed, bytes freed).
+        """
+        referenced = {self.digest_of(p) for p in referenced_paths}
+        cutoff = time.time() - min_age_s
+        removed = freed = 0
+        for dirpath, _, names in os.walk(os.path.join(self.root, "blobs")):
+            for name in names:
+                digest = self.digest_of(name)
+                if digest is None or digest in referenced:
+                    continue
+                path = os.path.join(dirpath, name)
+                st = os.stat(path)
+                if st.st_mtime > cutoff:
+                    continue
+                removed += 1
+                freed += st.st_size
+                thumb = self.thumb_path(digest)
+                if not dry_run:
+                    os.remove(path)
+                    if os.path.exists(thumb):
+                        freed += os.path.getsize(thumb)
+                        os.remove(thumb)
+        return removed, freed
+
+
+_store = None
+
+
+def get_snapshot_store():
+    """Process-wide store with its background writer started"""
+    global _store
+    if _store is None:
+        _store = SnapshotStore().start()
+    return _store
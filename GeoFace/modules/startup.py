@@ -0,0 +1,160 @@
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+from modules.metrics import metrics
+
+# Modules worth watching in the import profile: the heavy third-party ones
+# and the entry points that pull them in
+PROFILE_MODULES = ("numpy", "cv2", "PIL.ImageTk", "face_recognition", "modules.detection", "ui.gui")
+# Dummy frame pushed through detection and encoding before the first real one
+WARMUP_SHAPE = (480, 640, 3)
+WARMUP_BOX = (140, 400, 340, 240)
+
+# Milestones in the order they normally happen
+MILESTONES = ("window_shown", "first_frame", "models_imported", "gallery_loaded", "warmed_up",
+              "first_recognition")
+
+
+class StartupClock:
+    """Seconds from process start to each startup milestone
+
+    Create it before the heavy imports (at the top of main.py / ui/gui.py);
+    its creation time stands in for process start. Only the first mark of
+    each milestone counts. Marks are also recorded as startup_<name> in the
+    metrics registry so they show up in the JSON and Prometheus exports.
+    """
+
+    def __init__(self, origin=None):
+        self.origin = time.perf_counter() if origin is None else origin
+        self.marks = {}
+        self._lock = threading.Lock()
+
+    def mark(self, name):
+        """Record a milestone; returns True the first time it is reached"""
+        with self._lock:
+            if name in self.marks:
+                return False
+            self.marks[name] = time.perf_counter() - self.origin
+        metrics.observe(f"startup_{name}", self.marks[name])
+        return True
+
+    def report(self):
+        """{milestone: milliseconds since start} for the milestones reached so far"""
+        with self._lock:
+            marks = dict(self.marks)
+        order = [m for m in MILESTONES if m in marks] + sorted(set(marks) - set(MILESTONES))
+        return {name: round(marks[name] * 1000, 1) for name in order}
+
+    def summary(self):
+        return ", ".join(f"{name} {ms / 1000:.2f}s" for name, ms in self.report().items())
+
+
+def warm_up(detection=None):
+    """Run detection and encoding once on a dummy frame
+
+    The first real frame otherwise pays for dlib's lazy initialisation
+    (detector pyramid buffers, predictor and network first use).
+    """
+    from modules.detection import encode_faces, locate_faces
+
+    frame = np.zeros(WARMUP_SHAPE, dtype=np.uint8)
+    # A lighter box where the encoder expects a face, so the crop is not uniform
+    top, right, bottom, left = WARMUP_BOX
+    frame[top:bottom, left:right] = 128
+    locate_faces(frame, **(detection or {}))
+    encode_faces(frame, [WARMUP_BOX])
+
+
+class ModelLoader:
+    """Imports face_recognition, loads the gallery and warms up on a background thread
+
+    load_gallery(progress) builds and returns the matcher; it may call
+    progress(done, total) while it works. The caller polls ready, matcher,
+    error and progress (stage, done, total), or blocks on wait().
+    """
+
+    def __init__(self, load_gallery, detection=None, clock=None, warm=True):
+        self.load_gallery = load_gallery
+        self.detection = detection
+        self.clock = clock or StartupClock()
+        self.warm = warm
+        self.matcher = None
+        self.error = None
+        self.progress = ("starting", 0, 0)
+        self._done = threading.Event()
+        self._thread = None
+
+    @property
+    def ready(self):
+        return self.matcher is not None
+
+    @property
+    def finished(self):
+        return self._done.is_set()
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="model-loader", daemon=True)
+            self._thread.start()
+        return self
+
+    def wait(self, timeout=None):
+        """Block until loading finishes; returns the matcher (None on failure)"""
+        self._done.wait(timeout)
+        return self.matcher
+
+    def _set_progress(self, stage, done=0, total=0):
+        self.progress = (stage, done, total)
+
+    def _run(self):
+        try:
+            self._set_progress("importing models")
+            import face_recognition  # noqa: F401  dlib and its model files
+            self.clock.mark("models_imported")
+
+            self._set_progress("loading gallery")
+            matcher = self.load_gallery(lambda done, total: self._set_progress("loading gallery", done, total))
+            self.clock.mark("gallery_loaded")
+
+            if self.warm:
+                self._set_progress("warming up")
+                warm_up(self.detection)
+                self.clock.mark("warmed_up")
+            self.matcher = matcher
+            self._set_progress("ready")
+        except Exception as e:
+            self.error = e
+            self._set_progress("failed")
+            print(f"Could not load face recognition models: {str(e)}")
+        finally:
+            self._done.set()
+
+
+def profile_imports(modules=PROFILE_MODULES, python=sys.executable, cwd=None):
+    """Import each module in a fresh interpreter with -X importtime
+
+    Returns {module: (total_ms, [(cumulative_ms, self_ms, name), ...])}
+    with the heaviest imports first; total_ms is None if the import failed.
+    """
+    profile = {}
+    for module in modules:
+        proc = subprocess.run([python, "-X", "importtime", "-c", f"import {module}"],
+                              capture_output=True, text=True, cwd=cwd)
+        entries = []
+        for line in proc.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            parts = [part.strip() for part in line[len("import time:"):].split("|")]
+            if not parts[0].isdigit():
+                continue  # the header line
+            entries.append((int(parts[1]) / 1000, int(parts[0]) / 1000, parts[2]))
+        entries.sort(reverse=True)
+        total = None
+        if proc.returncode == 0:
+            total = next((c for c, _, name in entries if name == module), entries[0][0] if entries else 0.0)
+        profile[module] = (total, entries)
+    return profile
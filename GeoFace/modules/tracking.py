@@ -0,0 +1,141 @@
+import itertools
+import threading
+import time
+
+from modules.detection import encode_faces, locate_faces
+
+
+def box_iou(a, b):
+    """Intersection over union of two (top, right, bottom, left) boxes"""
+    top, bottom = max(a[0], b[0]), min(a[2], b[2])
+    left, right = max(a[3], b[3]), min(a[1], b[1])
+    inter = max(0, bottom - top) * max(0, right - left)
+    if inter == 0:
+        return 0.0
+    area_a = (a[2] - a[0]) * (a[1] - a[3])
+    area_b = (b[2] - b[0]) * (b[1] - b[3])
+    return inter / float(area_a + area_b - inter)
+
+
+def box_center_distance(a, b):
+    """Centre distance of two boxes relative to the size of the first one"""
+    ay, ax = (a[0] + a[2]) / 2.0, (a[1] + a[3]) / 2.0
+    by, bx = (b[0] + b[2]) / 2.0, (b[1] + b[3]) / 2.0
+    size = max(a[2] - a[0], a[1] - a[3], 1)
+    return ((ay - by) ** 2 + (ax - bx) ** 2) ** 0.5 / size
+
+
+class Track:
+    """A face followed across frames; match is the last recognition result"""
+
+    def __init__(self, track_id, box):
+        self.track_id = track_id
+        self.box = box
+        self.match = None
+        self.misses = 0
+        self.frames_since_verify = 0
+
+    @property
+    def label(self):
+        return self.match.label if self.match is not None else None
+
+
+class FaceTracker:
+    """Associates detections across frames so faces are encoded once per visit
+
+    Detections are matched to existing tracks greedily by IoU, falling back
+    to centre distance for fast movement. A track is encoded when it is new
+    and again every reverify_every frames; in between it carries its last
+    identity forward. Tracks unseen for max_misses frames are dropped.
+    """
+
+    def __init__(self, iou_threshold=0.3, max_center_distance=0.5, max_misses=5, reverify_every=15):
+        self.iou_threshold = iou_threshold
+        self.max_center_distance = max_center_distance
+        self.max_misses = max_misses
+        self.reverify_every = reverify_every
+        self.tracks = []
+        self.encodings_run = 0
+        self.encodings_avoided = 0
+        self.started_at = time.perf_counter()
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _associate(self, locations):
+        pairs = []
+        for ti, track in enumerate(self.tracks):
+            for di, box in enumerate(locations):
+                iou = box_iou(track.box, box)
+                if iou >= self.iou_threshold:
+                    pairs.append((1.0 + iou, ti, di))
+                else:
+                    dist = box_center_distance(track.box, box)
+                    if dist <= self.max_center_distance:
+                        pairs.append((1.0 - dist, ti, di))
+        pairs.sort(reverse=True)
+
+        assigned, used_tracks, used_dets = {}, set(), set()
+        for _, ti, di in pairs:
+            if ti in used_tracks or di in used_dets:
+                continue
+            assigned[di] = self.tracks[ti]
+            used_tracks.add(ti)
+            used_dets.add(di)
+        return assigned
+
+    def update(self, locations):
+        """Advance one frame; returns (tracks in detection order, tracks to encode)"""
+        with self._lock:
+            assigned = self._associate(locations)
+            for track in self.tracks:
+                if track not in assigned.values():
+                    track.misses += 1
+
+            current, pending = [], []
+            for di, box in enumerate(locations):
+                track = assigned.get(di)
+                if track is None:
+                    track = Track(next(self._ids), box)
+                    self.tracks.append(track)
+                track.box = box
+                track.misses = 0
+                track.frames_since_verify += 1
+                if track.match is None or track.frames_since_verify >= self.reverify_every:
+                    pending.append(track)
+                else:
+                    self.encodings_avoided += 1
+                current.append(track)
+
+            self.tracks = [t for t in self.tracks if t.misses <= self.max_misses]
+            return current, pending
+
+    def assign(self, tracks, matches):
+        """Store fresh recognition results on the tracks that were encoded"""
+        with self._lock:
+            for track, match in zip(tracks, matches):
+                track.match = match
+                track.frames_since_verify = 0
+                self.encodings_run += 1
+
+    def stats(self):
+        minutes = max((time.perf_counter() - self.started_at) / 60.0, 1e-9)
+        return {
+            "active_tracks": len(self.tracks),
+            "encodings_run": self.encodings_run,
+            "encodings_avoided": self.encodings_avoided,
+            "avoided_per_min": round(self.encodings_avoided / minutes, 1),
+        }
+
+
+def track_and_recognize(rgb, tracker, matcher, detection=None):
+    """Detect every frame but encode and match only new or due tracks
+
+    Returns (location, Match) pairs like main.recognize_frame; tracks still
+    waiting for their first encoding are left out.
+    """
+    locations = locate_faces(rgb, **(detection or {}))
+    tracks, pending = tracker.update(locations)
+    if pending:
+        encodings = encode_faces(rgb, [t.box for t in pending])
+        tracker.assign(pending, matcher.match(encodings))
+    return [(t.box, t.match) for t in tracks if t.match is not None]
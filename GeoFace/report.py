@@ -0,0 +1,56 @@
+import argparse
+import csv
+import sys
+from modules.database import init_db
+from modules.reporting import archive_closed_months, daily_report, monthly_report, rebuild_summaries
+
+DAILY_HEADER = ["employee", "day", "first_in", "last_out", "hours", "marks", "site_id"]
+MONTHLY_HEADER = ["employee", "month", "days", "marks", "hours"]
+
+def write_rows(header, rows, path):
+    """Write rows as CSV to path, or as aligned text to stdout"""
+    if path:
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(header)
+            writer.writerows(rows)
+        print(f"Wrote {len(rows)} rows to {path}")
+        return
+    print("  ".join(f"{h:<12}" for h in header))
+    for row in rows:
+        print("  ".join(f"{'' if v is None else str(v):<12}" for v in row))
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance hours reports and monthly archiving")
+    sub = parser.add_subparsers(dest="command", required=True)
+    daily = sub.add_parser("daily", help="first-in / last-out and hours per employee per day")
+    daily.add_argument("--from", dest="start", help="first day, YYYY-MM-DD")
+    daily.add_argument("--to", dest="end", help="last day, YYYY-MM-DD")
+    monthly = sub.add_parser("monthly", help="days present and hours per employee per month")
+    monthly.add_argument("--from", dest="start", help="first month, YYYY-MM")
+    monthly.add_argument("--to", dest="end", help="last month, YYYY-MM")
+    for report in (daily, monthly):
+        report.add_argument("--employee")
+        report.add_argument("--csv", help="write the report to this CSV file")
+    archive = sub.add_parser("archive", help="move closed months into archive/attendance_YYYY_MM.db")
+    archive.add_argument("--keep", type=int, default=1, help="closed months to keep live")
+    sub.add_parser("rebuild", help="recompute the summary tables from raw and archived rows")
+    args = parser.parse_args()
+
+    init_db()
+    if args.command == "daily":
+        write_rows(DAILY_HEADER, daily_report(args.start, args.end, args.employee), args.csv)
+    elif args.command == "monthly":
+        write_rows(MONTHLY_HEADER, monthly_report(args.start, args.end, args.employee), args.csv)
+    elif args.command == "archive":
+        archived = archive_closed_months(args.keep)
+        for month, rows in archived.items():
+            print(f"Archived {rows} rows for {month}")
+        if not archived:
+            print("Nothing to archive")
+    elif args.command == "rebuild":
+        rebuild_summaries()
+        print("Summary tables rebuilt")
+
+if __name__ == "__main__":
+    sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,38 @@
+import argparse
+import sys
+from modules.database import init_db
+from modules.reporting import iter_all_records
+from modules.snapshots import GC_MIN_AGE_S, SNAPSHOT_DIR, SnapshotStore
+
+IMAGE_PATH_COLUMN = 6
+
+def referenced_paths():
+    """image_path of every live and archived attendance row"""
+    for row in iter_all_records():
+        if row[IMAGE_PATH_COLUMN]:
+            yield row[IMAGE_PATH_COLUMN]
+
+def main():
+    parser = argparse.ArgumentParser(description="Attendance snapshot store maintenance")
+    parser.add_argument("--dir", default=SNAPSHOT_DIR, help="snapshot store directory")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="blob and thumbnail counts and sizes")
+    gc = sub.add_parser("gc", help="delete snapshots no attendance row refers to")
+    gc.add_argument("--min-age", type=float, default=GC_MIN_AGE_S,
+                    help="keep blobs younger than this many seconds")
+    gc.add_argument("--dry-run", action="store_true", help="only report what would be deleted")
+    args = parser.parse_args()
+
+    store = SnapshotStore(args.dir)
+    if args.command == "stats":
+        stats = store.stats(with_disk=True)
+        print(f"{stats['blobs']} snapshots, {stats['blob_bytes'] / 1e6:.2f} MB; "
+              f"{stats['thumbs']} thumbnails, {stats['thumb_bytes'] / 1e6:.2f} MB")
+    elif args.command == "gc":
+        init_db()
+        removed, freed = store.gc(referenced_paths(), args.min_age, args.dry_run)
+        action = "Would delete" if args.dry_run else "Deleted"
+        print(f"{action} {removed} orphaned snapshots ({freed / 1e6:.2f} MB)")
+
+if __name__ == "__main__":
+    sys.exit(main())
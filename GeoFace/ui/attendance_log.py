@@ -0,0 +1,233 @@
+"""
+Incremental, windowed attendance log for the Tkinter GUI
+"""
+import queue
+import threading
+import tkinter as tk
+
+from modules.database import get_changelog_seq, get_records_since, get_updated_records_since, query_records
+
+# Newest rows shown when following the live end of the table
+LOG_WINDOW = 500
+# Rows fetched per page when scrolling back (or forward again)
+PAGE_ROWS = 200
+# Upper bound on rows held by the Treeview; pages beyond it evict the far end
+MAX_ROWS = 1500
+# How often new rows are polled for, in ms
+POLL_MS = 2000
+# How often fetched results are drained onto the Tk thread, in ms
+DRAIN_MS = 50
+# Scroll position (fraction) at which the next page is requested
+EDGE = 0.05
+
+
+def log_values(record):
+    """Map an attendance row to the (id, name, time, location, image) columns"""
+    record_id, name, _lat, _lon, place, timestamp, image_path = record[:7]
+    return record_id, name, timestamp, place or "", image_path or ""
+
+
+class AttendanceLog:
+    """Keeps a ttk.Treeview in sync with the attendance table
+
+    The table is shown newest first. Only rows newer than the high-water
+    mark are fetched on each poll and inserted at the top; rows changed in
+    place (check-outs) are found through the change log and refreshed if
+    they are on screen. Scrolling near
+    the bottom loads an older page, and scrolling back to the top loads
+    newer pages again, so the widget never holds more than MAX_ROWS items.
+
+    Queries run on one background thread; results are handed to the Tk
+    thread through a queue drained with after(), so the UI never waits on
+    the database.
+    """
+
+    def __init__(self, root, table, scrollbar, window=LOG_WINDOW, page=PAGE_ROWS,
+                 max_rows=MAX_ROWS, poll_ms=POLL_MS):
+        self.root = root
+        self.table = table
+        self.scrollbar = scrollbar
+        self.window = window
+        self.page = page
+        self.max_rows = max_rows
+        self.poll_ms = poll_ms
+        self.last_id = 0         # high-water mark: newest id seen in the database
+        self.last_seq = 0        # change-log position of the last refresh
+        self.newest_id = None    # newest id in the widget
+        self.oldest_id = None    # oldest id in the widget
+        self.at_head = True      # widget holds the newest rows
+        self.exhausted = False   # nothing older than oldest_id
+        self.pending = None      # kind of the outstanding request, if any
+        self.closed = False
+        self._requests = queue.Queue()
+        self._results = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="attendance-log", daemon=True)
+        self._worker.start()
+        self.table.configure(yscrollcommand=self._on_scroll)
+        self.root.after(DRAIN_MS, self._drain)
+        self.root.after(self.poll_ms, self._poll)
+
+    # ---- background thread ----
+    def _run(self):
+        while True:
+            request = self._requests.get()
+            if request is None:
+                return
+            kind, arg = request
+            try:
+                if kind == "head":
+                    # Read the change-log position first so no later update is missed
+                    seq = get_changelog_seq()
+                    rows = (seq, query_records(limit=self.window))
+                elif kind == "new":
+                    last_id, last_seq = arg
+                    rows = (get_records_since(last_id, limit=self.window + 1),
+                            get_updated_records_since(last_seq))
+                elif kind == "older":
+                    rows = query_records(before_id=arg, limit=self.page)
+                else:  # "newer": the page just above the widget, oldest first
+                    rows = query_records(after_id=arg, limit=self.page, newest_first=False)
+                self._results.put((kind, arg, rows, None))
+            except Exception as e:
+                self._results.put((kind, arg, [], e))
+
+    def _request(self, kind, arg=None):
+        if self.pending is None and not self.closed:
+            self.pending = kind
+            self._requests.put((kind, arg))
+
+    # ---- Tk thread ----
+    def reload(self):
+        """Jump back to the newest rows"""
+        self._request("head")
+
+    def poll_now(self):
+        """Fetch rows added since the last poll without waiting for the timer"""
+        self._request("new", (self.last_id, self.last_seq))
+
+    def close(self):
+        self.closed = True
+        self._requests.put(None)
+
+    def _poll(self):
+        if self.closed:
+            return
+        self.poll_now()
+        self.root.after(self.poll_ms, self._poll)
+
+    def _drain(self):
+        if self.closed:
+            return
+        applied = False
+        try:
+            while True:
+                kind, arg, rows, error = self._results.get_nowait()
+                self.pending = None
+                if error is not None:
+                    print(f"Error loading attendance log: {str(error)}")
+                    continue
+                try:
+                    getattr(self, "_apply_" + kind)(arg, rows)
+                except tk.TclError as e:
+                    print(f"Error showing attendance log: {str(e)}")
+                applied = True
+        except queue.Empty:
+            pass
+        finally:
+            # Always keep draining, or one bad result would freeze the log
+            self.root.after(DRAIN_MS, self._drain)
+        if applied:
+            # A scroll that arrived while a request was pending is served now
+            self._check_edges(*self.table.yview())
+
+    def _apply_head(self, _arg, result):
+        self.last_seq, rows = result
+        self.table.delete(*self.table.get_children())
+        for record in rows:
+            self.table.insert("", "end", iid=str(record[0]), values=log_values(record))
+        self.newest_id = rows[0][0] if rows else None
+        self.oldest_id = rows[-1][0] if rows else None
+        self.last_id = max(self.last_id, self.newest_id or 0)
+        self.at_head = True
+        self.exhausted = len(rows) < self.window
+        self.table.yview_moveto(0)
+
+    def _apply_new(self, _arg, result):
+        rows, (self.last_seq, updated) = result
+        for record in updated:
+            iid = str(record[0])
+            if self.table.exists(iid):
+                self.table.item(iid, values=log_values(record))
+        if not rows:
+            return
+        if len(rows) > self.window:
+            # Burst larger than the window: show the latest rows outright
+            self._request("head")
+            return
+        self.last_id = rows[-1][0]
+        if not self.at_head:
+            # The user is reading older pages; the rows show up on return to the top
+            return
+        self._insert_top(rows)
+
+    def _apply_older(self, _before_id, rows):
+        if not rows:
+            self.exhausted = True
+            return
+        for record in rows:
+            self.table.insert("", "end", iid=str(record[0]), values=log_values(record))
+        self.oldest_id = rows[-1][0]
+        if self.newest_id is None:
+            self.newest_id = rows[0][0]
+        self._trim_top()
+
+    def _apply_newer(self, _after_id, rows):
+        self._insert_top(rows)
+        if len(rows) < self.page:
+            self.at_head = True
+
+    def _insert_top(self, rows):
+        """Insert oldest-first rows above the current top item, keeping the view still"""
+        first, _ = self.table.yview()
+        inserted = 0
+        for record in rows:
+            iid = str(record[0])
+            if self.table.exists(iid):
+                continue
+            self.table.insert("", 0, iid=iid, values=log_values(record))
+            inserted += 1
+        if rows:
+            self.newest_id = rows[-1][0]
+            self.last_id = max(self.last_id, self.newest_id)
+            if self.oldest_id is None:
+                self.oldest_id = rows[0][0]
+        if first > 0:
+            self.table.yview_scroll(inserted, "units")
+        self._trim_bottom(self.window if first == 0 else self.max_rows)
+
+    def _trim_bottom(self, limit):
+        items = self.table.get_children()
+        if len(items) > limit:
+            self.table.delete(*items[limit:])
+            self.oldest_id = int(items[limit - 1])
+            self.exhausted = False
+
+    def _trim_top(self):
+        items = self.table.get_children()
+        extra = len(items) - self.max_rows
+        if extra > 0:
+            self.table.delete(*items[:extra])
+            self.table.yview_scroll(-extra, "units")
+            self.newest_id = int(items[extra])
+            self.at_head = False
+
+    def _on_scroll(self, first, last):
+        self.scrollbar.set(first, last)
+        self._check_edges(float(first), float(last))
+
+    def _check_edges(self, first, last):
+        """Request the next page when the view is near either end of the widget"""
+        if last >= 1.0 - EDGE and not self.exhausted and self.oldest_id is not None:
+            self._request("older", self.oldest_id)
+        elif first <= EDGE and not self.at_head and self.newest_id is not None:
+            self._request("newer", self.newest_id)
@@ -1,12 +1,41 @@
+import time
+STARTED_AT = time.perf_counter()  # origin of the startup milestones
 from os import name
+import queue
+import sqlite3
+import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
 from PIL import Image, ImageTk
 import cv2
-import face_recognition
+import numpy as np
 from ui.styles import Colors, Fonts, configure_styles
+from ui.attendance_log import AttendanceLog
 from modules.face_recognition import recognize_face
-from modules.database import add_attendance_record, get_all_records
+from modules.buffers import to_rgb
+from modules.database import init_db, record_attendance_event
+from modules.dedup import AttendanceCooldown
+from modules.detection import detect_and_encode, face_crop
+from modules.geofence import get_geofence
+from modules.geolocation import get_current_location, get_provider
+from modules.matcher import GalleryMatcher
+from modules.metrics import metrics, start_metrics_from_env, stop_metrics
+from modules.motion import MotionGate
+from modules.pipeline import FramePipeline
+from modules.snapshots import SnapshotStore, get_snapshot_store
+from modules.startup import ModelLoader, StartupClock
+from modules.tracking import FaceTracker, track_and_recognize
+
+# Size of the live camera image in the window
+DISPLAY_SIZE = (640, 480)
+# Share of the Tk thread the camera view may use; the refresh delay follows
+# the measured render cost so slow machines stay responsive
+UI_RENDER_SHARE = 0.5
+MIN_REFRESH_MS = 10
+MAX_REFRESH_MS = 100
+RENDER_COST_SMOOTHING = 0.2
+# How often a pending attendance mark is checked for completion
+MARK_POLL_MS = 50
 
 class GeoFaceApp:
     def __init__(self, root):
@@ -18,9 +47,25 @@ class GeoFaceApp:
         # Initialize styles
         configure_styles()
         
-        # Camera setup
+        # Camera setup; the matcher arrives from the background model loader
         self.cap = None
-        self.known_faces, self.known_names = recognize_face()
+        self.pipeline = None
+        self.shown_id = 0
+        self.render_cost = 0.0
+        self.marking = False
+        self._mark_results = queue.Queue()
+        self.startup_reported = False
+        self.matcher = None
+        self.startup_clock = StartupClock(STARTED_AT)
+        self.tracker = FaceTracker()
+        self.motion_gate = MotionGate()
+        self.current_faces = []
+        self.metrics_exporters = []
+        self.attendance_cooldown = AttendanceCooldown()
+        # Create or migrate the database schema before the first write
+        init_db()
+        # Start the background location refresh; GEOFACE_LOCATION pins fixed coordinates
+        get_provider()
         
         # UI Structure
         self.create_header()
@@ -28,6 +73,13 @@ class GeoFaceApp:
         self.create_attendance_log()
         self.create_footer()
         
+        # The window appears now; face recognition loads behind it
+        self.loader = ModelLoader(
+            lambda progress: GalleryMatcher(*recognize_face(progress=progress), tolerance=0.6),
+            clock=self.startup_clock).start()
+        self.root.after_idle(self.startup_clock.mark, "window_shown")
+        self.root.after(100, self.check_loader)
+        
     def create_header(self):
         """Top header with title and buttons"""
         header = ttk.Frame(self.root)
@@ -64,13 +116,20 @@ class GeoFaceApp:
     
     def create_camera_section(self):
         """Live camera feed display"""
-        self.camera_frame = ttk.LabelFrame
-        self.root,
-        text="Live Camera Feed",
-        padding=(10, 5)
+        self.camera_frame = ttk.LabelFrame(
+            self.root,
+            text="Live Camera Feed",
+            padding=(10, 5))
         self.camera_frame.pack(fill=tk.BOTH, expand=True, padx=20, pady=10)
         
-        self.camera_label = ttk.Label(self.camera_frame)
+        # One PhotoImage and one RGBA buffer, reused for every frame. PIL
+        # repacks 3-channel arrays into 4-byte pixels, so the buffer is RGBA
+        # and display_image wraps it without a copy
+        self.resize_buffer = np.zeros((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 3), dtype=np.uint8)
+        self.display_buffer = np.zeros((DISPLAY_SIZE[1], DISPLAY_SIZE[0], 4), dtype=np.uint8)
+        self.display_image = Image.frombuffer("RGBA", DISPLAY_SIZE, self.display_buffer, "raw", "RGBA", 0, 1)
+        self.photo = ImageTk.PhotoImage("RGBA", DISPLAY_SIZE)
+        self.camera_label = ttk.Label(self.camera_frame, image=self.photo)
         self.camera_label.pack()
     
     def create_attendance_log(self):
@@ -84,7 +143,8 @@ class GeoFaceApp:
         # Treeview (table)
         self.log_table = ttk.Treeview(
             log_frame,
-            columns=("id", "name", "time", "location"),
+            columns=("id", "name", "time", "location", "image"),
+            displaycolumns=("id", "name", "time", "location"),
             show="headings",
             height=8
         )
@@ -102,13 +162,18 @@ class GeoFaceApp:
         
         # Add scrollbar
         scrollbar = ttk.Scrollbar(log_frame, orient="vertical", command=self.log_table.yview)
-        self.log_table.configure(yscrollcommand=scrollbar.set)
+        
+        # Thumbnail of the selected record's snapshot
+        self.thumb_label = ttk.Label(log_frame)
+        self.thumb_label.pack(side=tk.RIGHT, padx=(10, 0))
+        self.log_table.bind("<<TreeviewSelect>>", self.show_thumbnail)
         
         self.log_table.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
         scrollbar.pack(side=tk.RIGHT, fill=tk.Y)
         
-        # Load initial data
-        self.refresh_log()
+        # Load initial data; new rows are polled and older pages load on scroll
+        self.attendance_log = AttendanceLog(self.root, self.log_table, scrollbar)
+        self.attendance_log.reload()
     
     def create_footer(self):
         """Status bar at bottom"""
@@ -121,69 +186,270 @@ class GeoFaceApp:
             foreground=Colors.TEXT_LIGHT
         ).pack(side=tk.LEFT)
         
+        self.tracking_label = ttk.Label(
+            footer,
+            text="",
+            foreground=Colors.TEXT_LIGHT
+        )
+        self.tracking_label.pack(side=tk.LEFT, padx=10)
+        
+        # Model loading progress, replaced by the startup timings once ready
+        self.loading_label = ttk.Label(
+            footer,
+            text="Loading face recognition...",
+            foreground=Colors.TEXT_LIGHT
+        )
+        self.loading_label.pack(side=tk.LEFT, padx=10)
+        self.loading_bar = ttk.Progressbar(footer, length=150, mode="indeterminate")
+        self.loading_bar.pack(side=tk.LEFT)
+        self.loading_bar.start(15)
+        
         ttk.Button(
             footer,
             text="Refresh Log",
             command=self.refresh_log
         ).pack(side=tk.RIGHT)
     
+    def check_loader(self):
+        """Show model loading progress; hand the matcher over once loaded"""
+        stage, done, total = self.loader.progress
+        if not self.loader.finished:
+            if total:
+                self.loading_bar.stop()
+                self.loading_bar.config(mode="determinate", maximum=total, value=done)
+            text = f"{stage.capitalize()} {done}/{total}" if total else f"{stage.capitalize()}..."
+            self.loading_label.config(text=text)
+            self.root.after(100, self.check_loader)
+            return
+        self.loading_bar.stop()
+        self.loading_bar.pack_forget()
+        if self.loader.error is not None:
+            self.loading_label.config(text="Face recognition unavailable", foreground=Colors.ERROR)
+            messagebox.showerror("Error", f"Could not load face recognition: {str(self.loader.error)}")
+            return
+        self.matcher = self.loader.matcher
+        self.loading_label.config(text="Face recognition ready")
+    
+    def show_startup_report(self):
+        """Show time to first frame and to first recognition in the footer"""
+        report = self.startup_clock.report()
+        self.loading_label.config(
+            text=f"Startup: first frame {report['first_frame'] / 1000:.1f}s, "
+                 f"first recognition {report['first_recognition'] / 1000:.1f}s")
+        print(f"Startup: {self.startup_clock.summary()}")
+    
     def start_camera(self):
         """Initialize camera feed"""
-        if not self.cap:
+        if not self.pipeline:
             self.cap = cv2.VideoCapture(0)
+            # Capture and recognition run on background threads; the Tk
+            # thread only renders the newest frame and result
+            self.pipeline = FramePipeline(self.cap, self.recognize).start()
             self.status_label.config(text="Camera: ON", foreground=Colors.SUCCESS)
             self.show_camera_feed()
     
+    def recognize(self, frame):
+        """Recognize tracked faces in a BGR frame (runs on the recognition thread)"""
+        matcher = self.matcher
+        if matcher is None:
+            return []
+        metrics.incr("frames")
+        if not self.motion_gate.should_process(frame):
+            metrics.incr("frames_skipped")
+            return self.motion_gate.last_result
+        with metrics.stage("color_convert"):
+            rgb_frame = to_rgb(frame)
+        faces = track_and_recognize(rgb_frame, self.tracker, matcher)
+        self.motion_gate.last_result = faces
+        self.startup_clock.mark("first_recognition")
+        return faces
+    
+    def render_frame(self, frame, faces):
+        """Draw the frame and face boxes into the reused PhotoImage"""
+        height, width = frame.shape[:2]
+        display_width, display_height = DISPLAY_SIZE
+        with metrics.stage("color_convert"):
+            cv2.resize(frame, DISPLAY_SIZE, dst=self.resize_buffer, interpolation=cv2.INTER_LINEAR)
+            cv2.cvtColor(self.resize_buffer, cv2.COLOR_BGR2RGBA, dst=self.display_buffer)
+        sx, sy = display_width / width, display_height / height
+        for (top, right, bottom, left), match in faces:
+            name = match.label if match.label is not None else "Unknown"
+            top, right, bottom, left = int(top * sy), int(right * sx), int(bottom * sy), int(left * sx)
+            cv2.rectangle(self.display_buffer, (left, top), (right, bottom), (0, 255, 0, 255), 2)
+            cv2.putText(self.display_buffer, name, (left, top - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                        (0, 255, 0, 255), 2)
+        with metrics.stage("render"):
+            # display_image shares display_buffer and matches the PhotoImage's
+            # mode, so paste() hands the pixels to Tk without an intermediate
+            # PIL copy and updates the existing Tk image in place
+            self.photo.paste(self.display_image)
+    
     def show_camera_feed(self):
-        """Update camera frame in GUI"""
-        if self.cap:
-            ret, frame = self.cap.read()
-            if ret:
-                # Convert to RGB and resize
-                frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                frame = cv2.resize(frame, (640, 480))
-                
-                # Convert to Tkinter image
-                img = Image.fromarray(frame)
-                imgtk = ImageTk.PhotoImage(image=img)
-                
-                # Update label
-                self.camera_label.imgtk = imgtk
-                self.camera_label.configure(image=imgtk)
-                
-                # Schedule next update
-                self.camera_label.after(10, self.show_camera_feed)
+        """Show the newest captured frame with the latest recognition result"""
+        if not self.pipeline:
+            return
+        if not self.pipeline.running:
+            # The camera stopped delivering frames; Start Camera reopens it
+            self.pipeline.stop()
+            self.pipeline = None
+            self.cap.release()
+            self.cap = None
+            self.status_label.config(text="Camera: OFF", foreground=Colors.TEXT_LIGHT)
+            return
+        frame = self.pipeline.latest_frame()
+        if frame is not None and frame.frame_id != self.shown_id:
+            self.shown_id = frame.frame_id
+            start = time.perf_counter()
+            result = self.pipeline.latest_result()
+            if result is not None:
+                self.current_faces = result.faces
+            self.render_frame(frame.image, self.current_faces)
+            
+            stats = self.tracker.stats()
+            gate_stats = self.motion_gate.stats()
+            self.tracking_label.config(
+                text=f"Tracks: {stats['active_tracks']} | Encodings avoided: {stats['avoided_per_min']}/min"
+                     f" | Frames skipped: {gate_stats['skipped']}/{gate_stats['processed'] + gate_stats['skipped']}")
+            
+            finished = time.perf_counter()
+            self.render_cost += RENDER_COST_SMOOTHING * (finished - start - self.render_cost)
+            self.pipeline.display_stats.record(finished - frame.captured_at)
+            self.startup_clock.mark("first_frame")
+            if result is not None and not self.startup_reported and "first_recognition" in self.startup_clock.marks:
+                self.startup_reported = True
+                self.show_startup_report()
+        
+        # Schedule next update
+        self.camera_label.after(self.refresh_delay_ms(), self.show_camera_feed)
+    
+    def refresh_delay_ms(self):
+        """Delay before the next refresh, so rendering takes at most UI_RENDER_SHARE of the Tk thread"""
+        delay = self.render_cost * (1 - UI_RENDER_SHARE) / UI_RENDER_SHARE * 1000
+        return int(min(MAX_REFRESH_MS, max(MIN_REFRESH_MS, delay)))
     
     def mark_attendance(self):
-        """Capture and process attendance"""
-        if self.cap:
-            ret, frame = self.cap.read()
-            if ret:
-                rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-                face_locations = face_recognition.face_locations(rgb_frame)
-                
-                if face_locations:
-                    # ... (Add face recognition logic)
-                    self.refresh_log()
-                    messagebox.showinfo("Success", f"Attendance marked for {name}")
+        """Capture and process attendance on a worker thread"""
+        if self.matcher is None:
+            messagebox.showinfo("Please wait", "Face recognition is still loading")
+            return
+        if not self.pipeline or self.marking:
+            return
+        # Faces are cropped from the frame they were recognized in; with no
+        # recognized face yet, the newest frame is detected from scratch
+        result = self.pipeline.latest_result()
+        if result is not None and result.faces:
+            image, faces = result.image, list(result.faces)
+        else:
+            frame = self.pipeline.latest_frame()
+            if frame is None:
+                return
+            image, faces = frame.image, []
+        self.marking = True
+        threading.Thread(target=self._mark_worker, args=(image, faces),
+                         name="mark-attendance", daemon=True).start()
+        self.root.after(MARK_POLL_MS, self._finish_mark)
+    
+    def _mark_worker(self, frame, faces):
+        try:
+            outcome = self._mark(frame, faces)
+        except Exception as e:
+            outcome = ("showerror", "Error", f"Could not mark attendance: {str(e)}", False)
+        self._mark_results.put(outcome)
+    
+    def _mark(self, frame, faces):
+        """Mark attendance for the first recognized face
+
+        Returns (messagebox function name, title, message, marked), or None
+        when there is no face in view.
+        """
+        if not faces:
+            # Recognition has not produced a result for this view yet
+            rgb_frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            face_locations, face_encodings = detect_and_encode(rgb_frame)
+            faces = list(zip(face_locations, self.matcher.match(face_encodings)))
+        if not faces:
+            return None
+        recognized = [(loc, m) for loc, m in faces if m.label is not None]
+        if not recognized:
+            return ("showwarning", "Not recognized", "No registered face found", False)
+        face_location, match = recognized[0]
+        name = match.label
+        if not self.attendance_cooldown.allow(name):
+            return ("showinfo", "Already marked", f"Attendance was already marked for {name}", False)
+        location = get_current_location()
+        if not location:
+            self.attendance_cooldown.release(name)
+            return ("showerror", "Error", "Could not determine location", False)
+        fence = get_geofence().check(location["latitude"], location["longitude"])
+        crop, _ = face_crop(frame, face_location)
+        try:
+            event = record_attendance_event(
+                name=name,
+                lat=location["latitude"],
+                lon=location["longitude"],
+                place=location["place"],
+                img_path=get_snapshot_store().submit(crop),
+                site_id=fence.site_id,
+                in_fence=fence.in_fence,
+                min_gap_s=self.attendance_cooldown.cooldown_s
+            )
+        except sqlite3.Error as e:
+            self.attendance_cooldown.release(name)
+            return ("showerror", "Error", f"Could not save attendance: {str(e)}", False)
+        if event is None:
+            return ("showinfo", "Already marked", f"Attendance was already marked for {name}", False)
+        if fence.in_fence is False:
+            return ("showwarning", "Outside site",
+                    f"Attendance marked for {name}, but outside every configured site", True)
+        return ("showinfo", "Success", f"Attendance marked for {name} ({event.replace('_', '-')})", True)
+    
+    def _finish_mark(self):
+        """Report the worker's outcome on the Tk thread"""
+        try:
+            outcome = self._mark_results.get_nowait()
+        except queue.Empty:
+            self.root.after(MARK_POLL_MS, self._finish_mark)
+            return
+        self.marking = False
+        if outcome is None:
+            return
+        dialog, title, message, marked = outcome
+        if marked:
+            self.attendance_log.poll_now()
+        getattr(messagebox, dialog)(title, message)
+    
+    def show_thumbnail(self, event=None):
+        """Show the snapshot thumbnail of the selected attendance record"""
+        selected = self.log_table.selection()
+        digest = SnapshotStore.digest_of(self.log_table.set(selected[0], "image")) if selected else None
+        imgtk = None
+        if digest:
+            try:
+                imgtk = ImageTk.PhotoImage(Image.open(get_snapshot_store().thumb_path(digest)))
+            except OSError:
+                pass  # Older records, or a snapshot still being written
+        self.thumb_label.imgtk = imgtk
+        self.thumb_label.configure(image=imgtk or "")
     
     def refresh_log(self):
-        """Reload attendance records"""
-        for item in self.log_table.get_children():
-            self.log_table.delete(item)
-            
-        records = get_all_records()
-        for record in records:
-            self.log_table.insert("", "end", values=record)
+        """Reload the most recent attendance records"""
+        self.attendance_log.reload()
     
     def on_close(self):
         """Cleanup on window close"""
+        if self.pipeline:
+            self.pipeline.stop()
         if self.cap:
             self.cap.release()
+        self.attendance_log.close()
+        get_snapshot_store().close()
+        stop_metrics(self.metrics_exporters)
         self.root.destroy()
 
 if __name__ == "__main__":
     root = tk.Tk()
     app = GeoFaceApp(root)
+    # Set GEOFACE_METRICS_JSON and/or GEOFACE_METRICS_PORT to export stage timings
+    app.metrics_exporters = start_metrics_from_env()
     root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
\ No newline at end of file